@@ -1,10 +1,16 @@
+# Redis backs only the named aliases, default stays Django's local-memory
+# cache. No PARSER_CLASS: redis-py 5 no longer has
+# redis.connection.HiredisParser and uses hiredis by itself when installed.
 CACHES = {
     'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Patient dashboard API responses, see patient_records/cache.py
+    'patient_dashboard': {
         'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': 'redis://localhost:6379/1',
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-            'PARSER_CLASS': 'redis.connection.HiredisParser',
             'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
             'CONNECTION_POOL_CLASS_KWARGS': {
                 'max_connections': 50,
@@ -21,7 +27,6 @@ CACHES = {
         'LOCATION': 'redis://localhost:6379/2',
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-            'PARSER_CLASS': 'redis.connection.HiredisParser',
             'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
             'CONNECTION_POOL_CLASS_KWARGS': {
                 'max_connections': 50,
@@ -39,6 +44,9 @@ CACHE_KEYS = {
     'patient_events': 'patient:events:{patient_id}',
     'clinical_events': 'clinical:events:{patient_id}',
     'lab_results': 'lab:results:{patient_id}:{lab_type}',
+    # Patient dashboard API responses, version is the token under patient_version
+    'patient_dashboard': 'patient:dashboard:{patient_id}:{view}:{version}:{params}',
+    'patient_version': 'patient:version:{patient_id}',
 }
 
 # Cache timeouts (in seconds)
@@ -47,6 +55,7 @@ CACHE_TIMEOUTS = {
     'patient_events': 600,    # 10 minutes
     'clinical_events': 300,   # 5 minutes
     'lab_results': 1800,     # 30 minutes
+    'patient_dashboard': 300,  # 5 minutes, entries are also retired by new events
 }
 
 # Cache version for cache invalidation
@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'patient_records.middleware.audit.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'patient_records.middleware.json_errors.JSONErrorMiddleware',
@@ -273,6 +274,29 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 # Add WhiteNoise configuration
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Event sourcing: 'inline' applies read-model projections in the request,
+# 'async' writes them to the outbox for `manage.py run_projections`
+EVENT_PROJECTION_MODE = 'inline'
+
+# Compressed segments written by `manage.py archive_events`
+EVENT_ARCHIVE_DIR = BASE_DIR / 'event_archive'
+
+IDEMPOTENCY_KEY_TTL = 86400  # Retries with the same key are deduplicated for 24 hours (in seconds)
+
+# Cache aliases (Redis only for the named ones) and the CACHE_KEYS / CACHE_TIMEOUTS schemes
+from .caching import CACHES, CACHE_KEYS, CACHE_TIMEOUTS
+
+# List pages show the query planner's row estimate instead of counting above this many rows
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Audit trail: 'sync' inserts a request's entries before the response,
+# 'background' spools them to AUDIT_SPOOL_DIR and inserts them from a worker
+# thread. `manage.py replay_audit_spool` writes entries left after a crash
+AUDIT_WRITE_MODE = 'sync'
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1.0  # Seconds an entry may wait for its batch to fill
+AUDIT_SPOOL_DIR = BASE_DIR / 'audit_spool'
+
 # Add these settings for Localtunnel
 LOCALTUNNEL = {
     'BYPASS_HEADER': True,  # This will add the bypass header in development
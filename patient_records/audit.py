@@ -0,0 +1,263 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .models import AuditTrail, Patient
+from .audit_writer import spool_entries, write_entries
+import base64
+import datetime
+import logging
+
+logger = logging.getLogger('patient_records')
+
+# Fields left out of every audit snapshot
+EXCLUDED_FIELDS = ('created_at', 'updated_at', 'patient')
+
+# Entries per page of a patient's audit history, and the most a caller may ask for
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+# Audit buffer of the current request, None outside audit_scope
+_buffer: ContextVar[Optional['AuditBuffer']] = ContextVar('audit_buffer', default=None)
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+def _number(value):
+    return float(value) if value is not None else None
+
+def _text(value):
+    return str(value) if value is not None else None
+
+def _identity(value):
+    return value
+
+
+class ModelAuditSerializer:
+    """
+    JSON-safe snapshot of a model's concrete fields
+
+    The field list and a converter per field are worked out once per model,
+    so serializing an instance is a single pass over precomputed tuples.
+    """
+
+    def __init__(self, model):
+        self.fields: List[Tuple[str, str, Callable]] = [
+            (field.name, field.attname, self._converter(field))
+            for field in model._meta.concrete_fields
+            if not field.primary_key and field.name not in EXCLUDED_FIELDS
+        ]
+
+    def serialize(self, instance) -> Dict[str, Any]:
+        return {name: convert(getattr(instance, attname)) for name, attname, convert in self.fields}
+
+    def snapshot(self, instance) -> Dict[str, Any]:
+        """
+        Raw values of the loaded fields, taken when an instance is built
+
+        Deferred fields are left out rather than read, so this never queries.
+        """
+        values = instance.__dict__
+        return {attname: values[attname] for _, attname, _ in self.fields if attname in values}
+
+    def diff(self, instance, snapshot: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Serialized previous and new values of the fields changed since snapshot"""
+        previous, new = {}, {}
+        values = instance.__dict__
+        for name, attname, convert in self.fields:
+            if attname in snapshot and attname in values and values[attname] != snapshot[attname]:
+                previous[name] = convert(snapshot[attname])
+                new[name] = convert(values[attname])
+        return previous, new
+
+    @staticmethod
+    def _converter(field) -> Callable:
+        if isinstance(field, (models.DateField, models.TimeField)):  # DateTimeField is a DateField
+            return _iso
+        if isinstance(field, models.DecimalField):
+            return _number
+        if isinstance(field, (models.UUIDField, models.ForeignKey)):
+            return _text
+        return _identity
+
+
+@lru_cache(maxsize=None)
+def serializer_for(model) -> ModelAuditSerializer:
+    return ModelAuditSerializer(model)
+
+
+class AuditBuffer:
+    """
+    Audit entries of one request, coalesced to one per entity
+
+    Repeated saves of the same record keep the first action (a CREATE stays
+    a CREATE, a DELETE always wins), the first previous value and the last
+    new value of every field.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.entries: Dict[Tuple[str, str], AuditTrail] = {}
+
+    def add(self, key: Tuple[str, str], entry: AuditTrail) -> None:
+        existing = self.entries.get(key)
+        if existing is None:
+            self.entries[key] = entry
+            return
+        if entry.action == 'DELETE':
+            existing.action = 'DELETE'
+        for name, value in entry.previous_values.items():
+            existing.previous_values.setdefault(name, value)
+        existing.new_values.update(entry.new_values)
+        existing.user = existing.user or entry.user
+
+    def flush(self) -> int:
+        entries = list(self.entries.values())
+        self.entries.clear()
+        if not entries:
+            return 0
+        for entry in entries:
+            entry.user = entry.user or self.user
+        try:
+            write_entries(entries)
+        except Exception as e:
+            # Kept for replay_spool rather than lost or failing the request
+            path = spool_entries(entries)
+            logger.error(f"Error writing audit trail, {len(entries)} entries spooled to {path}: {str(e)}",
+                         exc_info=True)
+            return 0
+        return len(entries)
+
+
+@contextmanager
+def audit_scope(user=None):
+    """
+    Collect audit entries and hand them to the audit sink in one batch on exit
+
+    Entries are only collected once the transaction that produced them has
+    committed, so rolled back saves are never audited. Entries that cannot be
+    written are spooled for replay_spool; a failure here is logged and never
+    raised, so it cannot fail a committed request or mask its exception.
+    """
+    buffer = AuditBuffer(user)
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+        try:
+            buffer.flush()
+        except Exception as e:
+            logger.error(f"Error writing audit trail: {str(e)}", exc_info=True)
+
+
+def record_audit(instance, action: str, record_type: Optional[str] = None, user=None,
+                 previous_values: Optional[Dict[str, Any]] = None,
+                 new_values: Optional[Dict[str, Any]] = None) -> Optional[AuditTrail]:
+    """
+    Audit a change to a model instance
+
+    new_values defaults to the model's serialized fields. For an UPDATE of
+    an instance with a load-time snapshot (see take_snapshot) both values
+    default to just the fields that changed, and an update that changed
+    nothing is not audited. Inside an audit_scope the entry is buffered and
+    coalesced, otherwise it is handed to the audit sink straight away and
+    returned.
+    """
+    if new_values is None and action != 'DELETE':
+        serializer = serializer_for(type(instance))
+        snapshot = getattr(instance, '_audit_snapshot', None)
+        if action == 'UPDATE' and snapshot is not None and previous_values is None:
+            previous_values, new_values = serializer.diff(instance, snapshot)
+            if not new_values:
+                return None
+        else:
+            new_values = serializer.serialize(instance)
+        # The next save of this instance is diffed against what was just saved
+        take_snapshot(instance)
+
+    patient_id, identifier = _patient_of(instance)
+    entry = AuditTrail(
+        patient_id=patient_id,
+        patient_identifier=identifier,
+        action=action,
+        record_type=record_type or instance.__class__.__name__.upper(),
+        user=user or getattr(instance, 'modified_by', None),
+        previous_values=previous_values or {},
+        new_values=new_values or {}
+    )
+
+    buffer = _buffer.get()
+    if buffer is None:
+        write_entries([entry])
+        return entry
+
+    key = (entry.record_type, str(instance.pk))
+    transaction.on_commit(lambda: buffer.add(key, entry))
+    return None
+
+
+def take_snapshot(instance) -> None:
+    """Remember the field values of an instance so its next save can be diffed"""
+    instance._audit_snapshot = serializer_for(type(instance)).snapshot(instance)
+
+
+def _patient_of(instance) -> Tuple[Any, str]:
+    """
+    Patient id and display identifier for an audited instance
+
+    The identifier is only built from a patient that is already loaded, the
+    audit never queries for it.
+    """
+    if isinstance(instance, Patient):
+        patient = instance
+    elif hasattr(instance, 'patient_id'):
+        field = instance._meta.get_field('patient')
+        if not field.is_cached(instance):
+            return instance.patient_id, "Unknown Patient"
+        patient = instance.patient
+    elif hasattr(instance, 'provider'):
+        return None, f"Provider: {instance.provider}"
+    else:
+        return None, "N/A"
+
+    if patient is None:
+        return None, "Unknown Patient"
+    return patient.pk, f"{patient.patient_number} - {patient.first_name} {patient.last_name}"
+
+
+def encode_history_cursor(entry: AuditTrail) -> str:
+    """Opaque cursor pointing just past entry in (timestamp, id) order"""
+    raw = f"{entry.timestamp.isoformat()}|{entry.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """Raises ValueError for a cursor encode_history_cursor did not produce"""
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        parsed = parse_datetime(timestamp)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid history cursor: {cursor}") from e
+    if parsed is None:
+        raise ValueError(f"Invalid history cursor: {cursor}")
+    return parsed, int(pk)
+
+
+def iter_audit_history(patient_id, after: Optional[Tuple[datetime.datetime, int]] = None,
+                       limit: int = HISTORY_PAGE_SIZE) -> Iterator[AuditTrail]:
+    """
+    Yield up to limit audit entries of a patient, newest first
+
+    after is a decoded cursor. Pages are keyed on (timestamp, id), which
+    audit_patient_history_idx serves directly, so deep pages cost the same
+    as the first one and nothing is counted.
+    """
+    query = AuditTrail.objects.filter(patient_id=patient_id).select_related('user')
+    if after is not None:
+        timestamp, pk = after
+        query = query.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    return query.order_by('-timestamp', '-id')[:limit].iterator()
@@ -0,0 +1,85 @@
+from typing import List, Optional
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import AuditTrail
+import datetime
+import logging
+
+logger = logging.getLogger('patient_records')
+
+TABLE = AuditTrail._meta.db_table
+# Catches rows whose month has no partition yet
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(value) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: datetime.date) -> str:
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned(using: str = 'default') -> bool:
+    """Whether AuditTrail is a partitioned table, which is only ever the case on PostgreSQL"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def ensure_audit_partitions(months_ahead: int = 3, start: Optional[datetime.date] = None,
+                            using: str = 'default') -> List[str]:
+    """
+    Create the monthly AuditTrail partitions from start through months_ahead
+
+    start defaults to the current month. Rows that already landed in the
+    default partition for a month being created are moved into it. Returns
+    the names of the partitions created.
+    """
+    if not is_partitioned(using):
+        return []
+
+    first = month_start(start or timezone.now())
+    created = []
+    with connections[using].cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = add_months(first, offset)
+            name = partition_name(month)
+            cursor.execute("SELECT to_regclass(%s)", [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            with transaction.atomic(using=using):
+                _create_partition(cursor, name, month)
+            created.append(name)
+    if created:
+        logger.info(f"Created audit partitions: {', '.join(created)}")
+    return created
+
+
+def _create_partition(cursor, name: str, month: datetime.date) -> None:
+    lower = f"{month.isoformat()} 00:00:00+00"
+    upper = f"{add_months(month, 1).isoformat()} 00:00:00+00"
+    cursor.execute(
+        f'SELECT 1 FROM {DEFAULT_PARTITION} WHERE "timestamp" >= %s AND "timestamp" < %s LIMIT 1',
+        [lower, upper]
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+        return
+
+    # A new range may not overlap rows in the default partition, so those
+    # rows are moved while it is detached
+    cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    cursor.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+        f'INSERT INTO {TABLE} SELECT * FROM moved',
+        [lower, upper]
+    )
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
@@ -0,0 +1,196 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+from django.conf import settings
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from .models import AuditTrail
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger('patient_records')
+
+# Queue marker that tells the worker to write what it holds and exit
+_STOP = object()
+
+_writer: Optional['AuditWriter'] = None
+_writer_lock = threading.Lock()
+
+# AuditTrail attributes kept in a spool file, in column order
+SPOOLED_FIELDS = (
+    'entry_id', 'patient_id', 'patient_identifier', 'action', 'record_type',
+    'user_id', 'timestamp', 'previous_values', 'new_values'
+)
+
+
+def _to_record(entry: AuditTrail) -> Dict[str, Any]:
+    record = {name: getattr(entry, name) for name in SPOOLED_FIELDS}
+    record['entry_id'] = str(entry.entry_id)
+    record['timestamp'] = entry.timestamp.isoformat()
+    return record
+
+def _from_record(record: Dict[str, Any]) -> AuditTrail:
+    record['entry_id'] = uuid.UUID(record['entry_id'])
+    record['timestamp'] = parse_datetime(record['timestamp'])
+    return AuditTrail(**record)
+
+
+def _spool_dir() -> Path:
+    return Path(getattr(settings, 'AUDIT_SPOOL_DIR', settings.BASE_DIR / 'audit_spool'))
+
+
+def _insert(entries: List[AuditTrail]) -> None:
+    # entry_id is unique, so entries that already made it in are skipped
+    AuditTrail.objects.bulk_create(entries, batch_size=getattr(settings, 'AUDIT_BATCH_SIZE', 500),
+                                   ignore_conflicts=True)
+
+
+def spool_entries(entries: Iterable[AuditTrail], spool_dir=None) -> Path:
+    """Write audit entries to a new spool file for replay_spool to insert"""
+    spool_dir = Path(spool_dir or _spool_dir())
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    path = spool_dir / f'{time.time_ns()}-{uuid.uuid4().hex}.jsonl'
+    partial = path.with_suffix('.tmp')
+    with open(partial, 'w') as spool:
+        for entry in entries:
+            spool.write(json.dumps(_to_record(entry)) + '\n')
+        spool.flush()
+        os.fsync(spool.fileno())
+    os.replace(partial, path)  # Replay never sees a half written file
+    return path
+
+
+def replay_spool(spool_dir=None) -> int:
+    """
+    Insert audit entries left in the spool by a writer that did not finish
+
+    Replaying is idempotent, so it is safe while other writers are running.
+    """
+    spool_dir = Path(spool_dir or _spool_dir())
+    if not spool_dir.exists():
+        return 0
+
+    replayed = 0
+    for path in sorted(spool_dir.glob('*.jsonl')):
+        try:
+            with open(path) as spool:
+                entries = [_from_record(json.loads(line)) for line in spool if line.strip()]
+        except FileNotFoundError:
+            continue  # Written by its own writer in the meantime
+        _insert(entries)
+        path.unlink(missing_ok=True)
+        replayed += len(entries)
+    return replayed
+
+
+class AuditWriter:
+    """
+    Writes audit entries from a background thread
+
+    Each submitted batch is first spooled to its own file, then queued. The
+    worker inserts queued entries with bulk_create once AUDIT_BATCH_SIZE of
+    them are waiting or AUDIT_FLUSH_INTERVAL seconds have passed, and only
+    then deletes their spool files. Anything still spooled after a crash is
+    picked up by replay_spool.
+    """
+
+    def __init__(self, spool_dir, batch_size: int, flush_interval: float):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        try:
+            replay_spool(self.spool_dir)
+        except Exception as e:
+            logger.error(f"Error replaying audit spool: {str(e)}", exc_info=True)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, entries: List[AuditTrail]) -> None:
+        self.queue.put((self.spool(entries), entries))
+
+    def spool(self, entries: Iterable[AuditTrail]) -> Path:
+        return spool_entries(entries, self.spool_dir)
+
+    def write(self, batches: List[Tuple[Path, List[AuditTrail]]]) -> int:
+        """Insert queued batches and drop their spool files, keeping them on failure"""
+        entries = [entry for _, batch in batches for entry in batch]
+        if not entries:
+            return 0
+        try:
+            _insert(entries)
+        except Exception as e:
+            logger.error(f"Error writing audit trail, {len(entries)} entries left in the spool: {str(e)}",
+                         exc_info=True)
+            return 0
+        for path, _ in batches:
+            path.unlink(missing_ok=True)
+        return len(entries)
+
+    def _run(self) -> None:
+        pending: List[Tuple[Path, List[AuditTrail]]] = []
+        pending_count = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self.write(pending)
+                connection.close()
+                return
+            if item is not None:
+                pending.append(item)
+                pending_count += len(item[1])
+                deadline = deadline or time.monotonic() + self.flush_interval
+
+            if pending and (pending_count >= self.batch_size or time.monotonic() >= deadline):
+                self.write(pending)
+                connection.close()
+                pending, pending_count, deadline = [], 0, None
+
+
+def get_writer() -> AuditWriter:
+    """Background writer of this process, started on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditWriter(_spool_dir(), getattr(settings, 'AUDIT_BATCH_SIZE', 500),
+                                  getattr(settings, 'AUDIT_FLUSH_INTERVAL', 1.0))
+            _writer.start()
+        return _writer
+
+
+def write_entries(entries: List[AuditTrail]) -> None:
+    """
+    Hand audit entries to the configured sink
+
+    With AUDIT_WRITE_MODE = 'background' they are spooled and written by the
+    background writer, otherwise they are inserted before this returns.
+    """
+    if not entries:
+        return
+    if getattr(settings, 'AUDIT_WRITE_MODE', 'sync') == 'background':
+        get_writer().submit(entries)
+    else:
+        AuditTrail.objects.bulk_create(entries)
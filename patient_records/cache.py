@@ -0,0 +1,107 @@
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import urlencode
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger('patient_records')
+
+
+def _cache():
+    return caches['patient_dashboard']
+
+
+def _key(name: str, **parts) -> str:
+    return settings.CACHE_KEYS[name].format(**parts)
+
+
+def _seed_version() -> int:
+    # Microseconds since the epoch, above any value a counter that was
+    # evicted earlier could have been incremented to
+    return time.time_ns() // 1000
+
+
+def patient_cache_version(patient_id) -> str:
+    """
+    Version token a patient's cached responses are keyed under
+
+    It is a counter kept in the cache without a timeout and incremented by
+    every write to the patient. A missing counter, never set or evicted,
+    is seeded from the clock, so a token in use before is never handed out
+    again.
+    """
+    key = _key('patient_version', patient_id=patient_id)
+    version = _cache().get(key)
+    if version is None:
+        version = _seed_version()
+        # add, so a counter seeded or retired in the meantime is kept
+        if not _cache().add(key, version, timeout=None):
+            version = _cache().get(key, version)
+    return str(version)
+
+
+def retire_patient_cache(patient_id) -> None:
+    """
+    Move a patient's cached responses to a new version once the transaction commits
+
+    Entries under the old version are never read again and expire on their
+    timeout.
+    """
+    key = _key('patient_version', patient_id=patient_id)
+
+    def retire():
+        try:
+            _cache().incr(key)
+        except ValueError:
+            pass  # No counter, the next read seeds one above every earlier version
+        except Exception as e:
+            logger.error(f"Error retiring cache for patient {patient_id}: {str(e)}")
+
+    transaction.on_commit(retire)
+
+
+def patient_response_key(view_name: str, patient_id, params) -> str:
+    query = urlencode(sorted(params.items()))
+    return _key(
+        'patient_dashboard',
+        patient_id=patient_id,
+        view=view_name,
+        version=patient_cache_version(patient_id),
+        params=hashlib.sha1(query.encode()).hexdigest()[:16] if query else '-'
+    )
+
+
+def cache_patient_response(view_name: str):
+    """
+    Cache a patient API view's successful JSON responses
+
+    Responses are keyed by view, patient, the patient's cache version and
+    the query string, and kept for CACHE_TIMEOUTS['patient_dashboard']
+    seconds. When the cache is unreachable the view just runs uncached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, patient_id, *args, **kwargs):
+            try:
+                key = patient_response_key(view_name, patient_id, request.GET)
+                content = _cache().get(key)
+            except Exception as e:
+                logger.warning(f"Patient response cache unavailable: {str(e)}")
+                return view(request, patient_id, *args, **kwargs)
+
+            if content is not None:
+                return HttpResponse(content, content_type='application/json')
+
+            response = view(request, patient_id, *args, **kwargs)
+            if response.status_code == 200:
+                try:
+                    _cache().set(key, response.content.decode(), settings.CACHE_TIMEOUTS['patient_dashboard'])
+                except Exception as e:
+                    logger.warning(f"Could not cache {view_name} for patient {patient_id}: {str(e)}")
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,73 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+from django.db.models import Q
+from .models import Patient, Vitals, Diagnosis, Medications, AuditTrail, PatientNote
+import datetime
+
+# Activities shown on the patient chart
+RECENT_ACTIVITY_LIMIT = 5
+
+# Diagnoses and medications shown on the patient overview
+OVERVIEW_LIMIT = 5
+
+# Queries load_patient_chart runs at most: the patient, latest vitals,
+# diagnoses, current medications, recent activities, notes and the note
+# tags and attachments prefetches
+QUERY_BUDGET = 8
+
+
+@dataclass
+class PatientChart:
+    """Everything the patient detail page renders, already evaluated"""
+    patient: Patient
+    latest_vitals: Optional[Vitals] = None
+    active_diagnoses: List[Diagnosis] = field(default_factory=list)
+    current_medications: List[Medications] = field(default_factory=list)
+    recent_activities: List[AuditTrail] = field(default_factory=list)
+    notes: List[PatientNote] = field(default_factory=list)
+
+    def as_context(self) -> dict:
+        return {
+            'patient': self.patient,
+            'latest_vitals': self.latest_vitals,
+            'active_diagnoses': self.active_diagnoses,
+            'current_medications': self.current_medications,
+            'recent_activities': self.recent_activities,
+            'notes': self.notes,
+        }
+
+
+def load_patient_chart(patient_id) -> PatientChart:
+    """
+    Load a patient's chart in at most QUERY_BUDGET queries
+
+    Each queryset is evaluated exactly once into a list, so templates can
+    test, count and slice the results without querying again. Notes come
+    with their author, tags and attachments. Diagnoses and medications
+    are limited to the OVERVIEW_LIMIT most recent. Raises
+    Patient.DoesNotExist for an unknown patient.
+    """
+    patient = Patient.objects.get(id=patient_id)
+    today = datetime.date.today()
+
+    return PatientChart(
+        patient=patient,
+        latest_vitals=Vitals.objects.filter(patient=patient).order_by('-date').first(),
+        active_diagnoses=list(Diagnosis.objects.filter(patient=patient).order_by('-date')[:OVERVIEW_LIMIT]),
+        current_medications=list(
+            Medications.objects.filter(patient=patient)
+            .filter(Q(dc_date__isnull=True) | Q(dc_date__gt=today))
+            .order_by('-date_prescribed')[:OVERVIEW_LIMIT]
+        ),
+        recent_activities=list(
+            AuditTrail.objects.filter(patient=patient)
+            .select_related('user')
+            .order_by('-timestamp', '-id')[:RECENT_ACTIVITY_LIMIT]
+        ),
+        notes=list(
+            PatientNote.objects.filter(patient=patient)
+            .select_related('created_by')
+            .prefetch_related('tags', 'attachments')
+            .order_by('-is_pinned', '-created_at')
+        ),
+    )
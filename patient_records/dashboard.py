@@ -0,0 +1,69 @@
+from typing import Any, Dict, Iterator, List
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from .models import Visits, Medications, CmpLabs, RecordRequestLog, Vitals
+
+# Readings above any of these limits raise a high severity alert
+SYSTOLIC_ALERT = 180
+DIASTOLIC_ALERT = 110
+TEMPERATURE_ALERT = 38.3  # >101°F
+
+ALERT_FILTER = Q(systolic__gt=SYSTOLIC_ALERT) | Q(diastolic__gt=DIASTOLIC_ALERT) | Q(temperature__gt=TEMPERATURE_ALERT)
+
+
+def _vitals(start_date, end_date):
+    return Vitals.objects.filter(date__range=[start_date, end_date])
+
+
+def dashboard_metrics(start_date, end_date) -> Dict[str, int]:
+    """
+    Practice-wide dashboard counts for a date range, in a single query
+
+    Each count is compiled from its queryset and selected as a scalar
+    subquery of one SELECT. RecordRequestLog has no status, so every
+    request logged in the range counts as pending.
+    """
+    counts = {
+        'total_visits': Visits.objects.filter(date__range=[start_date, end_date]),
+        'active_medications': Medications.objects.filter(
+            Q(dc_date__isnull=True) | Q(dc_date__gt=timezone.localdate())
+        ),
+        'recent_labs': CmpLabs.objects.filter(date__range=[start_date, end_date]),
+        'pending_tasks': RecordRequestLog.objects.filter(date__range=[start_date, end_date]),
+    }
+
+    columns, params = [], []
+    for queryset in counts.values():
+        sql, count_params = queryset.order_by().values('pk').query.sql_with_params()
+        columns.append(f"(SELECT COUNT(*) FROM ({sql}) AS counted)")
+        params.extend(count_params)
+
+    with connections[Visits.objects.db].cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)}", params)
+        return dict(zip(counts, cursor.fetchone()))
+
+
+def vitals_series(start_date, end_date) -> Dict[str, List[Any]]:
+    """Vitals chart series for a date range, oldest first, streamed without building models"""
+    series = {'dates': [], 'systolic': [], 'diastolic': [], 'heartRate': []}
+    rows = _vitals(start_date, end_date).order_by('date').values_list('date', 'systolic', 'diastolic', 'pulse')
+    for date, systolic, diastolic, pulse in rows.iterator(chunk_size=2000):
+        series['dates'].append(date.isoformat())
+        series['systolic'].append(systolic)
+        series['diastolic'].append(diastolic)
+        series['heartRate'].append(pulse)
+    return series
+
+
+def vitals_alerts(start_date, end_date) -> Iterator[Dict[str, str]]:
+    """Alerts for readings past the alert limits, only those rows are fetched"""
+    rows = (
+        _vitals(start_date, end_date).filter(ALERT_FILTER)
+        .order_by('-date').values_list('date', 'blood_pressure', 'systolic', 'diastolic', 'temperature')
+    )
+    for date, blood_pressure, systolic, diastolic, temperature in rows.iterator():
+        if (systolic or 0) > SYSTOLIC_ALERT or (diastolic or 0) > DIASTOLIC_ALERT:
+            yield {'severity': 'high', 'message': f'High blood pressure reading: {blood_pressure} on {date}'}
+        else:
+            yield {'severity': 'high', 'message': f'High temperature: {temperature}°C on {date}'}
@@ -0,0 +1,188 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from itertools import groupby
+from pathlib import Path
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from .models import EventStore
+import gzip
+import json
+import os
+import threading
+import uuid
+import logging
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, segments fall back to gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.index.json'
+
+# Parsed segment indexes of each archive directory with the directory mtime
+# they were read at, shared by every EventArchive in the process
+_indexes: Dict[Path, Tuple[float, List[Tuple[Path, Dict[str, Any]]]]] = {}
+_indexes_lock = threading.Lock()
+
+
+class EventArchive:
+    """
+    Append-only, compressed monthly segments of archived events
+
+    Each segment is an NDJSON file in which every aggregate's events form
+    one independently compressed frame (zstd when available, gzip
+    otherwise). A small index file next to it maps each aggregate to the
+    frame's offset, length and version range, so replaying one aggregate
+    only decompresses its own frames.
+    """
+
+    def __init__(self, directory=None):
+        directory = directory or getattr(settings, 'EVENT_ARCHIVE_DIR', None)
+        self.directory = Path(directory) if directory else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None and self.directory.is_dir()
+
+    def write_segment(self, month: str, events: Iterable[EventStore]) -> Tuple[Optional[Path], List[uuid.UUID]]:
+        """
+        Write events, ordered by (aggregate_id, version), to a new segment
+
+        Returns the segment path and the ids written, or (None, []) if there
+        was nothing to archive.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        codec = 'zst' if zstandard else 'gz'
+        part = 1
+        while self._segment_path(month, part, codec).exists() or self._segment_path(month, part, self._other(codec)).exists():
+            part += 1
+        path = self._segment_path(month, part, codec)
+
+        index = {'codec': codec, 'aggregates': {}}
+        written = []
+        with open(path, 'wb') as segment:
+            for aggregate_id, group in groupby(events, key=lambda event: str(event.aggregate_id)):
+                group = list(group)
+                payload = ''.join(json.dumps(self._event_to_row(event)) + '\n' for event in group)
+                frame = self._compress(payload.encode('utf-8'), codec)
+                index['aggregates'].setdefault(aggregate_id, []).append(
+                    [segment.tell(), len(frame), group[0].version, group[-1].version]
+                )
+                segment.write(frame)
+                written.extend(event.id for event in group)
+            segment.flush()
+            os.fsync(segment.fileno())
+
+        if not written:
+            path.unlink()
+            return None, []
+
+        index_path = Path(f"{path}{INDEX_SUFFIX}")
+        tmp_path = index_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(index))
+        os.replace(tmp_path, index_path)
+        # The directory mtime may not have moved within its resolution
+        with _indexes_lock:
+            _indexes.pop(self.directory, None)
+        return path, written
+
+    def read_events(self, aggregate_id: str, after_version: int = 0,
+                    up_to_version: Optional[int] = None) -> Iterator[EventStore]:
+        """
+        Yield an aggregate's archived events in version order
+        """
+        if not self.enabled:
+            return
+
+        frames = []
+        for path, index in self._load_indexes():
+            for offset, length, min_version, max_version in index['aggregates'].get(str(aggregate_id), []):
+                if max_version > after_version and (up_to_version is None or min_version <= up_to_version):
+                    frames.append((min_version, path, index['codec'], offset, length))
+
+        last_version = after_version
+        for _, path, codec, offset, length in sorted(frames):
+            with open(path, 'rb') as segment:
+                segment.seek(offset)
+                payload = self._decompress(segment.read(length), codec)
+            for line in payload.decode('utf-8').splitlines():
+                event = self._row_to_event(json.loads(line))
+                # Segments written twice after an interrupted archive run overlap
+                if event.version <= last_version:
+                    continue
+                if up_to_version is not None and event.version > up_to_version:
+                    return
+                last_version = event.version
+                yield event
+
+    def _load_indexes(self) -> List[Tuple[Path, Dict[str, Any]]]:
+        """
+        Segment indexes of the directory, parsed once per process and
+        re-read only when the directory's mtime changes
+        """
+        mtime = self.directory.stat().st_mtime
+        cached = _indexes.get(self.directory)
+        if cached is None or cached[0] != mtime:
+            with _indexes_lock:
+                cached = _indexes.get(self.directory)
+                if cached is None or cached[0] != mtime:
+                    cached = (mtime, self._read_indexes())
+                    _indexes[self.directory] = cached
+        return cached[1]
+
+    def _read_indexes(self) -> List[Tuple[Path, Dict[str, Any]]]:
+        indexes = []
+        for index_path in sorted(self.directory.glob(f'*{INDEX_SUFFIX}')):
+            segment_path = Path(str(index_path)[:-len(INDEX_SUFFIX)])
+            indexes.append((segment_path, json.loads(index_path.read_text())))
+        return indexes
+
+    def _segment_path(self, month: str, part: int, codec: str) -> Path:
+        return self.directory / f'events-{month}-{part:03d}.ndjson.{codec}'
+
+    @staticmethod
+    def _other(codec: str) -> str:
+        return 'gz' if codec == 'zst' else 'zst'
+
+    @staticmethod
+    def _compress(data: bytes, codec: str) -> bytes:
+        if codec == 'zst':
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data)
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == 'zst':
+            if zstandard is None:
+                raise RuntimeError('Reading zstd event segments requires the zstandard package')
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    @staticmethod
+    def _event_to_row(event: EventStore) -> Dict[str, Any]:
+        return {
+            'id': str(event.id),
+            'aggregate_id': str(event.aggregate_id),
+            'aggregate_type': event.aggregate_type,
+            'event_type': event.event_type,
+            'event_data': event.event_data,
+            'metadata': event.metadata,
+            'version': event.version,
+            'position': event.position,
+            'timestamp': event.timestamp.isoformat()
+        }
+
+    @staticmethod
+    def _row_to_event(row: Dict[str, Any]) -> EventStore:
+        return EventStore(
+            id=uuid.UUID(row['id']),
+            aggregate_id=uuid.UUID(row['aggregate_id']),
+            aggregate_type=row['aggregate_type'],
+            event_type=row['event_type'],
+            event_data=row['event_data'],
+            metadata=row['metadata'],
+            version=row['version'],
+            position=row['position'],
+            timestamp=parse_datetime(row['timestamp'])
+        )
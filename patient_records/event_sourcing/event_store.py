@@ -1,20 +1,18 @@
-from typing import Dict, Any, List, Optional
-from django.db import transaction
-from django.utils import timezone
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from ..models import EventStore
-from .handlers import PatientEventHandler, ClinicalEventHandler, LabResultEventHandler
+from .services import EventStoreService as BaseEventStoreService
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
-class EventStoreService:
-    def __init__(self):
-        self.handlers = {
-            'PATIENT': PatientEventHandler(),
-            'CLINICAL': ClinicalEventHandler(),
-            'LAB': LabResultEventHandler()
-        }
+class EventStoreService(BaseEventStoreService):
+    """
+    Event store service with replay and snapshot support
+
+    Appends go through the versioned path in services.EventStoreService so
+    both entry points share the same optimistic concurrency handling.
+    """
 
     @staticmethod
     def _get_uuid_from_id(id_value: str) -> uuid.UUID:
@@ -24,77 +22,41 @@ class EventStoreService:
         # Use version 5 UUID with DNS namespace and the ID as the name
         return uuid.uuid5(uuid.NAMESPACE_DNS, f"patient-{id_value}")
 
-    @transaction.atomic
-    def append_event(self, aggregate_id: str, aggregate_type: str, event_type: str, event_data: dict) -> None:
+    def replay_events(self, aggregate_id: str, up_to_version: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Append a new event to the event store
+        Replay events for a specific aggregate
+
+        Materializes the whole history, prefer iter_replay for large aggregates.
         """
-        try:
-            # Validate UUID format
-            uuid_obj = uuid.UUID(aggregate_id)
-            
-            # Create and save the event
-            event = EventStore.objects.create(
-                aggregate_id=str(uuid_obj),
-                aggregate_type=aggregate_type,
-                event_type=event_type,
-                event_data=event_data,
-                timestamp=timezone.now()
-            )
-            
-            # Dispatch event to handlers
-            self._dispatch_event(event)
-            
-        except ValueError as e:
-            logger.error(f"Invalid UUID format for aggregate_id: {aggregate_id}")
-            raise
-        except Exception as e:
-            logger.error(f"Error appending event: {str(e)}")
-            raise
+        return list(self.iter_replay(aggregate_id, up_to_version=up_to_version))
 
-    def replay_events(self, aggregate_id: str, up_to_version: Optional[int] = None) -> List[Dict[str, Any]]:
+    def iter_replay(self, aggregate_id: str, up_to_version: Optional[int] = None,
+                    chunk_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
         """
-        Replay events for a specific aggregate
+        Lazily replay events for a specific aggregate in version order
         """
-        query = EventStore.objects.filter(aggregate_id=aggregate_id)
-        if up_to_version is not None:
-            query = query.filter(version__lte=up_to_version)
-        
-        events = query.order_by('version')
-        return [self._event_to_dict(event) for event in events]
+        for event in self.stream_events(aggregate_id, up_to_version=up_to_version, chunk_size=chunk_size):
+            yield self._event_to_dict(event)
 
-    def get_snapshot(self, aggregate_id: str) -> Optional[Dict[str, Any]]:
+    def iter_replay_all(self, after: Optional[Tuple[str, int]] = None, aggregate_type: Optional[str] = None,
+                        chunk_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
         """
-        Get the latest snapshot for an aggregate if available
+        Lazily replay the whole store, one aggregate after another
         """
-        latest_event = (EventStore.objects
-                       .filter(aggregate_id=aggregate_id)
-                       .order_by('-version')
-                       .first())
-        
-        if not latest_event:
-            return None
+        for event in self.stream_all_events(after=after, aggregate_type=aggregate_type, chunk_size=chunk_size):
+            yield self._event_to_dict(event)
 
-        # Replay all events to build current state
-        events = self.replay_events(aggregate_id)
-        if not events:
-            return None
+    def get_snapshot(self, aggregate_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the current state of an aggregate
 
-        # Build aggregate state
-        aggregate_type = latest_event.aggregate_type
-        handler = self.handlers.get(aggregate_type)
-        if not handler:
+        Starts from the stored snapshot when there is one and folds only the
+        events recorded after it, without re-running the handlers.
+        """
+        state, version = self.load_state(aggregate_id)
+        if not version:
             return None
-
-        current_state = {}
-        for event in events:
-            event_type = event['event_type']
-            event_data = event['event_data']
-            metadata = event['metadata']
-            handler.handle(event_type, event_data, metadata)
-            current_state.update(event_data)
-
-        return current_state
+        return state
 
     @staticmethod
     def _event_to_dict(event: EventStore) -> Dict[str, Any]:
@@ -0,0 +1,27 @@
+"""Exceptions for event sourcing system"""
+
+
+class EventStoreError(Exception):
+    """Base class for event store errors"""
+
+
+class ConcurrencyError(EventStoreError):
+    """
+    Raised when an append loses the race for an aggregate version
+    """
+    def __init__(self, aggregate_id, expected_version=None, actual_version=None, message=None):
+        self.aggregate_id = aggregate_id
+        self.expected_version = expected_version
+        self.actual_version = actual_version
+        if message is None:
+            message = (
+                f"Concurrent append to aggregate {aggregate_id}: "
+                f"expected version {expected_version}, found {actual_version}"
+            )
+        super().__init__(message)
+
+
+class WrongExpectedVersionError(ConcurrencyError):
+    """
+    Raised when the caller's expected_version does not match the stored version
+    """
@@ -1,14 +1,81 @@
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
 from typing import Dict, Any, List
 from django.db import transaction
 from .models import EventStore
 from .constants import *
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
-class EventHandler(ABC):
+class ReadModelWriter:
+    """
+    Where handlers write read-model rows: straight to the database, one
+    statement per row, as the live projection does
+    """
+
+    def atomic(self):
+        return transaction.atomic()
+
+    def add(self, row):
+        row.save(force_insert=True)
+        return row
+
+    def get(self, model, pk):
+        return model.objects.select_for_update().get(id=pk)
+
+    def save(self, row):
+        row.save()
+        return row
+
+    def upsert_patient(self, patient_id, current_data: dict, last_updated):
+        from ..models import PatientReadModel  # Import here to avoid circular import
+        PatientReadModel.upsert(patient_id, current_data, last_updated)
+
+class BufferedReadModelWriter(ReadModelWriter):
+    """
+    Keeps the rows handlers write in memory, so a rebuild can replay a
+    chunk of events without a round trip per event and write the final
+    rows with bulk statements
+    """
+
     def __init__(self):
+        self.rows: Dict[Any, Dict[str, Any]] = {}
+
+    def atomic(self):
+        return nullcontext()
+
+    def add(self, row):
+        self.rows.setdefault(type(row), {})[str(row.pk)] = row
+        return row
+
+    def get(self, model, pk):
+        try:
+            return self.rows[model][str(pk)]
+        except KeyError:
+            raise model.DoesNotExist(f"{model.__name__} {pk} not found")
+
+    def save(self, row):
+        return row
+
+    def upsert_patient(self, patient_id, current_data: dict, last_updated):
+        from ..models import PatientReadModel  # Import here to avoid circular import
+        # Same result as PatientReadModel.upsert
+        patient = self.rows.get(PatientReadModel, {}).get(str(patient_id))
+        if patient is None:
+            self.add(PatientReadModel(id=patient_id, current_data=current_data, version=1, last_updated=last_updated))
+        else:
+            patient.current_data = current_data
+            patient.version += 1
+            patient.last_updated = last_updated
+
+    def written(self, model) -> List:
+        return list(self.rows.get(model, {}).values())
+
+class EventHandler(ABC):
+    def __init__(self, writer: ReadModelWriter = None):
+        self.writer = writer or ReadModelWriter()
         self.handlers = {}
         self.register_handlers()
 
@@ -19,49 +86,59 @@ class EventHandler(ABC):
     def handle(self, event_type: str, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         if event_type not in self.handlers:
             raise ValueError(f"No handler registered for event type: {event_type}")
-        
+
         handler = self.handlers[event_type]
-        return handler(event_data, metadata)
+        with self.writer.atomic():
+            return handler(event_data, metadata)
+
+    def handle_event(self, event: EventStore):
+        """
+        Apply a stored event, passing its aggregate and event ids to the
+        handler along with the stored metadata
+        """
+        metadata = dict(event.metadata or {}, aggregate_id=str(event.aggregate_id), event_id=str(event.id))
+        return self.handle(event.event_type, event.event_data, metadata)
 
 class PatientEventHandler(EventHandler):
     def register_handlers(self):
         self.handlers = {
             PATIENT_REGISTERED: self._handle_patient_registered,
             PATIENT_UPDATED: self._handle_patient_updated,
-            PATIENT_ARCHIVED: self._handle_patient_archived
+            PATIENT_ARCHIVED: self._handle_patient_archived,
+            # Appended by Patient.save, which writes the read model itself;
+            # used when the read models are rebuilt from the event store
+            'patient_created': self._handle_patient_saved,
+            'patient_updated': self._handle_patient_saved
         }
 
-    @transaction.atomic
     def _handle_patient_registered(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import PatientReadModel  # Import here to avoid circular import
         # Create new patient read model
-        patient = PatientReadModel.objects.create(
+        return self.writer.add(PatientReadModel(
             id=event_data['id'],
-            current_data=event_data,
+            current_data=dict(event_data),
             version=1,
             last_updated=metadata.get('timestamp') if metadata else None
-        )
-        return patient
+        ))
 
-    @transaction.atomic
     def _handle_patient_updated(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import PatientReadModel  # Import here to avoid circular import
-        patient = PatientReadModel.objects.select_for_update().get(id=event_data['id'])
+        patient = self.writer.get(PatientReadModel, event_data['id'])
         patient.current_data.update(event_data['updates'])
         patient.version += 1
         patient.last_updated = metadata.get('timestamp') if metadata else None
-        patient.save()
-        return patient
+        return self.writer.save(patient)
 
-    @transaction.atomic
     def _handle_patient_archived(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import PatientReadModel  # Import here to avoid circular import
-        patient = PatientReadModel.objects.select_for_update().get(id=event_data['id'])
+        patient = self.writer.get(PatientReadModel, event_data['id'])
         patient.current_data['status'] = 'archived'
         patient.version += 1
         patient.last_updated = metadata.get('timestamp') if metadata else None
-        patient.save()
-        return patient
+        return self.writer.save(patient)
+
+    def _handle_patient_saved(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
+        self.writer.upsert_patient(metadata['aggregate_id'], event_data['patient_data'], metadata.get('timestamp'))
 
 class ClinicalEventHandler(EventHandler):
     def register_handlers(self):
@@ -74,49 +151,36 @@ class ClinicalEventHandler(EventHandler):
             MEDICATION_DISCONTINUED: self._handle_medication_discontinued
         }
 
-    @transaction.atomic
     def _handle_vitals_recorded(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import ClinicalReadModel  # Import here to avoid circular import
         try:
-            return ClinicalReadModel.objects.create(
+            return self.writer.add(ClinicalReadModel(
                 patient_id=event_data['patient_id'],
                 event_type=VITALS_RECORDED,
                 data=event_data,
                 recorded_at=metadata.get('timestamp') if metadata else None
-            )
+            ))
         except Exception as e:
             logger.error(f"Error handling vitals recording: {str(e)}")
             raise
 
-    @transaction.atomic
     def _handle_diagnosis_added(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
-        from ..models import ClinicalReadModel  # Import here to avoid circular import
         try:
-            model = ClinicalReadModel.objects.create(
-                patient_id=event_data['patient_id'],
-                event_type=DIAGNOSIS_ADDED,
-                data=event_data,
-                recorded_at=metadata.get('timestamp') if metadata else None
-            )
-            if 'provider' in event_data:
-                model.update_provider_details(event_data['provider'])
-                model.save()
-            return model
+            return self._add_with_provider(DIAGNOSIS_ADDED, event_data, metadata)
         except Exception as e:
             logger.error(f"Error handling diagnosis addition: {str(e)}")
             raise
 
-    @transaction.atomic
     def _handle_symptoms_added(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import ClinicalReadModel  # Import here to avoid circular import
         try:
-            model = ClinicalReadModel.objects.create(
+            model = ClinicalReadModel(
                 patient_id=event_data['patient_id'],
                 event_type=event_data.get('event_type', SYMPTOMS_ADDED),
                 data=event_data,
                 recorded_at=metadata.get('timestamp') if metadata else None
             )
-            
+
             # Update the denormalized symptoms summary
             symptoms_data = {
                 'symptom': event_data.get('symptom'),
@@ -126,51 +190,42 @@ class ClinicalEventHandler(EventHandler):
                 'person_reporting': event_data.get('person_reporting')
             }
             model.update_symptoms_summary(symptoms_data)
-            
+
             # Update provider details if present
             if 'provider_id' in event_data:
                 model.update_provider_details({'provider_id': event_data['provider_id']})
-            
-            model.save()
-            return model
+
+            return self.writer.add(model)
         except Exception as e:
             logger.error(f"Error handling symptoms addition/update: {str(e)}")
             raise
 
-    @transaction.atomic
     def _handle_medication_prescribed(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         try:
-            model = ClinicalReadModel.objects.create(
-                patient_id=event_data['patient_id'],
-                event_type=MEDICATION_PRESCRIBED,
-                data=event_data,
-                recorded_at=metadata.get('timestamp') if metadata else None
-            )
-            if 'provider' in event_data:
-                model.update_provider_details(event_data['provider'])
-                model.save()
-            return model
+            return self._add_with_provider(MEDICATION_PRESCRIBED, event_data, metadata)
         except Exception as e:
             logger.error(f"Error handling medication prescription: {str(e)}")
             raise
 
-    @transaction.atomic
     def _handle_medication_discontinued(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         try:
-            model = ClinicalReadModel.objects.create(
-                patient_id=event_data['patient_id'],
-                event_type=MEDICATION_DISCONTINUED,
-                data=event_data,
-                recorded_at=metadata.get('timestamp') if metadata else None
-            )
-            if 'provider' in event_data:
-                model.update_provider_details(event_data['provider'])
-                model.save()
-            return model
+            return self._add_with_provider(MEDICATION_DISCONTINUED, event_data, metadata)
         except Exception as e:
             logger.error(f"Error handling medication discontinuation: {str(e)}")
             raise
 
+    def _add_with_provider(self, event_type: str, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
+        from ..models import ClinicalReadModel  # Import here to avoid circular import
+        model = ClinicalReadModel(
+            patient_id=event_data['patient_id'],
+            event_type=event_type,
+            data=event_data,
+            recorded_at=metadata.get('timestamp') if metadata else None
+        )
+        if 'provider' in event_data:
+            model.update_provider_details(event_data['provider'])
+        return self.writer.add(model)
+
 class LabResultEventHandler(EventHandler):
     def register_handlers(self):
         self.handlers = {
@@ -179,40 +234,38 @@ class LabResultEventHandler(EventHandler):
             LAB_RESULT_CANCELLED: self._handle_lab_result_cancelled
         }
 
-    @transaction.atomic
     def _handle_lab_result_recorded(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import LabResultsReadModel  # Import here to avoid circular import
         try:
-            return LabResultsReadModel.objects.create(
+            # Keyed by the id the event carries, or the event's own id, so
+            # replaying the event recreates the same row
+            return self.writer.add(LabResultsReadModel(
+                id=event_data.get('id') or (metadata or {}).get('event_id') or uuid.uuid4(),
                 patient_id=event_data['patient_id'],
                 lab_type=event_data['lab_type'],
-                results=event_data['results'],
+                results=dict(event_data['results']),
                 performed_at=metadata.get('timestamp') if metadata else None
-            )
+            ))
         except Exception as e:
             logger.error(f"Error handling lab result recording: {str(e)}")
             raise
 
-    @transaction.atomic
     def _handle_lab_result_updated(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import LabResultsReadModel  # Import here to avoid circular import
         try:
-            result = LabResultsReadModel.objects.select_for_update().get(id=event_data['id'])
+            result = self.writer.get(LabResultsReadModel, event_data['id'])
             result.results.update(event_data['updates'])
-            result.save()
-            return result
+            return self.writer.save(result)
         except Exception as e:
             logger.error(f"Error handling lab result update: {str(e)}")
             raise
 
-    @transaction.atomic
     def _handle_lab_result_cancelled(self, event_data: Dict[str, Any], metadata: Dict[str, Any] = None):
         from ..models import LabResultsReadModel  # Import here to avoid circular import
         try:
-            result = LabResultsReadModel.objects.select_for_update().get(id=event_data['id'])
+            result = self.writer.get(LabResultsReadModel, event_data['id'])
             result.results['status'] = 'cancelled'
-            result.save()
-            return result
+            return self.writer.save(result)
         except Exception as e:
             logger.error(f"Error handling lab result cancellation: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
@@ -0,0 +1,56 @@
+from typing import Optional, Tuple
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import IdempotencyKey
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key_ttl() -> timedelta:
+    """
+    How long a key keeps deduplicating retries (IDEMPOTENCY_KEY_TTL, in seconds)
+    """
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+
+
+def claim_idempotency_key(scope: str, key: Optional[str]) -> Tuple[Optional[IdempotencyKey], bool]:
+    """
+    Claim a key for a write, must be called inside transaction.atomic
+
+    Returns (record, True) when the caller should do the work and then store
+    its result with record.complete(), or (record, False) when the key was
+    already used within the retention window and record.result holds the
+    original result. Without a key it returns (None, True). A concurrent
+    request with the same key blocks on the unique index until the first
+    one commits or rolls back.
+    """
+    if not key:
+        return None, True
+
+    key_hash = hashlib.sha256(f"{scope}:{key}".encode('utf-8')).hexdigest()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(key_hash=key_hash, scope=scope), True
+    except IntegrityError:
+        record = IdempotencyKey.objects.get(key_hash=key_hash)
+
+    if record.created_at >= timezone.now() - idempotency_key_ttl():
+        logger.info(f"Replaying {scope} for idempotency key {key_hash[:12]}")
+        return record, False
+
+    # Expired but not pruned yet, the key no longer deduplicates
+    record.delete()
+    return IdempotencyKey.objects.create(key_hash=key_hash, scope=scope), True
+
+
+def prune_idempotency_keys(older_than: Optional[timedelta] = None) -> int:
+    """
+    Delete keys past the retention window, returns the number removed
+    """
+    cutoff = timezone.now() - (older_than or idempotency_key_ttl())
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -1,6 +1,9 @@
 from django.db import models
 import uuid
 
+# Postgres sequence backing EventStore.position
+EVENT_POSITION_SEQUENCE = 'patient_records_eventstore_position_seq'
+
 class EventStore(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     aggregate_id = models.UUIDField()
@@ -9,6 +12,10 @@ class EventStore(models.Model):
     event_data = models.JSONField()
     metadata = models.JSONField(null=True)
     version = models.IntegerField(default=1)
+    # Global, gap-tolerant commit order across all aggregates
+    position = models.BigIntegerField(null=True, unique=True, editable=False)
+    # Transaction id horizon taken after the position was allocated, PostgreSQL only
+    horizon = models.BigIntegerField(null=True, editable=False)
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -26,4 +33,72 @@ class EventStore(models.Model):
         ordering = ['timestamp']
 
     def __str__(self):
-        return f"{self.event_type} - {self.aggregate_id} - {self.timestamp}" 
\ No newline at end of file
+        return f"{self.event_type} - {self.aggregate_id} - {self.timestamp}" 
+
+class ProjectionOutbox(models.Model):
+    """Events committed with their write, waiting to be applied to the read models"""
+    id = models.BigAutoField(primary_key=True)
+    event = models.ForeignKey(EventStore, on_delete=models.CASCADE, related_name='+')
+    aggregate_type = models.CharField(max_length=100)
+    # Same horizon as the event's, taken after this id was allocated
+    horizon = models.BigIntegerField(null=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['aggregate_type', 'id'])
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.id} - {self.aggregate_type}"
+
+
+class ProjectionCheckpoint(models.Model):
+    """Last position applied by each projection or event store subscriber"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    # Failed attempts at the event just after position
+    attempts = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class AggregateCheckpoint(models.Model):
+    """Folded aggregate state kept at a past version for "as of" queries"""
+    aggregate_id = models.UUIDField()
+    version = models.IntegerField()
+    # Timestamp of the event at this version, not of when the checkpoint was taken
+    timestamp = models.DateTimeField()
+    state = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['aggregate_id', 'version'],
+                name='unique_checkpoint_version'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['aggregate_id', 'timestamp'])
+        ]
+
+    def __str__(self):
+        return f"{self.aggregate_id} @ {self.version}"
+
+
+class IdempotencyKey(models.Model):
+    """Result of a write made under a client-supplied idempotency key"""
+    # sha256 of scope and key, so keys of any length fit the unique index
+    key_hash = models.CharField(max_length=64, unique=True)
+    scope = models.CharField(max_length=100)
+    result = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def complete(self, result) -> None:
+        self.result = result
+        self.save(update_fields=['result'])
+
+    def __str__(self):
+        return f"{self.scope} - {self.key_hash[:12]}"
@@ -0,0 +1,161 @@
+from typing import Dict, List, Optional
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Min
+from .models import ProjectionOutbox, ProjectionCheckpoint
+from .handlers import PatientEventHandler, ClinicalEventHandler, LabResultEventHandler
+from .services import oldest_running_transaction, trim_at_gap
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ProjectionRunner:
+    """
+    Applies outbox events to the read models outside the request
+
+    Each projection keeps its own checkpoint and advances it in the same
+    transaction as the read-model writes, so a crash never applies a batch
+    twice. Batches are bounded by batch_size and the runner backs off while
+    the outbox is idle. An event whose handler keeps failing is retried on
+    later batches and skipped after max_attempts, so it cannot stall its
+    projection.
+    """
+
+    def __init__(self, batch_size: int = 100, gap_timeout: float = 5.0, max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.gap_timeout = timedelta(seconds=gap_timeout)
+        self.max_attempts = max_attempts
+        self.projections = {
+            'PATIENT': PatientEventHandler(),
+            'CLINICAL': ClinicalEventHandler(),
+            'LAB': LabResultEventHandler()
+        }
+
+    def run_forever(self, poll_interval: float = 0.5, max_poll_interval: float = 10.0) -> None:
+        """
+        Process batches until interrupted, backing off while there is no work
+        """
+        interval = poll_interval
+        while True:
+            processed = self.run_once()
+            if processed:
+                interval = poll_interval
+                continue
+            time.sleep(interval)
+            interval = min(interval * 2, max_poll_interval)
+
+    def run_once(self) -> int:
+        """
+        Apply at most one batch per projection and prune applied outbox rows
+
+        Returns the number of outbox rows consumed across projections.
+        """
+        processed = 0
+        for name in self.projections:
+            try:
+                processed += self.process_batch(name)
+            except Exception as e:
+                logger.error(f"Projection {name} failed, will retry: {str(e)}", exc_info=True)
+        self.prune()
+        return processed
+
+    def process_batch(self, name: str) -> int:
+        """
+        Apply the next batch of outbox events for one projection
+
+        Each event is applied in its own savepoint. When one fails, the
+        events before it are committed and the checkpoint stops just short of
+        it, counting the attempt; on the max_attempts-th failure it is
+        skipped and logged with its event id.
+        """
+        handler = self.projections[name]
+        with transaction.atomic():
+            checkpoint = self._lock_checkpoint(name)
+            if checkpoint is None:
+                # Another worker holds this projection
+                return 0
+
+            oldest_running = oldest_running_transaction()
+            rows = list(ProjectionOutbox.objects
+                        .filter(id__gt=checkpoint.position)
+                        .select_related('event')
+                        .order_by('id')[:self.batch_size])
+            rows = self._contiguous(rows, checkpoint.position, oldest_running)
+            if not rows:
+                return 0
+
+            applied = 0
+            consumed = rows
+            attempts = 0
+            for index, row in enumerate(rows):
+                event = row.event
+                if row.aggregate_type != name or event.event_type not in handler.handlers:
+                    continue
+                try:
+                    handler.handle_event(event)
+                except Exception as e:
+                    failures = (checkpoint.attempts if index == 0 else 0) + 1
+                    if failures < self.max_attempts:
+                        logger.warning(f"Projection {name} failed on event {event.id} "
+                                       f"(attempt {failures} of {self.max_attempts}), will retry: {str(e)}",
+                                       exc_info=True)
+                        consumed, attempts = rows[:index], failures
+                        break
+                    logger.error(f"Projection {name} skipped event {event.id} (outbox {row.id}) "
+                                 f"after {failures} failed attempts: {str(e)}", exc_info=True)
+                    continue
+                applied += 1
+
+            if consumed:
+                checkpoint.position = consumed[-1].id
+            checkpoint.attempts = attempts
+            checkpoint.save(update_fields=['position', 'attempts', 'updated_at'])
+
+        logger.debug(f"Projection {name} applied {applied} events up to {checkpoint.position}")
+        return len(consumed)
+
+    def lag(self) -> Dict[str, int]:
+        """
+        Number of outbox rows each projection has yet to apply
+        """
+        positions = dict(ProjectionCheckpoint.objects
+                         .filter(name__in=self.projections)
+                         .values_list('name', 'position'))
+        return {
+            name: ProjectionOutbox.objects.filter(id__gt=positions.get(name, 0)).count()
+            for name in self.projections
+        }
+
+    def prune(self) -> int:
+        """
+        Delete outbox rows every projection has applied
+        """
+        checkpoints = ProjectionCheckpoint.objects.filter(name__in=self.projections)
+        if checkpoints.count() < len(self.projections):
+            return 0
+        low_water = checkpoints.aggregate(low=Min('position'))['low']
+        deleted, _ = ProjectionOutbox.objects.filter(id__lte=low_water).delete()
+        return deleted
+
+    @staticmethod
+    def _lock_checkpoint(name: str) -> Optional[ProjectionCheckpoint]:
+        ProjectionCheckpoint.objects.get_or_create(name=name)
+        return (ProjectionCheckpoint.objects
+                .select_for_update(skip_locked=True)
+                .filter(name=name)
+                .first())
+
+    def _contiguous(self, rows: List[ProjectionOutbox], position: int,
+                    oldest_running: Optional[int]) -> List[ProjectionOutbox]:
+        """
+        Trim rows at the first outbox id gap that may still be filled
+        """
+        return trim_at_gap(
+            rows, position,
+            get_position=lambda row: row.id,
+            get_horizon=lambda row: row.horizon,
+            get_created=lambda row: row.created_at,
+            gap_timeout=self.gap_timeout,
+            oldest_running=oldest_running
+        )
@@ -1,65 +1,486 @@
-from typing import Dict, Any, List, Optional
-from django.db import transaction
+from typing import Callable, Dict, Any, Iterator, List, Optional, Sequence, Tuple, Union
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
 from django.utils import timezone
-from .models import EventStore
+from .models import EventStore, ProjectionOutbox, ProjectionCheckpoint, AggregateCheckpoint, EVENT_POSITION_SEQUENCE
 from .handlers import PatientEventHandler, ClinicalEventHandler, LabResultEventHandler
+from .exceptions import ConcurrencyError, WrongExpectedVersionError
+from .archive import EventArchive
+from .idempotency import claim_idempotency_key
+from ..cache import retire_patient_cache
 import uuid
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 import logging
 
 logger = logging.getLogger(__name__)
 
+def oldest_running_transaction() -> Optional[int]:
+    """
+    Id of the oldest transaction still running on PostgreSQL, None elsewhere
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+def trim_at_gap(rows: Sequence, position: int, get_position: Callable, get_horizon: Callable,
+                get_created: Callable, gap_timeout: timedelta, oldest_running: Optional[int]) -> list:
+    """
+    Trim rows at the first position gap that may still be filled
+
+    Positions are allocated before commit, so a lower one can become visible
+    after a higher one. On PostgreSQL every row carries the horizon its
+    writer took after allocating it (see _allocate_positions): a
+    transaction holding a lower position started below that horizon, so
+    once the oldest running transaction has passed it the gap can only be
+    a rollback and is skipped. oldest_running comes from
+    oldest_running_transaction(), read before the rows so that any
+    transaction finished by then is visible in them.
+
+    Rows without a horizon, from other databases or written before it was
+    recorded, fall back to skipping the gap once the row after it is older
+    than gap_timeout. That timeout must exceed the longest write
+    transaction, an event committed later than that behind the gap would
+    be passed over for good.
+    """
+    cutoff = timezone.now() - gap_timeout
+    expected = position + 1
+    for index, row in enumerate(rows):
+        if get_position(row) != expected:
+            horizon = get_horizon(row)
+            if horizon is None:
+                settled = get_created(row) <= cutoff
+            else:
+                settled = oldest_running is not None and horizon <= oldest_running
+            if not settled:
+                return list(rows[:index])
+        expected = get_position(row) + 1
+    return list(rows)
+
 class EventStoreService:
+    # Attempts made to allocate a version when no expected_version is given
+    MAX_APPEND_ATTEMPTS = 3
+    # Snapshot the aggregate state every N events, 0 disables snapshotting
+    SNAPSHOT_INTERVAL = 100
+    # Rows fetched per keyset page when streaming events
+    EVENT_CHUNK_SIZE = 500
+    # Seconds before a gap in the global position is treated as a rollback,
+    # only for events without a horizon (see trim_at_gap)
+    POSITION_GAP_TIMEOUT = 5.0
+
     def __init__(self):
         self.handlers = {
             'PATIENT': PatientEventHandler(),
             'CLINICAL': ClinicalEventHandler(),
             'LAB': LabResultEventHandler()
         }
+        self.archive = EventArchive()
 
-    def append_event(self, aggregate_id: str, aggregate_type: str, event_type: str, event_data: dict) -> None:
+    def append_event(self, aggregate_id: str, aggregate_type: str, event_type: str, event_data: dict,
+                     expected_version: Optional[int] = None, idempotency_key: Optional[str] = None) -> EventStore:
         """
         Append a new event to the event store
         """
+        events = self.append_events(aggregate_id, [{
+            'aggregate_type': aggregate_type,
+            'event_type': event_type,
+            'event_data': event_data
+        }], expected_version=expected_version, idempotency_key=idempotency_key)
+        return events[0]
+
+    def append_events(self, aggregate_id: str, events: List[Dict[str, Any]],
+                      expected_version: Optional[int] = None,
+                      idempotency_key: Optional[str] = None) -> List[EventStore]:
+        """
+        Append a batch of events for one aggregate in a single transaction
+
+        Each item in events is a dict with 'aggregate_type', 'event_type' and
+        'event_data' keys. The latest version is read once, all rows are
+        inserted with one bulk_create and the batch is then dispatched to
+        the handlers in order. When EVENT_PROJECTION_MODE is 'async' the
+        events are written to the projection outbox instead and applied by
+        the run_projections worker after commit.
+
+        When expected_version is given the append only succeeds if the
+        aggregate is still at that version, otherwise a
+        WrongExpectedVersionError is raised. Without it, a collision on the
+        unique_aggregate_version constraint is retried up to
+        MAX_APPEND_ATTEMPTS times before a ConcurrencyError is raised.
+
+        An append retried with the same idempotency_key within the retention
+        window returns the originally stored events without writing again.
+        """
+        if not events:
+            return []
+
         try:
             # Validate UUID format
-            uuid_obj = uuid.UUID(aggregate_id)
-            
-            # Get the latest version for this aggregate
-            latest_event = EventStore.objects.filter(
-                aggregate_id=str(uuid_obj)
-            ).order_by('-version').first()
-            
-            # Calculate the next version
-            next_version = (latest_event.version + 1) if latest_event else 1
-            
-            # Create timestamp for both event and metadata
-            timestamp = timezone.now()
-            timestamp_str = timestamp.isoformat()
-            
-            # Create and save the event
-            event = EventStore.objects.create(
-                aggregate_id=str(uuid_obj),
-                aggregate_type=aggregate_type,
-                event_type=event_type,
-                event_data=event_data,
-                version=next_version,
-                timestamp=timestamp,
-                metadata={'timestamp': timestamp_str}
-            )
-            
-            # Dispatch event to handlers
-            handler = self.handlers.get(aggregate_type)
-            if handler:
-                handler.handle(event_type, event_data, {'timestamp': timestamp_str})
-                
+            uuid_obj = uuid.UUID(str(aggregate_id))
+            max_attempts = 1 if expected_version is not None else self.MAX_APPEND_ATTEMPTS
+
+            with transaction.atomic():
+                claim, created = claim_idempotency_key(f"append:{uuid_obj}", idempotency_key)
+                if not created:
+                    return list(EventStore.objects.filter(id__in=claim.result['event_ids']).order_by('version'))
+
+                for attempt in range(1, max_attempts + 1):
+                    if expected_version == 0:
+                        # A new aggregate has nothing to look up, an existing
+                        # one fails on unique_aggregate_version below
+                        current_version = 0
+                    else:
+                        current_version = self.get_current_version(uuid_obj)
+                    if expected_version is not None and current_version != expected_version:
+                        raise WrongExpectedVersionError(str(uuid_obj), expected_version, current_version)
+
+                    records = self._build_records(uuid_obj, events, current_version)
+                    outboxed = [record for record in records
+                                if record.aggregate_type in self.handlers] if self.projections_async() else []
+                    positions, outbox_ids, horizon = self._allocate_positions(len(records), len(outboxed))
+                    for record, position in zip(records, positions):
+                        record.position = position
+                        record.horizon = horizon
+                    try:
+                        # Savepoint so a lost race can be retried in this transaction,
+                        # not needed when a conflict is never retried
+                        with transaction.atomic(savepoint=expected_version is None):
+                            EventStore.objects.bulk_create(records)
+                        break
+                    except IntegrityError:
+                        if expected_version is not None:
+                            raise WrongExpectedVersionError(str(uuid_obj), expected_version, None)
+                        if attempt == max_attempts:
+                            raise ConcurrencyError(
+                                str(uuid_obj), current_version, None,
+                                f"Could not append to aggregate {uuid_obj} after {max_attempts} attempts"
+                            )
+                        logger.warning(
+                            f"Version conflict on aggregate {uuid_obj} at version {current_version + 1}, "
+                            f"retrying (attempt {attempt}/{max_attempts})"
+                        )
+
+                if self.projections_async():
+                    ProjectionOutbox.objects.bulk_create([
+                        ProjectionOutbox(id=outbox_id, event=record, aggregate_type=record.aggregate_type,
+                                         horizon=horizon)
+                        for record, outbox_id in zip(outboxed, outbox_ids)
+                    ])
+                else:
+                    # Dispatch events to handlers
+                    for record in records:
+                        handler = self.handlers.get(record.aggregate_type)
+                        if handler:
+                            handler.handle_event(record)
+
+                if self._snapshot_due(current_version, records[-1].version):
+                    self.take_snapshot(str(uuid_obj))
+
+                # Cached responses for the patient move to the new version after commit
+                retire_patient_cache(uuid_obj)
+
+                if claim is not None:
+                    claim.complete({'event_ids': [str(record.id) for record in records]})
+
+            return records
+
+        except ConcurrencyError as e:
+            logger.warning(str(e))
+            raise
         except ValueError as e:
             logger.error(f"Invalid UUID format for aggregate_id: {aggregate_id}")
             raise
         except Exception as e:
-            logger.error(f"Error appending event: {str(e)}")
+            logger.error(f"Error appending events: {str(e)}")
             raise
 
+    @staticmethod
+    def projections_async() -> bool:
+        """
+        Check whether read models are projected by the outbox worker
+        """
+        return getattr(settings, 'EVENT_PROJECTION_MODE', 'inline') == 'async'
+
+    def get_current_version(self, aggregate_id) -> int:
+        """
+        Get the latest stored version for an aggregate, 0 if it has no events
+        """
+        version = (EventStore.objects
+                   .filter(aggregate_id=str(aggregate_id))
+                   .order_by('-version')
+                   .values_list('version', flat=True)
+                   .first())
+        return version or 0
+
+    def take_snapshot(self, aggregate_id: str) -> Optional[int]:
+        """
+        Store the folded aggregate state in PatientReadModel.snapshot_data
+
+        The state is also kept as an AggregateCheckpoint so state_at can
+        start from it later. Returns the snapshot version, or None if there
+        was no read model to store it on.
+        """
+        from ..models import PatientReadModel  # Import here to avoid circular import
+        state, version = self.load_state(aggregate_id)
+        if not version:
+            return None
+
+        # The latest event is never archived, so its row is always in the table
+        timestamp = (EventStore.objects
+                     .filter(aggregate_id=str(aggregate_id), version=version)
+                     .values_list('timestamp', flat=True)
+                     .first())
+        AggregateCheckpoint.objects.bulk_create([
+            AggregateCheckpoint(aggregate_id=str(aggregate_id), version=version, timestamp=timestamp, state=state)
+        ], ignore_conflicts=True)
+
+        updated = PatientReadModel.objects.filter(id=aggregate_id).update(
+            snapshot_data=state,
+            snapshot_version=version
+        )
+        if not updated:
+            logger.debug(f"No read model to snapshot for aggregate {aggregate_id}")
+            return None
+        return version
+
+    def load_state(self, aggregate_id: str, up_to_version: Optional[int] = None) -> Tuple[Dict[str, Any], int]:
+        """
+        Rebuild aggregate state from the latest snapshot plus the events after it
+
+        Returns the folded state and the version it reflects (0 if there are
+        no events). Handlers are not re-run.
+        """
+        from ..models import PatientReadModel  # Import here to avoid circular import
+        snapshot = (PatientReadModel.objects
+                    .filter(id=aggregate_id, snapshot_version__isnull=False)
+                    .values('snapshot_data', 'snapshot_version')
+                    .first())
+
+        state, version = {}, 0
+        if snapshot and (up_to_version is None or snapshot['snapshot_version'] <= up_to_version):
+            state = dict(snapshot['snapshot_data'] or {})
+            version = snapshot['snapshot_version']
+
+        for event in self.stream_events(aggregate_id, after_version=version, up_to_version=up_to_version):
+            state.update(event.event_data)
+            version = event.version
+
+        return state, version
+
+    def state_at(self, aggregate_id: str, at: Union[int, datetime, date]) -> Tuple[Dict[str, Any], int]:
+        """
+        Rebuild aggregate state as it was at a past version or point in time
+
+        `at` is a version number, a datetime, or a date (meaning the end of
+        that day). Folding starts from the latest AggregateCheckpoint at or
+        before that point, so the cost is bounded by the events since the
+        checkpoint rather than the whole stream. Returns the state and the
+        version it reflects (0 if the aggregate had no events yet).
+        """
+        checkpoints = AggregateCheckpoint.objects.filter(aggregate_id=str(aggregate_id))
+        until = None
+        if isinstance(at, datetime):
+            until = at if timezone.is_aware(at) else timezone.make_aware(at)
+            checkpoints = checkpoints.filter(timestamp__lte=until)
+        elif isinstance(at, date):
+            until = timezone.make_aware(datetime.combine(at, time.max))
+            checkpoints = checkpoints.filter(timestamp__lte=until)
+        elif isinstance(at, int):
+            checkpoints = checkpoints.filter(version__lte=at)
+        else:
+            raise TypeError(f"state_at expects a version, datetime or date, got {type(at).__name__}")
+
+        state, version = {}, 0
+        checkpoint = checkpoints.order_by('-version').values('state', 'version').first()
+        if checkpoint:
+            state, version = dict(checkpoint['state']), checkpoint['version']
+
+        up_to_version = at if until is None else None
+        for event in self.stream_events(aggregate_id, after_version=version, up_to_version=up_to_version):
+            if until is not None and event.timestamp > until:
+                break
+            state.update(event.event_data)
+            version = event.version
+
+        return state, version
+
+    def _snapshot_due(self, previous_version: int, new_version: int) -> bool:
+        """
+        Check whether an append crossed a SNAPSHOT_INTERVAL boundary
+        """
+        if not self.SNAPSHOT_INTERVAL:
+            return False
+        return new_version // self.SNAPSHOT_INTERVAL > previous_version // self.SNAPSHOT_INTERVAL
+
+    @staticmethod
+    def _build_records(aggregate_id: uuid.UUID, events: List[Dict[str, Any]], current_version: int) -> List[EventStore]:
+        """
+        Build unsaved EventStore rows numbered after current_version
+        """
+        # Create timestamp for both events and metadata
+        timestamp = timezone.now()
+        timestamp_str = timestamp.isoformat()
+
+        return [
+            EventStore(
+                aggregate_id=str(aggregate_id),
+                aggregate_type=event['aggregate_type'],
+                event_type=event['event_type'],
+                event_data=event['event_data'],
+                version=current_version + offset,
+                timestamp=timestamp,
+                metadata={'timestamp': timestamp_str}
+            )
+            for offset, event in enumerate(events, start=1)
+        ]
+
+    def stream_events(self, aggregate_id: str, after_version: int = 0, up_to_version: Optional[int] = None,
+                      chunk_size: Optional[int] = None) -> Iterator[EventStore]:
+        """
+        Yield an aggregate's events in version order
+
+        Events moved to archive segments are read from there first, then
+        rows are fetched in pages of chunk_size keyed on version, so only one
+        page is held in memory at a time.
+        """
+        chunk_size = chunk_size or self.EVENT_CHUNK_SIZE
+        last_version = after_version
+        for event in self.archive.read_events(aggregate_id, after_version, up_to_version):
+            yield event
+            last_version = event.version
+
+        query = EventStore.objects.filter(aggregate_id=str(aggregate_id))
+        if up_to_version is not None:
+            query = query.filter(version__lte=up_to_version)
+
+        while True:
+            page = list(query.filter(version__gt=last_version).order_by('version')[:chunk_size])
+            yield from page
+            if len(page) < chunk_size:
+                return
+            last_version = page[-1].version
+
+    def stream_all_events(self, after: Optional[Tuple[str, int]] = None, aggregate_type: Optional[str] = None,
+                          chunk_size: Optional[int] = None) -> Iterator[EventStore]:
+        """
+        Yield every event in the store ordered by (aggregate_id, version)
+
+        after is an (aggregate_id, version) position to resume from. Pages
+        are keyed on the unique_aggregate_version index.
+        """
+        chunk_size = chunk_size or self.EVENT_CHUNK_SIZE
+        query = EventStore.objects.all()
+        if aggregate_type:
+            query = query.filter(aggregate_type=aggregate_type)
+
+        position = after
+        while True:
+            page_query = query
+            if position is not None:
+                last_aggregate, last_version = position
+                page_query = page_query.filter(
+                    Q(aggregate_id__gt=last_aggregate) |
+                    Q(aggregate_id=last_aggregate, version__gt=last_version)
+                )
+            page = list(page_query.order_by('aggregate_id', 'version')[:chunk_size])
+            yield from page
+            if len(page) < chunk_size:
+                return
+            position = (page[-1].aggregate_id, page[-1].version)
+
+    def read_all(self, after_position: int = 0, batch_size: Optional[int] = None) -> List[EventStore]:
+        """
+        Read the next batch of events across all aggregates in position order
+
+        Stops at a position gap that may still be filled by an open
+        transaction, so passing the last returned position back in never
+        skips an event.
+        """
+        batch_size = batch_size or self.EVENT_CHUNK_SIZE
+        oldest_running = oldest_running_transaction()
+        rows = list(EventStore.objects
+                    .filter(position__gt=after_position)
+                    .order_by('position')[:batch_size])
+        return trim_at_gap(
+            rows, after_position,
+            get_position=lambda event: event.position,
+            get_horizon=lambda event: event.horizon,
+            get_created=lambda event: event.timestamp,
+            gap_timeout=timedelta(seconds=self.POSITION_GAP_TIMEOUT),
+            oldest_running=oldest_running
+        )
+
+    def subscribe(self, consumer: str, batch_size: Optional[int] = None) -> Iterator[List[EventStore]]:
+        """
+        Yield batches of new events for a named consumer until caught up
+
+        The consumer's checkpoint is saved when the next batch is requested,
+        so a batch that raises is delivered again on the next subscription.
+        """
+        position = self.get_checkpoint(consumer)
+        while True:
+            batch = self.read_all(position, batch_size)
+            if not batch:
+                return
+            yield batch
+            position = batch[-1].position
+            self.save_checkpoint(consumer, position)
+
+    @staticmethod
+    def get_checkpoint(consumer: str) -> int:
+        """
+        Get the last position a consumer has processed, 0 if it never ran
+        """
+        position = (ProjectionCheckpoint.objects
+                    .filter(name=consumer)
+                    .values_list('position', flat=True)
+                    .first())
+        return position or 0
+
+    @staticmethod
+    def save_checkpoint(consumer: str, position: int) -> None:
+        """
+        Persist the last position a consumer has processed
+        """
+        ProjectionCheckpoint.objects.update_or_create(name=consumer, defaults={'position': position})
+
+    @staticmethod
+    def _allocate_positions(count: int, outbox_count: int = 0) -> Tuple[List[int], List[Optional[int]], Optional[int]]:
+        """
+        Reserve count global positions and outbox_count outbox ids
+
+        Postgres hands them out from sequences, which never blocks other
+        writers and may leave gaps. The transaction takes its id first and
+        the horizon, the next transaction id yet to be assigned, last. Any
+        writer holding a lower position or outbox id therefore has an id
+        below the horizon, which is what trim_at_gap relies on. Other
+        backends serialize writes, so the next positions after the current
+        maximum are safe there, the outbox ids come from the insert and
+        there is no horizon.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT txid_current()")
+                cursor.execute(
+                    "SELECT nextval(%s) FROM generate_series(1, %s)",
+                    [EVENT_POSITION_SEQUENCE, count]
+                )
+                positions = [row[0] for row in cursor.fetchall()]
+                outbox_ids = []
+                if outbox_count:
+                    cursor.execute(
+                        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                        [ProjectionOutbox._meta.db_table, outbox_count]
+                    )
+                    outbox_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute("SELECT txid_snapshot_xmax(txid_current_snapshot())")
+                return positions, outbox_ids, cursor.fetchone()[0]
+
+        current = EventStore.objects.aggregate(current=Max('position'))['current'] or 0
+        return list(range(current + 1, current + count + 1)), [None] * outbox_count, None
+
     def get_events(self, aggregate_id: str, event_type: Optional[str] = None) -> QuerySet:
         """
         Get all events for a specific aggregate
@@ -72,4 +493,4 @@ class EventStoreService:
             return events.order_by('timestamp')
         except ValueError as e:
             logger.error(f"Invalid UUID format for aggregate_id: {aggregate_id}")
-            raise 
\ No newline at end of file
+            raise
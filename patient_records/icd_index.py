@@ -0,0 +1,582 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from array import array
+from bisect import bisect_left
+import heapq
+from itertools import repeat
+import math
+import re
+from pathlib import Path
+import csv
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+logger = logging.getLogger('patient_records')
+
+CODES_CSV = Path(__file__).parent / 'data' / 'codes.csv'
+# Compiled by `manage.py build_icd_index`, used instead of the CSV when present
+CODES_INDEX = Path(__file__).parent / 'data' / 'codes.idx'
+
+# Index file header: magic, format version, byte order, code count and
+# section count, followed by the byte length of each section as a uint64
+INDEX_MAGIC = b'ICDX'
+INDEX_VERSION = 2
+INDEX_HEADER = struct.Struct('<4sHcxII')
+INDEX_SECTION = struct.Struct('<Q')
+# Sections start on this boundary, so any of them can be cast to a typed view
+INDEX_ALIGNMENT = 8
+
+# Columns of codes.csv used by the lookup
+CODE_COLUMN = 0
+DESCRIPTION_COLUMN = 4
+
+# Ranked search: the most vocabulary words a prefix or misspelled query
+# word expands to, and the least trigram similarity counted as a match
+MAX_EXPANSIONS = 30
+MIN_SIMILARITY = 0.4
+# Weight of a prefix word match, a trigram match is weighted by its similarity times this
+PREFIX_WEIGHT = 0.9
+FUZZY_WEIGHT = 0.8
+# Query words in more than this fraction of rows, such as 'with' or 'other',
+# only rank the rows the rarer words find, the rarest word finds them when
+# every word is this common
+COMMON_WORD_FRACTION = 0.05
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+_index = None
+_index_lock = threading.Lock()
+# mtime of the index file when get_icd_index last looked, None if it was missing
+_index_file_mtime: Optional[float] = None
+
+
+def _trigrams(word: str) -> set:
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DescriptionIndex:
+    """
+    Word and trigram inverted indexes over the code descriptions
+
+    Words map to the rows whose description contains them. Trigrams map to
+    vocabulary words rather than rows, which keeps the trigram index small;
+    a misspelled query word is first corrected to similar vocabulary words,
+    then looked up like any other word. Row ids are positions in the code
+    table, so equal scores rank in code order. Word ids are positions in
+    the sorted vocabulary, so the words sharing a prefix have adjacent ids.
+    """
+
+    def __init__(self, descriptions: Sequence[str]):
+        word_rows: Dict[str, List[int]] = {}
+        for row, description in enumerate(descriptions):
+            for word in set(_WORD.findall(description.lower())):
+                word_rows.setdefault(word, []).append(row)
+
+        self.row_count = len(descriptions)
+        self.words = sorted(word_rows)
+        self.vocabulary = {word: word_id for word_id, word in enumerate(self.words)}
+        self.postings = [array('I', word_rows[word]) for word in self.words]
+        self.idf = array('d', (math.log(1 + len(descriptions) / len(rows)) for rows in self.postings))
+
+        trigram_words: Dict[str, List[int]] = {}
+        self.trigram_counts = array('H', [0] * len(self.words))
+        for word_id, word in enumerate(self.words):
+            grams = _trigrams(word)
+            self.trigram_counts[word_id] = len(grams)
+            for gram in grams:
+                trigram_words.setdefault(gram, []).append(word_id)
+        self.trigram_words = {gram: array('I', ids) for gram, ids in trigram_words.items()}
+
+    def _word_id(self, word: str) -> Optional[int]:
+        return self.vocabulary.get(word)
+
+    def _trigram_word_ids(self, gram: str) -> Sequence[int]:
+        return self.trigram_words.get(gram, ())
+
+    def expand(self, word: str, prefix: bool) -> Dict[int, float]:
+        """Vocabulary word ids a query word matches, with the weight of each match"""
+        matches: Dict[int, float] = {}
+        word_id = self._word_id(word)
+        if word_id is not None:
+            matches[word_id] = 1.0
+        if prefix:
+            position = bisect_left(self.words, word)
+            while (position < len(self.words) and len(matches) < MAX_EXPANSIONS
+                   and self.words[position].startswith(word)):
+                matches.setdefault(position, PREFIX_WEIGHT)
+                position += 1
+        if matches:
+            return matches
+
+        grams = _trigrams(word)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for candidate in self._trigram_word_ids(gram):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        similar = []
+        for candidate, count in shared.items():
+            similarity = count / (len(grams) + self.trigram_counts[candidate] - count)
+            if similarity >= MIN_SIMILARITY:
+                similar.append((similarity, candidate))
+        similar.sort(reverse=True)
+        return {candidate: similarity * FUZZY_WEIGHT for similarity, candidate in similar[:MAX_EXPANSIONS]}
+
+    def search(self, query: str, limit: int) -> List[int]:
+        """
+        Rows ranked by how many query words they match, then by weighted score
+
+        A word's score is its match weight times its idf, so rare words
+        count for more. The last query word also matches as a prefix, since
+        it is usually still being typed.
+
+        Candidate rows come from the rarer query words only. They are
+        visited best first by what the rare words score, and looked up in
+        the postings of the common words, until no remaining row can still
+        reach the top limit. A short page is filled with rows that match
+        only common words, in row order.
+        """
+        words = _WORD.findall(query.lower())
+        expansions = [self.expand(word, prefix=i == len(words) - 1) for i, word in enumerate(words)]
+        expansions = [expansion for expansion in expansions if expansion]
+        if not expansions or limit < 1:
+            return []
+        if len(expansions) == 1:
+            return self._top_rows(expansions[0], limit)
+
+        rows_matched = [sum(len(self.postings[word_id]) for word_id in expansion) for expansion in expansions]
+        expansions = [expansions[i] for i in sorted(range(len(expansions)), key=rows_matched.__getitem__)]
+        rare = max(1, sum(1 for rows in rows_matched if rows <= COMMON_WORD_FRACTION * self.row_count))
+
+        if rare == 1:
+            candidates = ((1, score, row) for score, row in self._ranked_postings(expansions[0]))
+        else:
+            counts: Dict[int, int] = {}
+            scores: Dict[int, float] = {}
+            for expansion in expansions[:rare]:
+                for row, score in self._row_scores(expansion).items():
+                    counts[row] = counts.get(row, 0) + 1
+                    scores[row] = scores.get(row, 0.0) + score
+            candidates = ((counts[row], scores[row], row)
+                          for row in sorted(counts, key=lambda row: (-counts[row], -scores[row], row)))
+
+        # Each common word's postings, best scoring first
+        common = [
+            sorted(((weight * self.idf[word_id], self.postings[word_id]) for word_id, weight in expansion.items()),
+                   key=lambda posting: -posting[0])
+            for expansion in expansions[rare:]
+        ]
+
+        # Min-heap of (words matched, score, -row), its head is the worst row kept
+        top: List[Tuple[int, float, int]] = []
+        for count, score, row in candidates:
+            best = score
+            for postings in common:
+                best += postings[0][0]
+            if len(top) == limit and (count + len(common), best, -row) < top[0]:
+                break  # Rows are visited by their best possible rank, none left can make the page
+            for postings in common:
+                matched = self._posting_score(postings, row)
+                if matched:
+                    count += 1
+                    score += matched
+            if len(top) < limit:
+                heapq.heappush(top, (count, score, -row))
+            elif (count, score, -row) > top[0]:
+                heapq.heapreplace(top, (count, score, -row))
+
+        ranked = [-row for _, _, row in sorted(top, reverse=True)]
+        if len(ranked) < limit:
+            seen = set(ranked)
+            for postings in common:
+                for _, rows in postings:
+                    for row in rows:
+                        if row not in seen:
+                            seen.add(row)
+                            ranked.append(row)
+                            if len(ranked) == limit:
+                                return ranked
+        return ranked
+
+    def _ranked_postings(self, expansion: Dict[int, float]) -> Iterator[Tuple[float, int]]:
+        """(score, row) of each row containing one of the expanded words, best first, without scoring every row"""
+        seen = set()
+        postings = [zip(repeat(-weight * self.idf[word_id]), self.postings[word_id])
+                    for word_id, weight in expansion.items()]
+        for negated, row in heapq.merge(*postings):
+            if row not in seen:
+                seen.add(row)
+                yield -negated, row
+
+    @staticmethod
+    def _posting_score(postings: List[Tuple[float, array]], row: int) -> float:
+        """Score of the first of a word's expanded postings containing row, 0 if none does"""
+        for score, rows in postings:
+            position = bisect_left(rows, row)
+            if position < len(rows) and rows[position] == row:
+                return score
+        return 0.0
+
+    def _row_scores(self, expansion: Dict[int, float]) -> Dict[int, float]:
+        """Best score of each row containing one of the expanded words"""
+        scores: Dict[int, float] = {}
+        # Ascending, so a row keeps the score of its best word
+        for word_id, score in sorted(((w, weight * self.idf[w]) for w, weight in expansion.items()),
+                                     key=lambda item: item[1]):
+            scores.update(dict.fromkeys(self.postings[word_id], score))
+        return scores
+
+    def _top_rows(self, expansion: Dict[int, float], limit: int) -> List[int]:
+        """Best rows for a single word, read off its postings without scoring every row"""
+        rows: Dict[int, None] = {}
+        for word_id in sorted(expansion, key=lambda w: -expansion[w] * self.idf[w]):
+            for row in self.postings[word_id]:
+                rows.setdefault(row)
+                if len(rows) == limit:
+                    return list(rows)
+        return list(rows)
+
+
+class MappedDescriptionIndex(DescriptionIndex):
+    """
+    DescriptionIndex read from the sections of a compiled index file
+
+    Postings, idf and trigram tables are views into the mapped file, so no
+    process builds or holds its own copy. Words and trigrams are found by
+    bisecting their sorted blobs instead of through dicts.
+    """
+
+    def __init__(self, row_count: int, words: Sequence[str], postings: Sequence[Sequence[int]],
+                 idf: Sequence[float], trigram_counts: Sequence[int], trigrams: Sequence[str],
+                 trigram_words: Sequence[Sequence[int]]):
+        self.row_count = row_count
+        self.words = words
+        self.postings = postings
+        self.idf = idf
+        self.trigram_counts = trigram_counts
+        self.trigrams = trigrams
+        self.trigram_words = trigram_words
+
+    def _word_id(self, word: str) -> Optional[int]:
+        return _find(self.words, word)
+
+    def _trigram_word_ids(self, gram: str) -> Sequence[int]:
+        position = _find(self.trigrams, gram)
+        return () if position is None else self.trigram_words[position]
+
+
+def _find(values: Sequence, value) -> Optional[int]:
+    """Position of value in sorted values, None if absent"""
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        return position
+    return None
+
+
+class ICDCodeIndex:
+    """
+    ICD-10 code table held as two parallel lists sorted by code
+
+    A prefix search is a bisect to the first code not below the prefix
+    followed by a walk while codes still match, so it touches only the rows
+    it returns. The table is re-read when the CSV's mtime changes.
+    """
+
+    def __init__(self, path=CODES_CSV):
+        self.path = Path(path)
+        self.codes: List[str] = []
+        self.descriptions: List[str] = []
+        self.mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._descriptions_index: Optional[DescriptionIndex] = None
+        self.load()
+
+    def load(self) -> None:
+        mtime = os.stat(self.path).st_mtime
+        rows = read_codes_csv(self.path)
+        # Swapped in together so concurrent searches see one table or the other
+        self.codes, self.descriptions, self.mtime, self._descriptions_index = (
+            [code for code, _ in rows], [desc for _, desc in rows], mtime, None
+        )
+        logger.info(f"Loaded {len(rows)} ICD codes from {self.path}")
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False  # Keep serving the table already loaded
+        if mtime == self.mtime:
+            return False
+        with self._lock:
+            if mtime != self.mtime:
+                self.load()
+        return True
+
+    def row(self, position: int) -> Tuple[str, str]:
+        return self.codes[position], self.descriptions[position]
+
+    @property
+    def descriptions_index(self) -> DescriptionIndex:
+        """Built on the first ranked search, once per loaded table"""
+        if self._descriptions_index is None:
+            with self._lock:
+                if self._descriptions_index is None:
+                    self._descriptions_index = DescriptionIndex(
+                        [self.row(position)[1] for position in range(len(self))]
+                    )
+        return self._descriptions_index
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, str]]:
+        """
+        Ranked (code, description) pairs for a code or free text query
+
+        Codes starting with the query come first, then descriptions ranked
+        by DescriptionIndex, which also matches misspelled words.
+        """
+        results = self.search_prefix(query.strip().upper(), limit)
+        if len(results) < limit:
+            seen = {code for code, _ in results}
+            for position in self.descriptions_index.search(query, limit + len(results)):
+                code, description = self.row(position)
+                if code not in seen:
+                    results.append((code, description))
+                if len(results) == limit:
+                    break
+        return results
+
+    def search_prefix(self, prefix: str, limit: int = 5) -> List[Tuple[str, str]]:
+        """(code, description) pairs of up to limit codes starting with prefix, in code order"""
+        codes, descriptions = self.codes, self.descriptions
+        results = []
+        position = bisect_left(codes, prefix)
+        while position < len(codes) and len(results) < limit and codes[position].startswith(prefix):
+            results.append((codes[position], descriptions[position]))
+            position += 1
+        return results
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class _MappedStrings(Sequence):
+    """Read-only sequence over a blob of byte strings delimited by an offsets array"""
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> bytes:
+        return bytes(self.blob[self.offsets[position]:self.offsets[position + 1]])
+
+
+class _MappedText(_MappedStrings):
+    """_MappedStrings decoded, for sorted ASCII words compared with str"""
+
+    def __getitem__(self, position: int) -> str:
+        return super().__getitem__(position).decode()
+
+
+class _MappedArrays(Sequence):
+    """Read-only sequence of uint32 runs in one array, delimited by an offsets array"""
+
+    def __init__(self, values: memoryview, offsets: memoryview):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> memoryview:
+        return self.values[self.offsets[position]:self.offsets[position + 1]]
+
+
+class MappedICDCodeIndex(ICDCodeIndex):
+    """
+    ICD-10 code table read straight from a compiled, memory-mapped index file
+
+    The file is mapped read-only, so every worker process shares one page
+    cache copy and opening it needs no parsing. The description postings
+    are compiled into the same file and mapped as a MappedDescriptionIndex,
+    so ranked searches build nothing per process either. Searches behave
+    exactly like ICDCodeIndex. build_index_file replaces the file atomically, so a
+    changed mtime means a complete new file to map.
+    """
+
+    def __init__(self, path=CODES_INDEX):
+        super().__init__(path)
+
+    def load(self) -> None:
+        with open(self.path, 'rb') as file:
+            mtime = os.fstat(file.fileno()).st_mtime
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, byteorder, count, section_count = INDEX_HEADER.unpack_from(mapped)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{self.path} is not an ICD index file of version {INDEX_VERSION}")
+        if byteorder != sys.byteorder[:1].encode():
+            raise ValueError(f"{self.path} was built on a machine with a different byte order")
+
+        view = memoryview(mapped)
+        sections = []
+        position = INDEX_HEADER.size + section_count * INDEX_SECTION.size
+        for number in range(section_count):
+            size, = INDEX_SECTION.unpack_from(mapped, INDEX_HEADER.size + number * INDEX_SECTION.size)
+            sections.append(view[position:position + size])
+            position += _padded(size)
+
+        (code_offsets, description_offsets, codes_blob, descriptions_blob, word_offsets, words_blob,
+         posting_offsets, postings, idf, trigram_counts, trigram_offsets, trigrams_blob,
+         trigram_word_offsets, trigram_words) = sections
+        descriptions_index = MappedDescriptionIndex(
+            count,
+            _MappedText(words_blob, word_offsets.cast('I')),
+            _MappedArrays(postings.cast('I'), posting_offsets.cast('I')),
+            idf.cast('d'),
+            trigram_counts.cast('H'),
+            _MappedText(trigrams_blob, trigram_offsets.cast('I')),
+            _MappedArrays(trigram_words.cast('I'), trigram_word_offsets.cast('I'))
+        )
+
+        # Swapped in together so concurrent searches see one file or the other
+        self.codes, self.descriptions, self.mtime, self._descriptions_index = (
+            _MappedStrings(codes_blob, code_offsets.cast('I')),
+            _MappedStrings(descriptions_blob, description_offsets.cast('I')),
+            mtime, descriptions_index
+        )
+        logger.info(f"Mapped {count} ICD codes from {self.path}")
+
+    def row(self, position: int) -> Tuple[str, str]:
+        return self.codes[position].decode(), self.descriptions[position].decode('utf-8')
+
+    def search_prefix(self, prefix: str, limit: int = 5) -> List[Tuple[str, str]]:
+        """(code, description) pairs of up to limit codes starting with prefix, in code order"""
+        codes, descriptions = self.codes, self.descriptions
+        key = prefix.encode()
+        results = []
+        position = bisect_left(codes, key)
+        while position < len(codes) and len(results) < limit and codes[position].startswith(key):
+            results.append((codes[position].decode(), descriptions[position].decode('utf-8')))
+            position += 1
+        return results
+
+
+def read_codes_csv(path) -> List[Tuple[str, str]]:
+    """(code, description) rows of a codes.csv file, sorted by code"""
+    with open(path, 'r', encoding='utf-8') as file:
+        csv_reader = csv.reader(file)
+        next(csv_reader)  # Skip header row
+        return sorted((row[CODE_COLUMN], row[DESCRIPTION_COLUMN]) for row in csv_reader if row)
+
+
+def _blob(values: Iterator[bytes]) -> Tuple[array, bytes]:
+    offsets, chunks, size = array('I', [0]), [], 0
+    for value in values:
+        chunks.append(value)
+        size += len(value)
+        offsets.append(size)
+    return offsets, b''.join(chunks)
+
+
+def _concatenated(runs: Iterator[array]) -> Tuple[array, array]:
+    offsets, values = array('I', [0]), array('I')
+    for run in runs:
+        values.extend(run)
+        offsets.append(len(values))
+    return offsets, values
+
+
+def _padded(size: int) -> int:
+    return -(-size // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+
+
+def build_index_file(source=CODES_CSV, output=CODES_INDEX) -> int:
+    """
+    Compile codes.csv into the binary index MappedICDCodeIndex reads
+
+    Layout: header, section lengths, then the sections, each padded to
+    INDEX_ALIGNMENT: code and description offsets and blobs, followed by the
+    DescriptionIndex of the descriptions (words, postings, idf, trigram
+    counts, trigrams and the word ids of each trigram). Offsets are native
+    uint32s with one entry more than the strings or runs they delimit. The
+    file is written beside output and renamed into place. Returns the
+    number of codes written.
+    """
+    rows = read_codes_csv(source)
+    code_offsets, codes_blob = _blob(code.encode() for code, _ in rows)
+    description_offsets, descriptions_blob = _blob(description.encode('utf-8') for _, description in rows)
+    descriptions_index = DescriptionIndex([description for _, description in rows])
+    word_offsets, words_blob = _blob(word.encode() for word in descriptions_index.words)
+    posting_offsets, postings = _concatenated(descriptions_index.postings)
+    trigrams = sorted(descriptions_index.trigram_words)
+    trigram_offsets, trigrams_blob = _blob(gram.encode() for gram in trigrams)
+    trigram_word_offsets, trigram_words = _concatenated(descriptions_index.trigram_words[gram] for gram in trigrams)
+
+    sections = [
+        code_offsets.tobytes(), description_offsets.tobytes(), codes_blob, descriptions_blob,
+        word_offsets.tobytes(), words_blob, posting_offsets.tobytes(), postings.tobytes(),
+        descriptions_index.idf.tobytes(), descriptions_index.trigram_counts.tobytes(),
+        trigram_offsets.tobytes(), trigrams_blob, trigram_word_offsets.tobytes(), trigram_words.tobytes()
+    ]
+
+    output = Path(output)
+    partial = output.with_suffix('.tmp')
+    with open(partial, 'wb') as file:
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, sys.byteorder[:1].encode(),
+                                     len(rows), len(sections)))
+        for section in sections:
+            file.write(INDEX_SECTION.pack(len(section)))
+        for section in sections:
+            file.write(section)
+            file.write(bytes(_padded(len(section)) - len(section)))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(partial, output)
+    return len(rows)
+
+
+def get_icd_index():
+    """
+    Code index of this process, loaded on first use and reloaded on change
+
+    The compiled index file is mapped when it exists, otherwise codes.csv
+    is parsed into an ICDCodeIndex. While the CSV is served the index file
+    is checked on every call, so running build_icd_index takes effect
+    without a restart. A file that cannot be mapped is only retried once
+    its mtime changes.
+    """
+    global _index, _index_file_mtime
+    index = _index
+    if isinstance(index, MappedICDCodeIndex):
+        index.reload_if_changed()
+        return index
+
+    mtime = _mtime(CODES_INDEX)
+    if index is None or mtime != _index_file_mtime:
+        with _index_lock:
+            if _index is None or (not isinstance(_index, MappedICDCodeIndex) and mtime != _index_file_mtime):
+                _index_file_mtime = mtime
+                if mtime is not None:
+                    try:
+                        _index = MappedICDCodeIndex(CODES_INDEX)
+                        return _index
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Cannot map {CODES_INDEX}, serving {CODES_CSV}: {str(e)}")
+                if _index is None:
+                    _index = ICDCodeIndex(CODES_CSV)
+                    return _index
+            index = _index
+    index.reload_if_changed()
+    return index
+
+
+def _mtime(path) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
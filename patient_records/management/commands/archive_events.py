@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from patient_records.models import EventStore
+from patient_records.event_sourcing.archive import EventArchive
+import datetime
+
+class Command(BaseCommand):
+    help = 'Moves events older than a month into compressed, append-only archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True,
+                            help='Archive events from months before this one (YYYY-MM)')
+        parser.add_argument('--delete-batch-size', type=int, default=1000,
+                            help='Rows deleted from the event store per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be archived without writing anything')
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = datetime.datetime.strptime(options['before'], '%Y-%m')
+        except ValueError:
+            raise CommandError('--before must be in YYYY-MM format')
+        cutoff = timezone.make_aware(cutoff)
+
+        archive = EventArchive()
+        if archive.directory is None:
+            raise CommandError('EVENT_ARCHIVE_DIR is not configured')
+
+        # Each aggregate keeps its latest event in the table so version
+        # allocation never has to look at the archive.
+        latest_version = (EventStore.objects
+                          .filter(aggregate_id=OuterRef('aggregate_id'))
+                          .order_by('-version')
+                          .values('version')[:1])
+        archivable = (EventStore.objects
+                      .filter(timestamp__lt=cutoff)
+                      .exclude(version=Subquery(latest_version)))
+
+        months = (archivable
+                  .annotate(month=TruncMonth('timestamp'))
+                  .order_by('month')
+                  .values_list('month', flat=True)
+                  .distinct())
+
+        for month_start in months:
+            month = month_start.strftime('%Y-%m')
+            month_end = (month_start + datetime.timedelta(days=32)).replace(day=1)
+            events = (archivable
+                      .filter(timestamp__gte=month_start, timestamp__lt=month_end)
+                      .order_by('aggregate_id', 'version'))
+
+            if options['dry_run']:
+                self.stdout.write(f'{month}: {events.count()} events')
+                continue
+
+            path, archived_ids = archive.write_segment(month, events.iterator(chunk_size=2000))
+            if path is None:
+                continue
+
+            batch_size = options['delete_batch_size']
+            for start in range(0, len(archived_ids), batch_size):
+                with transaction.atomic():
+                    EventStore.objects.filter(id__in=archived_ids[start:start + batch_size]).delete()
+
+            self.stdout.write(f'{month}: archived {len(archived_ids)} events to {path.name}')
+
+        self.stdout.write(self.style.SUCCESS('Archive complete'))
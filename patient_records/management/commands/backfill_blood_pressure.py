@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from patient_records.vitals import backfill_blood_pressure
+
+class Command(BaseCommand):
+    help = 'Fills Vitals systolic/diastolic from blood_pressure for rows saved before those columns existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows read and updated per query')
+
+    def handle(self, *args, **options):
+        updated = backfill_blood_pressure(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Backfilled blood pressure on {updated} vitals'))
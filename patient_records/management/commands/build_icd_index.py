@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from patient_records.icd_index import CODES_CSV, CODES_INDEX, build_index_file
+
+class Command(BaseCommand):
+    help = 'Compiles codes.csv into the memory-mapped index the ICD lookup serves from'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(CODES_CSV), help='Code table to compile')
+        parser.add_argument('--output', default=str(CODES_INDEX), help='Index file to write')
+
+    def handle(self, *args, **options):
+        try:
+            count = build_index_file(options['source'], options['output'])
+        except FileNotFoundError as e:
+            raise CommandError(f'Code table not found: {e.filename}')
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} ICD codes into {options['output']}"))
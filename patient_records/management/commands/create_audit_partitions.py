@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from patient_records.audit_partitions import ensure_audit_partitions, is_partitioned
+
+class Command(BaseCommand):
+    help = 'Creates the monthly AuditTrail partitions for the coming months, run it at least monthly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Months past the current one to create partitions for')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write('AuditTrail is not partitioned on this database, nothing to do')
+            return
+        created = ensure_audit_partitions(options['months_ahead'])
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} audit partitions'))
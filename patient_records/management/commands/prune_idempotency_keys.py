@@ -0,0 +1,15 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from patient_records.event_sourcing.idempotency import prune_idempotency_keys
+
+class Command(BaseCommand):
+    help = 'Deletes idempotency keys older than the retention window (IDEMPOTENCY_KEY_TTL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int,
+                            help='Retention in seconds, overrides IDEMPOTENCY_KEY_TTL')
+
+    def handle(self, *args, **options):
+        older_than = options['older_than']
+        deleted = prune_idempotency_keys(timedelta(seconds=older_than) if older_than else None)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,91 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from django.core.management.base import BaseCommand
+import multiprocessing
+import os
+import time
+
+# Workers are spawned rather than forked so they never inherit the parent's
+# database connection. They import this module before Django is set up,
+# which is why the app modules are imported lazily.
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _rebuild_chunk(aggregate_ids, projections, event_chunk_size):
+    from patient_records.event_sourcing.rebuild import ProjectionRebuilder
+    return ProjectionRebuilder(projections, chunk_size=event_chunk_size).rebuild(aggregate_ids)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the read models from the event store using a process pool'
+
+    def add_arguments(self, parser):
+        from patient_records.event_sourcing.rebuild import PROJECTIONS
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes, 1 rebuilds in this process')
+        parser.add_argument('--aggregates-per-task', type=int, default=200,
+                            help='Aggregates rebuilt and written per transaction')
+        parser.add_argument('--event-chunk-size', type=int, default=500,
+                            help='Events fetched per page while streaming an aggregate')
+        parser.add_argument('--projection', action='append', choices=PROJECTIONS,
+                            help='Projection to rebuild, repeatable (default: all)')
+
+    def handle(self, *args, **options):
+        from patient_records.event_sourcing.rebuild import PROJECTIONS
+        projections = options['projection'] or list(PROJECTIONS)
+        workers = max(1, options['workers'])
+        chunks = self._aggregate_chunks(options['aggregates_per_task'])
+        event_chunk_size = options['event_chunk_size']
+
+        self.stdout.write(f"Rebuilding {', '.join(projections)} with {workers} worker(s)...")
+        self.started = time.monotonic()
+        self.aggregates = 0
+        self.events = 0
+
+        if workers == 1:
+            for chunk in chunks:
+                self._report(*_rebuild_chunk(chunk, projections, event_chunk_size))
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+                pending = set()
+                for chunk in chunks:
+                    # Keep a bounded number of chunks in flight
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._report(*future.result())
+                    pending.add(pool.submit(_rebuild_chunk, chunk, projections, event_chunk_size))
+                for future in wait(pending).done:
+                    self._report(*future.result())
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {self.aggregates} aggregates from {self.events} events in {elapsed:.1f}s'
+        ))
+
+    def _aggregate_chunks(self, size):
+        from patient_records.models import EventStore
+        chunk = []
+        aggregate_ids = (EventStore.objects
+                         .order_by('aggregate_id')
+                         .values_list('aggregate_id', flat=True)
+                         .distinct()
+                         .iterator(chunk_size=size * 10))
+        for aggregate_id in aggregate_ids:
+            chunk.append(str(aggregate_id))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _report(self, aggregates, events):
+        self.aggregates += aggregates
+        self.events += events
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(
+            f'Processed {self.aggregates} aggregates, {self.events} events '
+            f'({self.events / elapsed:.0f} events/s)'
+        )
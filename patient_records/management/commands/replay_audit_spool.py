@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from patient_records.audit_writer import replay_spool
+
+class Command(BaseCommand):
+    help = 'Writes audit entries left in AUDIT_SPOOL_DIR by a background writer that stopped early'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool-dir', help='Spool directory, overrides AUDIT_SPOOL_DIR')
+
+    def handle(self, *args, **options):
+        replayed = replay_spool(options['spool_dir'])
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} spooled audit entries'))
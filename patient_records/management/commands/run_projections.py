@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from patient_records.event_sourcing.projections import ProjectionRunner
+
+class Command(BaseCommand):
+    help = 'Applies outbox events to the read models (use with EVENT_PROJECTION_MODE = "async")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Maximum events applied per projection per transaction')
+        parser.add_argument('--poll-interval', type=float, default=0.5,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--max-poll-interval', type=float, default=10.0,
+                            help='Upper bound for the idle back-off')
+        parser.add_argument('--gap-timeout', type=float, default=5.0,
+                            help='Seconds before an outbox id gap without a horizon is treated as a rollback, '
+                                 'must exceed the longest write transaction')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Failed attempts at one event before it is skipped')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        runner = ProjectionRunner(
+            batch_size=options['batch_size'],
+            gap_timeout=options['gap_timeout'],
+            max_attempts=options['max_attempts']
+        )
+
+        if options['once']:
+            total = 0
+            while True:
+                processed = runner.run_once()
+                if not processed:
+                    break
+                total += processed
+            self.stdout.write(self.style.SUCCESS(f'Processed {total} outbox rows'))
+            for name, lag in runner.lag().items():
+                self.stdout.write(f'{name}: {lag} pending')
+            return
+
+        self.stdout.write('Running projections, press Ctrl+C to stop...')
+        try:
+            runner.run_forever(
+                poll_interval=options['poll_interval'],
+                max_poll_interval=options['max_poll_interval']
+            )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped projection runner')
@@ -0,0 +1,15 @@
+from patient_records.audit import audit_scope
+
+class AuditMiddleware:
+    """Writes every audit entry of a request with one bulk insert when it ends"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit_scope() as buffer:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                buffer.user = user
+        return response
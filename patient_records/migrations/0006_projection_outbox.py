@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-16 20:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0005_provider_model_updates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectionOutbox',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('aggregate_type', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patient_records.eventstore')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['aggregate_type', 'id'], name='patient_rec_aggrega_ab63ec_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:01
+
+from django.db import migrations, models
+
+SEQUENCE = 'patient_records_eventstore_position_seq'
+
+def backfill_positions(apps, schema_editor):
+    EventStore = apps.get_model('patient_records', 'EventStore')
+    connection = schema_editor.connection
+    table = EventStore._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}")
+            cursor.execute(f"""
+                UPDATE {table} AS e SET position = ordered.rn
+                FROM (
+                    SELECT id, row_number() OVER (ORDER BY timestamp, aggregate_id, version) AS rn
+                    FROM {table}
+                ) AS ordered
+                WHERE e.id = ordered.id
+            """)
+            cursor.execute(
+                f"SELECT setval('{SEQUENCE}', COALESCE((SELECT MAX(position) FROM {table}), 0) + 1, false)"
+            )
+        return
+
+    events = EventStore.objects.order_by('timestamp', 'aggregate_id', 'version').only('id')
+    for position, event in enumerate(events.iterator(), start=1):
+        EventStore.objects.filter(id=event.id).update(position=position)
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP SEQUENCE IF EXISTS {SEQUENCE}")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0006_projection_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventstore',
+            name='position',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_positions, drop_sequence),
+    ]
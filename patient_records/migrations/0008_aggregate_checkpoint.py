@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0007_eventstore_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregateCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aggregate_id', models.UUIDField()),
+                ('version', models.IntegerField()),
+                ('timestamp', models.DateTimeField()),
+                ('state', models.JSONField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['aggregate_id', 'timestamp'], name='patient_rec_aggrega_a3c170_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='aggregatecheckpoint',
+            constraint=models.UniqueConstraint(fields=('aggregate_id', 'version'), name='unique_checkpoint_version'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:24
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0009_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='audittrail',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        # Added without a default first, so existing rows keep NULL instead of sharing one UUID
+        migrations.AddField(
+            model_name='audittrail',
+            name='entry_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='audittrail',
+            name='entry_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:41
+
+from django.db import migrations, models
+import datetime
+import uuid
+
+TABLE = 'patient_records_audittrail'
+UNPARTITIONED = f'{TABLE}_unpartitioned'
+# Partitions created past the current month, `manage.py create_audit_partitions` adds later ones
+MONTHS_AHEAD = 3
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def partition_audit_trail(apps, schema_editor):
+    """
+    Rebuild the audit table as a partitioned table with one partition per month
+
+    Indexes and foreign key and unique constraints are carried over under
+    their names, the primary key becomes (id, timestamp) as PostgreSQL
+    requires the partition key in it.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s))",
+            [TABLE, TABLE]
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype IN ('f', 'u')",
+            [TABLE]
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(f'SELECT MIN("timestamp"), MAX(id) FROM {TABLE}')
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {UNPARTITIONED}")
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {UNPARTITIONED}) PARTITION BY RANGE ("timestamp")')
+
+        today = datetime.date.today()
+        month = datetime.date((oldest or today).year, (oldest or today).month, 1)
+        last = _add_months(datetime.date(today.year, today.month, 1), MONTHS_AHEAD)
+        while month <= last:
+            upper = _add_months(month, 1)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_y{month.year}m{month.month:02d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+            )
+            month = upper
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {UNPARTITIONED}")
+        cursor.execute(f"DROP TABLE {UNPARTITIONED}")
+
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, "timestamp")')
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        for definition in index_defs:
+            cursor.execute(definition)
+
+        cursor.execute(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        cursor.execute(f"SELECT setval('{TABLE}_id_seq', %s, false)", [(max_id or 0) + 1])
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0010_audittrail_entry_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='audittrail',
+            name='entry_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='audittrail',
+            constraint=models.UniqueConstraint(fields=('entry_id', 'timestamp'), name='unique_audit_entry'),
+        ),
+        migrations.AddIndex(
+            model_name='audittrail',
+            index=models.Index(fields=['patient', '-timestamp', '-id'], name='audit_patient_history_idx'),
+        ),
+        # Reversing leaves the table partitioned
+        migrations.RunPython(partition_audit_trail, migrations.RunPython.noop),
+    ]
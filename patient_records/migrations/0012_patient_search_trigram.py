@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:02
+
+from django.db import migrations
+
+TABLE = 'patient_records_patient'
+SEARCH_FIELDS = ('first_name', 'middle_name', 'last_name', 'patient_number')
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    GIN trigram indexes on UPPER(column), the expression icontains filters on
+
+    Only PostgreSQL has pg_trgm, other databases keep scanning.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for field in SEARCH_FIELDS:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS patient_{field}_trgm "
+                f"ON {TABLE} USING gin (UPPER({field}::text) gin_trgm_ops)"
+            )
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            for field in SEARCH_FIELDS:
+                cursor.execute(f"DROP INDEX IF EXISTS patient_{field}_trgm")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0011_audittrail_partitioning'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
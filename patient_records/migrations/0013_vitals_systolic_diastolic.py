@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0012_patient_search_trigram'),
+    ]
+
+    # Existing rows are left NULL here, `manage.py backfill_blood_pressure`
+    # fills them in chunks without holding one long transaction
+    operations = [
+        migrations.AddField(
+            model_name='vitals',
+            name='systolic',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='vitals',
+            name='diastolic',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='vitals',
+            index=models.Index(fields=['systolic', 'date'], name='vitals_systolic_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vitals',
+            index=models.Index(fields=['diastolic', 'date'], name='vitals_diastolic_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0013_vitals_systolic_diastolic'),
+    ]
+
+    # Existing rows keep NULL and fall back to the gap timeout
+    operations = [
+        migrations.AddField(
+            model_name='eventstore',
+            name='horizon',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectionoutbox',
+            name='horizon',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_records', '0014_event_horizon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectioncheckpoint',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
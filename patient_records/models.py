@@ -4,10 +4,10 @@ import datetime
 import uuid
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import transaction
+from django.db import transaction, connection
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from .event_sourcing.models import EventStore
+from .event_sourcing.models import EventStore, ProjectionOutbox, ProjectionCheckpoint, AggregateCheckpoint, IdempotencyKey
 from .event_sourcing.services import EventStoreService
 from .event_sourcing.constants import CLINICAL_AGGREGATE, SYMPTOMS_ADDED, SYMPTOMS_UPDATED, PATIENT_AGGREGATE, PATIENT_REGISTERED, PATIENT_UPDATED
 import logging
@@ -27,6 +27,29 @@ class PatientReadModel(models.Model):
             models.Index(fields=['last_updated'])
         ]
 
+    @classmethod
+    def upsert(cls, patient_id, current_data: dict, last_updated) -> None:
+        """
+        Create the read model or replace its data and bump its version
+
+        Runs as a single INSERT ... ON CONFLICT statement (PostgreSQL and
+        SQLite 3.24+), so no read is needed first.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        fields = [cls._meta.get_field(name) for name in ('id', 'current_data', 'last_updated')]
+        params = [
+            field.get_db_prep_value(value, connection)
+            for field, value in zip(fields, (patient_id, current_data, last_updated))
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (id, current_data, last_updated, version) "
+                f"VALUES (%s, %s, %s, 1) "
+                f"ON CONFLICT (id) DO UPDATE SET current_data = EXCLUDED.current_data, "
+                f"last_updated = EXCLUDED.last_updated, version = {table}.version + 1",
+                params
+            )
+
 class ClinicalReadModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     patient_id = models.UUIDField()
@@ -191,63 +214,45 @@ class Patient(models.Model):
         return f"{self.first_name} {self.last_name} ({self.patient_number})"
 
     def save(self, *args, **kwargs):
+        """
+        Save the row, its event and its read model as one unit of work
+
+        The row insert or update, the event append, the read-model upsert
+        and the post_save audit record commit together. A new patient is
+        appended with expected_version=0, which skips the version lookup.
+        """
         is_new = self._state.adding
-        
-        # Create or update the read model
-        patient_data = {
-            'first_name': self.first_name,
-            'middle_name': self.middle_name,
-            'last_name': self.last_name,
-            'date_of_birth': self.date_of_birth.isoformat() if self.date_of_birth else None,
-            'gender': self.gender,
-            'address': self.address,
-            'phone': self.phone,
-            'email': self.email,
-            'emergency_contact': self.emergency_contact,
-            'insurance_info': self.insurance_info,
-            'patient_number': self.patient_number,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-        }
 
         try:
-            if is_new:
-                event_type = 'patient_created'
-                event_data = {
-                    'patient_data': patient_data
-                }
-            else:
-                event_type = 'patient_updated'
-                event_data = {
-                    'patient_data': patient_data
-                }
-
-            # Save the model first to get the ID if it's new
-            super().save(*args, **kwargs)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
 
-            # Now we can safely use self.id
-            event_store = EventStoreService()
-            event_store.append_event(
-                aggregate_id=str(self.id),
-                aggregate_type='patient',
-                event_type=event_type,
-                event_data=event_data
-            )
+                # Built after the save so auto fields such as created_at are set
+                patient_data = {
+                    'first_name': self.first_name,
+                    'middle_name': self.middle_name,
+                    'last_name': self.last_name,
+                    'date_of_birth': self.date_of_birth.isoformat() if self.date_of_birth else None,
+                    'gender': self.gender,
+                    'address': self.address,
+                    'phone': self.phone,
+                    'email': self.email,
+                    'emergency_contact': self.emergency_contact,
+                    'insurance_info': self.insurance_info,
+                    'patient_number': self.patient_number,
+                    'created_at': self.created_at.isoformat() if self.created_at else None,
+                }
 
-            # Create or update the read model
-            try:
-                read_model = PatientReadModel.objects.get(id=self.id)
-                read_model.current_data = patient_data
-                read_model.last_updated = timezone.now()
-                read_model.version += 1
-                read_model.save()
-            except PatientReadModel.DoesNotExist:
-                PatientReadModel.objects.create(
-                    id=self.id,
-                    current_data=patient_data,
-                    last_updated=timezone.now(),
-                    version=1
+                event = EventStoreService().append_event(
+                    aggregate_id=str(self.id),
+                    aggregate_type='patient',
+                    event_type='patient_created' if is_new else 'patient_updated',
+                    event_data={'patient_data': patient_data},
+                    expected_version=0 if is_new else None
                 )
 
+                PatientReadModel.upsert(self.id, patient_data, event.timestamp)
+
         except Exception as e:
             logger.error(f"Error saving patient record: {str(e)}", 
                         extra={
@@ -306,11 +311,24 @@ class Visits(models.Model):
     def __str__(self):
         return f"{self.visit_type} - {self.date}"
 
+def parse_blood_pressure(value):
+    """(systolic, diastolic) from a "120/80" reading, (None, None) when it cannot be read"""
+    try:
+        systolic, diastolic = (int(part) for part in str(value).split('/'))
+    except (TypeError, ValueError):
+        return None, None
+    if not (0 <= systolic <= 32767 and 0 <= diastolic <= 32767):
+        return None, None
+    return systolic, diastolic
+
 class Vitals(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     date = models.DateField()
     blood_pressure = models.CharField(max_length=20)
+    # Parsed from blood_pressure on save, `manage.py backfill_blood_pressure` fills older rows
+    systolic = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    diastolic = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     temperature = models.FloatField()
     spo2 = models.FloatField()
     pulse = models.IntegerField()
@@ -325,12 +343,21 @@ class Vitals(models.Model):
         verbose_name_plural = "vitals"
         ordering = ['-date']
         indexes = [
-            models.Index(fields=['patient', '-date'])
+            models.Index(fields=['patient', '-date']),
+            models.Index(fields=['systolic', 'date'], name='vitals_systolic_idx'),
+            models.Index(fields=['diastolic', 'date'], name='vitals_diastolic_idx'),
         ]
 
     def __str__(self):
         return f"Vitals - {self.date}"
 
+    def save(self, *args, **kwargs):
+        self.systolic, self.diastolic = parse_blood_pressure(self.blood_pressure)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'blood_pressure' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'systolic', 'diastolic'}
+        super().save(*args, **kwargs)
+
 class CmpLabs(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
@@ -642,15 +669,27 @@ class AuditTrail(models.Model):
     )
     record_type = models.CharField(max_length=20)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the change is recorded, which can be earlier than the insert
+    timestamp = models.DateTimeField(default=timezone.now)
     previous_values = models.JSONField(default=dict)
     new_values = models.JSONField(default=dict)
+    # Makes replaying the audit spool idempotent, see unique_audit_entry
+    entry_id = models.UUIDField(default=uuid.uuid4, null=True, editable=False)
 
     class Meta:
         ordering = ['-timestamp']
+        # On PostgreSQL the table is partitioned by month on timestamp, so
+        # unique constraints have to include it (see audit_partitions)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['entry_id', 'timestamp'],
+                name='unique_audit_entry'
+            )
+        ]
         indexes = [
             models.Index(fields=['patient_identifier', '-timestamp']),
-            models.Index(fields=['action', '-timestamp'])
+            models.Index(fields=['action', '-timestamp']),
+            models.Index(fields=['patient', '-timestamp', '-id'], name='audit_patient_history_idx')
         ]
 
     def __str__(self):
@@ -0,0 +1,212 @@
+from typing import List, Optional, Sequence, Tuple
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.utils.functional import cached_property
+import base64
+import json
+import logging
+
+logger = logging.getLogger('patient_records')
+
+
+def estimate_count(queryset) -> Optional[int]:
+    """
+    Row count PostgreSQL expects for a queryset, without counting
+
+    An unfiltered queryset reads pg_class.reltuples, a filtered one the top
+    row estimate of its EXPLAIN plan. None on other databases, or for a
+    table that has never been analyzed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    query = queryset.order_by().query
+    with connection.cursor() as cursor:
+        if not query.where:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+
+        sql, params = query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that counts exactly only while the result is small
+
+    When the planner expects at least ESTIMATED_COUNT_THRESHOLD rows its
+    estimate is used as the count and count_is_estimate is set, so a page
+    costs the estimate and the data query. Smaller results get the usual
+    single COUNT(*).
+    """
+    count_is_estimate = False
+
+    @cached_property
+    def count(self) -> int:
+        threshold = getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', 10000)
+        try:
+            estimate = estimate_count(self.object_list)
+        except Exception as e:
+            logger.warning(f"Could not estimate row count, counting instead: {str(e)}")
+            estimate = None
+        if estimate is not None and estimate >= threshold:
+            self.count_is_estimate = True
+            return estimate
+        return super().count
+
+
+def _cursor_value(value):
+    # isoformat keeps microseconds, which the keyset comparison needs
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+class CursorPage(Sequence):
+    """
+    One page of a CursorPaginator, usable where templates expect a Django Page
+
+    The position of the page is carried in its cursors, so start_index,
+    end_index and number stay correct while paging forwards and backwards.
+    """
+    is_cursor_page = True
+
+    def __init__(self, object_list: List, paginator: 'CursorPaginator', start: int,
+                 has_previous: bool, has_next: bool):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.start = start
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self) -> str:
+        return f"<Cursor page starting at {self.start + 1}>"
+
+    @property
+    def number(self) -> int:
+        return self.start // self.paginator.per_page + 1
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or self._has_previous
+
+    def start_index(self) -> int:
+        return self.start + 1 if self.object_list else 0
+
+    def end_index(self) -> int:
+        return self.start + len(self.object_list)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], 'next', self.start + len(self.object_list))
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], 'previous', self.start)
+
+
+class CursorPaginator(EstimatedCountPaginator):
+    """
+    Keyset paginator over the queryset's ordering plus the primary key
+
+    A page is fetched with a WHERE on the sort columns of the row next to
+    it instead of an OFFSET, so every page costs the same. Cursors are
+    opaque tokens holding those column values; pass next_cursor or
+    previous_cursor of a page back to page() to move. Sort columns must be
+    non-null model fields or annotations with exact values, so no floats:
+    a float does not compare equal after a round trip through the cursor.
+    count is still available, but is only computed when asked for.
+    """
+
+    def __init__(self, object_list, per_page, **kwargs):
+        ordering = list(object_list.query.order_by) or ['-pk']
+        if not {'pk', '-pk', object_list.model._meta.pk.name, f'-{object_list.model._meta.pk.name}'} & set(ordering):
+            ordering.append(('-' if ordering[0].startswith('-') else '') + 'pk')
+        self.keys = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        if any('__' in field or '.' in field for field, _ in self.keys):
+            raise ValueError(f"Cursor pagination needs plain sort fields, got {ordering}")
+        if any(isinstance(self._output_field(object_list, field), FloatField) for field, _ in self.keys):
+            raise ValueError(f"Cursor pagination needs exact sort fields, got a float in {ordering}")
+        super().__init__(object_list.order_by(*ordering), per_page, **kwargs)
+
+    @staticmethod
+    def _output_field(queryset, field: str):
+        if field in queryset.query.annotations:
+            return queryset.query.annotations[field].output_field
+        return queryset.model._meta.pk if field == 'pk' else queryset.model._meta.get_field(field)
+
+    def encode_cursor(self, row, direction: str, start: int) -> str:
+        values = [_cursor_value(getattr(row, field)) for field, _ in self.keys]
+        raw = json.dumps({'v': values, 'd': direction, 'i': start})
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor: str) -> Tuple[List, str, int]:
+        """Raises ValueError for a cursor this paginator did not produce"""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values, direction, start = payload['v'], payload['d'], int(payload['i'])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid page cursor: {cursor}") from e
+        if len(values) != len(self.keys) or direction not in ('next', 'previous'):
+            raise ValueError(f"Invalid page cursor: {cursor}")
+        return values, direction, start
+
+    def _beyond(self, values: List, backwards: bool) -> Q:
+        """Rows after the cursor row in the page order, or before it when backwards"""
+        condition = Q()
+        for position, (field, descending) in enumerate(self.keys):
+            operator = 'lt' if descending != backwards else 'gt'
+            step = Q(**{f'{field}__{operator}': values[position]})
+            for earlier_position, (earlier, _) in enumerate(self.keys[:position]):
+                step &= Q(**{earlier: values[earlier_position]})
+            condition |= step
+        return condition
+
+    def page(self, cursor: Optional[str] = None) -> CursorPage:
+        if not cursor:
+            rows = list(self.object_list[:self.per_page + 1])
+            return CursorPage(rows[:self.per_page], self, 0, False, len(rows) > self.per_page)
+
+        values, direction, start = self.decode_cursor(cursor)
+        if direction == 'next':
+            rows = list(self.object_list.filter(self._beyond(values, backwards=False))[:self.per_page + 1])
+            return CursorPage(rows[:self.per_page], self, start, True, len(rows) > self.per_page)
+
+        reverse = [('' if descending else '-') + field for field, descending in self.keys]
+        rows = list(self.object_list.filter(self._beyond(values, backwards=True))
+                    .order_by(*reverse)[:self.per_page + 1])
+        if not rows:
+            return self.page()
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(rows, self, max(start - len(rows), 0) if has_previous else 0, has_previous, True)
+
+    def get_page(self, cursor: Optional[str] = None) -> CursorPage:
+        """Like page, but an invalid or tampered cursor gives the first page"""
+        try:
+            return self.page(cursor)
+        except (ValueError, ValidationError):
+            return self.page()
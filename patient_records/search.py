@@ -0,0 +1,65 @@
+from functools import reduce
+from operator import add
+from django.db import connections
+from django.db.models import Case, DecimalField, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+# Patient columns a free text search looks at, each has a trigram index on
+# PostgreSQL (see migration 0012)
+SEARCH_FIELDS = ('first_name', 'middle_name', 'last_name', 'patient_number')
+
+# search_rank is rounded to this fixed-point type, so a keyset cursor can
+# carry it and compare it exactly; a float4 similarity does not survive the
+# round trip through a Python float
+RANK_FIELD = DecimalField(max_digits=12, decimal_places=6)
+
+
+def search_patients(queryset, search: str):
+    """
+    Patients matching any search term, most relevant first
+
+    Every term is matched case-insensitively as a substring of any
+    SEARCH_FIELDS column, which the trigram indexes serve on PostgreSQL.
+    Rows are annotated with search_rank, a RANK_FIELD decimal, and ordered
+    by it, ahead of the queryset's existing ordering. Other databases rank by how exactly each
+    term matched instead of by trigram similarity.
+    """
+    terms = search.split()
+    if not terms:
+        return queryset
+
+    match = Q()
+    for term in terms:
+        for field in SEARCH_FIELDS:
+            match |= Q(**{f'{field}__icontains': term})
+
+    if connections[queryset.db].vendor == 'postgresql':
+        rank = _similarity_rank(terms)
+    else:
+        rank = _match_rank(terms)
+    ordering = queryset.query.order_by
+    return queryset.filter(match).annotate(search_rank=Cast(rank, RANK_FIELD)).order_by('-search_rank', *ordering)
+
+
+def _similarity_rank(terms):
+    """Sum over terms of the best word similarity between the term and any search column"""
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    return reduce(add, (
+        Greatest(*(Coalesce(TrigramWordSimilarity(Value(term), field), Value(0.0)) for field in SEARCH_FIELDS))
+        for term in terms
+    ))
+
+
+def _match_rank(terms):
+    """Sum over terms and columns of 1 for a full match, 0.5 for a prefix and 0.25 for a substring"""
+    return reduce(add, (
+        Case(
+            When(**{f'{field}__iexact': term}, then=Value(1.0)),
+            When(**{f'{field}__istartswith': term}, then=Value(0.5)),
+            When(**{f'{field}__icontains': term}, then=Value(0.25)),
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+        for term in terms for field in SEARCH_FIELDS
+    ))
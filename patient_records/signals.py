@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.forms import model_to_dict
@@ -10,142 +10,55 @@ from .models import (
     Patient, CbcLabs, CmpLabs, Medications, 
     Symptoms, Diagnosis, Visits, ClinicalNotes,
     Measurements, Imaging, Adls, Occurrences,
-    AuditTrail
+    AuditTrail, Vitals, RecordRequestLog
 )
+from .audit import record_audit, take_snapshot
+from .cache import retire_patient_cache
 
 # Initialize logger
 logger = logging.getLogger('patient_records')
 
-@receiver(post_save, sender=Patient)
-def log_patient_save(sender, instance, created, **kwargs):
-    action = 'CREATE' if created else 'UPDATE'
-    fields_to_track = [
-        'date', 'poa_name', 'poa_contact', 'allergies',
-        'code_status', 'relationship', 'veteran',
-        'veteran_spouse', 'marital_status', 'street_address',
-        'city', 'state', 'zip', 'patient_phone', 'patient_email'
-    ]
-    new_values = {}
-    for field_name in fields_to_track:
-        if hasattr(instance, field_name):
-            new_values[field_name] = str(getattr(instance, field_name))
-    
-    AuditTrail.objects.create(
-        patient=instance,
-        action=action,
-        record_type='PATIENT',
-        user=instance.modified_by if hasattr(instance, 'modified_by') else None,
-        previous_values={},
-        new_values=new_values,
-    )
+# Models audited on save, with the record_type stored on their AuditTrail rows
+AUDITED_MODELS = {
+    Patient: 'PATIENT',
+    CbcLabs: 'CBC_LAB',
+    CmpLabs: 'CMP_LAB',
+    Medications: 'MEDICATION',
+    Diagnosis: 'DIAGNOSIS',
+    ClinicalNotes: 'CLINICAL_NOTE',
+}
 
-@receiver(post_save, sender=CbcLabs)
-def log_cbc_labs_save(sender, instance, created, **kwargs):
-    action = 'CREATE' if created else 'UPDATE'
-    AuditTrail.objects.create(
-        patient=instance.patient,
-        action=action,
-        record_type='CBC_LAB',
-        user=instance.modified_by if hasattr(instance, 'modified_by') else None,
-        new_values={
-            'date': str(instance.date),
-            'rbc': str(instance.rbc),
-            'wbc': str(instance.wbc),
-            'hemoglobin': str(instance.hemoglobin),
-            'hematocrit': str(instance.hematocrit),
-            'mcv': str(instance.mcv),
-            'mchc': str(instance.mchc),
-            'rdw': str(instance.rdw),
-            'platelets': str(instance.platelets),
-            'mch': str(instance.mch),
-            'neutrophils': str(instance.neutrophils),
-            'lymphocytes': str(instance.lymphocytes),
-            'monocytes': str(instance.monocytes),
-            'eosinophils': str(instance.eosinophils),
-            'basophils': str(instance.basophils)
-        },
-        previous_values={},
-        
+def log_model_save(sender, instance, created, **kwargs):
+    """Single audit receiver for every model in AUDITED_MODELS"""
+    record_audit(
+        instance,
+        action='CREATE' if created else 'UPDATE',
+        record_type=AUDITED_MODELS[sender]
     )
 
-@receiver(post_save, sender=CmpLabs)
-def log_cmp_labs_save(sender, instance, created, **kwargs):
-    action = 'CREATE' if created else 'UPDATE'
-    AuditTrail.objects.create(
-        patient=instance.patient,
-        action=action,
-        record_type='CMP_LAB',
-        user=instance.modified_by if hasattr(instance, 'modified_by') else None,
-        new_values={
-            'date': str(instance.date),
-            'sodium': str(instance.sodium),
-            'potassium': str(instance.potassium),
-            'chloride': str(instance.chloride),
-            'co2': str(instance.co2),
-            'bun': str(instance.bun),
-            'creatinine': str(instance.creatinine),
-            'glucose': str(instance.glucose),
-            'calcium': str(instance.calcium),
-            'protein': str(instance.protein),
-            'albumin': str(instance.albumin),
-            'bilirubin': str(instance.bilirubin)
-        },
-        previous_values={},
-    )
+def snapshot_loaded_fields(sender, instance, **kwargs):
+    """Keeps the values an audited instance was built with, for diffing on save"""
+    take_snapshot(instance)
 
-@receiver(post_save, sender=Medications)
-def log_medication_save(sender, instance, created, **kwargs):
-    action = 'CREATE' if created else 'UPDATE'
-    AuditTrail.objects.create(
-        patient=instance.patient,
-        action=action,
-        record_type='MEDICATION',
-        user=instance.modified_by if hasattr(instance, 'modified_by') else None,
-        new_values={
-            'date_prescribed': str(instance.date_prescribed),
-            'drug': str(instance.drug),
-            'dose': str(instance.dose),
-            'route': str(instance.route),
-            'frequency': str(instance.frequency),
-            'prn': str(instance.prn),
-            'dc_date': str(instance.dc_date) if instance.dc_date else None,
-            'notes': str(instance.notes) if instance.notes else None
-        },
-        previous_values={},
-    )
+for audited_model in AUDITED_MODELS:
+    post_save.connect(log_model_save, sender=audited_model, dispatch_uid=f'audit_{audited_model.__name__}')
+    post_init.connect(snapshot_loaded_fields, sender=audited_model,
+                      dispatch_uid=f'audit_snapshot_{audited_model.__name__}')
 
-@receiver(post_save, sender=Diagnosis)
-def log_diagnosis_save(sender, instance, created, **kwargs):
-    action = 'CREATE' if created else 'UPDATE'
-    AuditTrail.objects.create(
-        patient=instance.patient,
-        action=action,
-        record_type='DIAGNOSIS',
-        user=instance.modified_by if hasattr(instance, 'modified_by') else None,
-        new_values={
-            'date': str(instance.date),
-            'diagnosis': str(instance.diagnosis),
-            'icd_code': str(instance.icd_code),
-            'notes': str(instance.notes) if instance.notes else None
-        },
-        previous_values={},
-    )
+# Patient records read by the cached dashboard endpoints. Writes that append
+# an event retire the cache from the event store, these also cover the rest
+DASHBOARD_MODELS = (Vitals, CmpLabs, CbcLabs, Measurements, Medications, Visits,
+                    RecordRequestLog, Diagnosis, ClinicalNotes)
+
+def retire_dashboard_cache(sender, instance, **kwargs):
+    retire_patient_cache(instance.patient_id)
+
+for dashboard_model in DASHBOARD_MODELS:
+    post_save.connect(retire_dashboard_cache, sender=dashboard_model,
+                      dispatch_uid=f'dashboard_cache_{dashboard_model.__name__}')
+    post_delete.connect(retire_dashboard_cache, sender=dashboard_model,
+                        dispatch_uid=f'dashboard_cache_delete_{dashboard_model.__name__}')
 
-@receiver(post_save, sender=ClinicalNotes)
-def log_clinical_notes_save(sender, instance, created, **kwargs):
-    action = 'CREATE' if created else 'UPDATE'
-    AuditTrail.objects.create(
-        patient=instance.patient,
-        action=action,
-        record_type='CLINICAL_NOTE',
-        user=instance.modified_by if hasattr(instance, 'modified_by') else None,
-        new_values={
-            'date': str(instance.date),
-            'notes': str(instance.notes),
-            'source': str(instance.source)
-        },
-        previous_values={},
-    )
 # VICTORY_TAG_20231118: Signal handlers disabled in favor of view-based audit trail creation
 # This resolved race conditions and foreign key violations during deletions
 # DO NOT REMOVE - Documents critical architectural decision
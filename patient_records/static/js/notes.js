@@ -175,13 +175,21 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
                 
                 const formData = new FormData(this);
+                const headers = {
+                    'X-CSRFToken': getCookie('csrftoken')
+                };
+                // Retries of the same new note reuse its key so the server creates it only once
+                if (this.getAttribute('action').endsWith('/notes/create/')) {
+                    if (!this.dataset.idempotencyKey) {
+                        this.dataset.idempotencyKey = crypto.randomUUID();
+                    }
+                    headers['Idempotency-Key'] = this.dataset.idempotencyKey;
+                }
                 
                 const response = await fetch(this.action, {
                     method: 'POST',
                     body: formData,
-                    headers: {
-                        'X-CSRFToken': getCookie('csrftoken')
-                    }
+                    headers: headers
                 });
                 
                 const data = await response.json();
@@ -234,6 +242,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const form = document.querySelector('.note-form');
         if (form) {
             form.reset();
+            delete form.dataset.idempotencyKey;
             if (tinymce.get('id_content')) {
                 tinymce.get('id_content').setContent('');
             }
@@ -5,7 +5,8 @@ class PatientListManager {
         this.clearFiltersBtn = document.querySelector('#clearFilters');
         this.state = {
             isLoading: false,
-            currentPage: parseInt(new URLSearchParams(window.location.search).get('page')) || 1,
+            // A page is either 1 (the first page) or an opaque cursor token from the server
+            currentPage: new URLSearchParams(window.location.search).get('cursor') || 1,
             searchQuery: new URLSearchParams(window.location.search).get('search') || '',
             sortOption: new URLSearchParams(window.location.search).get('sort_by') || '-updated_at'
         };
@@ -30,8 +31,8 @@ class PatientListManager {
             const pageLink = e.target.closest('.page-link');
             if (pageLink) {
                 e.preventDefault();
-                const page = parseInt(pageLink.dataset.page);
-                if (!isNaN(page)) {
+                const page = pageLink.dataset.cursor || parseInt(pageLink.dataset.page);
+                if (page) {
                     await this.loadPage(page);
                 }
             }
@@ -86,6 +87,15 @@ class PatientListManager {
         }
     }
 
+    setPageParam(params, page) {
+        params.delete('page');
+        if (typeof page === 'string') {
+            params.set('cursor', page);
+        } else {
+            params.delete('cursor');
+        }
+    }
+
     async loadPage(page, searchParams = null) {
         if (this.state.isLoading) return;
 
@@ -95,7 +105,7 @@ class PatientListManager {
 
             // Build URL with current search and sort parameters
             const params = searchParams || new URLSearchParams(window.location.search);
-            params.set('page', page);
+            this.setPageParam(params, page);
             
             // Update URL without reloading the page
             const newUrl = `${window.location.pathname}?${params.toString()}`;
@@ -142,7 +152,7 @@ class PatientListManager {
             
             // Revert URL if there was an error
             const params = new URLSearchParams(window.location.search);
-            params.set('page', this.state.currentPage);
+            this.setPageParam(params, this.state.currentPage);
             window.history.pushState({}, '', `${window.location.pathname}?${params.toString()}`);
         } finally {
             loadingManager.hideGlobalLoading();
@@ -45,8 +45,9 @@ class PatientTabManager {
             const pageLink = e.target.closest('.page-link');
             if (pageLink && !pageLink.parentElement.classList.contains('disabled')) {
                 e.preventDefault();
-                const page = parseInt(pageLink.dataset.page);
-                if (!isNaN(page)) {
+                // Cursor paginated tabs link to an opaque cursor token instead of a page number
+                const page = pageLink.dataset.cursor || parseInt(pageLink.dataset.page);
+                if (page) {
                     await this.loadPage(page);
                 }
             }
@@ -97,7 +98,9 @@ class PatientTabManager {
     }
 
     async loadContent(tabName, page) {
-        const url = `/patient/${this.patientId}/tab/${tabName}/?page=${page}`;
+        const url = typeof page === 'string'
+            ? `/patient/${this.patientId}/tab/${tabName}/?cursor=${encodeURIComponent(page)}`
+            : `/patient/${this.patientId}/tab/${tabName}/?page=${page}`;
         
         const response = await fetch(url, {
             headers: {
@@ -228,20 +228,6 @@ class TemplateTests(BaseTestCase):
         response = self.client.post(reverse('add_visit', args=[self.patient.id]), {})
         self.assertContains(response, 'This field is required')
 
-class PerformanceTests(BaseTestCase):
-    def test_query_count(self):
-        """Test number of queries executed"""
-        with CaptureQueriesContext(connection) as context:
-            response = self.client.get(reverse('patient_detail', args=[self.patient.id]))
-            self.assertEqual(response.status_code, 200, "Page should load successfully")
-            
-            # Count queries by type
-            select_count = sum(1 for q in context.captured_queries 
-                             if q['sql'].startswith('SELECT'))
-            
-            # Assert reasonable query counts
-            self.assertLess(select_count, 10, "Too many SELECT queries")
-
 class SearchTests(BaseTestCase):
     def test_patient_search(self):
         """Test patient search functionality"""
@@ -0,0 +1,179 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test.utils import CaptureQueriesContext
+from ..models import Patient, Diagnosis, AuditTrail
+from ..audit import audit_scope, serializer_for
+from ..audit_writer import AuditWriter, replay_spool
+import datetime
+from unittest import mock
+import json
+import tempfile
+
+
+class AuditPipelineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='testpass123')
+        self.patient = Patient.objects.create(
+            first_name="Test",
+            last_name="Patient",
+            date_of_birth=datetime.date(1990, 1, 1),
+            gender="M",
+            patient_number="TP001"
+        )
+
+    def test_saves_in_scope_coalesce_per_record(self):
+        """Test repeated saves of one record produce a single audit row"""
+        AuditTrail.objects.all().delete()
+        with audit_scope(self.user):
+            with self.captureOnCommitCallbacks(execute=True):
+                diagnosis = Diagnosis.objects.create(
+                    patient=self.patient, icd_code='J45.901', diagnosis='Asthma', date=datetime.date(2024, 3, 20)
+                )
+                diagnosis.notes = 'Updated'
+                diagnosis.save()
+                self.patient.first_name = "Changed"
+                self.patient.save()
+
+        audits = {audit.record_type: audit for audit in AuditTrail.objects.all()}
+        self.assertEqual(set(audits), {'DIAGNOSIS', 'PATIENT'})
+        self.assertEqual(audits['DIAGNOSIS'].action, 'CREATE')
+        self.assertEqual(audits['DIAGNOSIS'].new_values['notes'], 'Updated')
+        self.assertEqual(audits['DIAGNOSIS'].patient_identifier, 'TP001 - Test Patient')
+        self.assertEqual(audits['PATIENT'].action, 'UPDATE')
+        self.assertEqual(audits['PATIENT'].user, self.user)
+
+    def test_scope_writes_with_one_insert(self):
+        """Test buffered entries are written with a single bulk insert"""
+        audit_table = AuditTrail._meta.db_table
+        with CaptureQueriesContext(connection) as context:
+            with audit_scope(self.user):
+                with self.captureOnCommitCallbacks(execute=True):
+                    for code in ('A00', 'B00', 'C00'):
+                        Diagnosis.objects.create(patient=self.patient, icd_code=code, diagnosis=code,
+                                                 date=datetime.date(2024, 3, 20))
+
+        inserts = [q for q in context.captured_queries
+                   if q['sql'].startswith('INSERT') and audit_table in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(AuditTrail.objects.filter(record_type='DIAGNOSIS').count(), 3)
+
+    def test_failed_write_is_spooled_not_raised(self):
+        """Test a failing audit write leaves the scope quietly and is replayed later"""
+        AuditTrail.objects.all().delete()
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        with override_settings(AUDIT_SPOOL_DIR=spool_dir.name), \
+                mock.patch('patient_records.audit.write_entries', side_effect=RuntimeError('database down')):
+            with audit_scope(self.user):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Diagnosis.objects.create(patient=self.patient, icd_code='A00', diagnosis='Cholera',
+                                             date=datetime.date(2024, 3, 20))
+
+        self.assertFalse(AuditTrail.objects.filter(record_type='DIAGNOSIS').exists())
+        self.assertEqual(replay_spool(spool_dir.name), 1)
+        self.assertEqual(AuditTrail.objects.get(record_type='DIAGNOSIS').user, self.user)
+
+    def test_update_audits_changed_fields_only(self):
+        """Test an update stores just the changed fields with their old values"""
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.first_name = "Changed"
+        patient.save()
+
+        audit = AuditTrail.objects.filter(patient=patient, action='UPDATE').get()
+        self.assertEqual(audit.previous_values, {'first_name': 'Test'})
+        self.assertEqual(audit.new_values, {'first_name': 'Changed'})
+
+    def test_unchanged_save_is_not_audited(self):
+        """Test saving a loaded record without changes writes no audit row"""
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.save()
+        self.assertFalse(AuditTrail.objects.filter(patient=patient, action='UPDATE').exists())
+
+    def test_snapshot_skips_deferred_fields(self):
+        """Test taking a snapshot never loads deferred fields"""
+        with self.assertNumQueries(1):
+            patient = Patient.objects.only('first_name').get(pk=self.patient.pk)
+        self.assertEqual(patient._audit_snapshot, {'first_name': 'Test'})
+
+    def test_serializer_is_json_safe(self):
+        """Test dates, decimals and foreign keys serialize to JSON types"""
+        values = serializer_for(Patient).serialize(self.patient)
+        self.assertEqual(values['date_of_birth'], '1990-01-01')
+        self.assertNotIn('created_at', values)
+        self.assertIs(serializer_for(Patient), serializer_for(Patient))
+
+
+class AuditHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='historian', password='testpass123')
+        self.client.login(username='historian', password='testpass123')
+        self.patient = Patient.objects.create(
+            first_name="Test", last_name="Patient", date_of_birth=datetime.date(1990, 1, 1),
+            gender="M", patient_number="TP002"
+        )
+        AuditTrail.objects.all().delete()
+        same_time = datetime.datetime(2024, 3, 20, 12, 0, tzinfo=datetime.timezone.utc)
+        AuditTrail.objects.bulk_create([
+            AuditTrail(patient=self.patient, action='UPDATE', record_type='PATIENT',
+                       timestamp=same_time, new_values={'index': i})
+            for i in range(5)
+        ])
+        self.url = reverse('patient_audit_history', args=[self.patient.id])
+
+    def fetch(self, **params):
+        response = self.client.get(self.url, params)
+        return response.status_code, json.loads(b''.join(response.streaming_content))
+
+    def test_cursor_pages_cover_history_once(self):
+        """Test paging by cursor returns every entry once, even with equal timestamps"""
+        seen, cursor = [], None
+        with CaptureQueriesContext(connection) as context:
+            while True:
+                status, page = self.fetch(limit=2, **({'cursor': cursor} if cursor else {}))
+                self.assertEqual(status, 200)
+                seen.extend(entry['new_values']['index'] for entry in page['results'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+
+        self.assertEqual(sorted(seen), [0, 1, 2, 3, 4])
+        self.assertEqual(len(seen), 5)
+        self.assertFalse(any('COUNT(' in q['sql'].upper() for q in context.captured_queries))
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test a malformed cursor returns a 400 instead of a page"""
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AuditWriterTests(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        self.writer = AuditWriter(self.spool_dir.name, batch_size=10, flush_interval=1.0)
+
+    def make_entries(self, count):
+        return [AuditTrail(patient_identifier=f'P{i}', action='UPDATE', record_type='PATIENT',
+                           new_values={'index': i})
+                for i in range(count)]
+
+    def test_write_inserts_batches_and_clears_spool(self):
+        """Test queued batches are inserted together and their spool files removed"""
+        batches = [(self.writer.spool(entries), entries) for entries in (self.make_entries(2), self.make_entries(3))]
+        self.assertEqual(self.writer.write(batches), 5)
+        self.assertEqual(AuditTrail.objects.filter(record_type='PATIENT', action='UPDATE').count(), 5)
+        self.assertEqual(list(self.writer.spool_dir.iterdir()), [])
+
+    def test_replay_recovers_spooled_entries_once(self):
+        """Test spooled entries survive a lost batch and replay is idempotent"""
+        entries = self.make_entries(3)
+        path = self.writer.spool(entries)
+        AuditTrail.objects.bulk_create(entries[:1])  # Partly written before the crash
+
+        self.assertEqual(replay_spool(self.spool_dir.name), 3)
+        self.assertFalse(path.exists())
+        replayed = AuditTrail.objects.filter(record_type='PATIENT', action='UPDATE')
+        self.assertEqual(replayed.count(), 3)
+        self.assertEqual(sorted(a.new_values['index'] for a in replayed), [0, 1, 2])
@@ -0,0 +1,65 @@
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Patient, Vitals
+from ..cache import patient_cache_version, retire_patient_cache
+from ..event_sourcing.services import EventStoreService
+import datetime
+
+LOCMEM_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+    for alias in ('default', 'patient_dashboard')
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PatientResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['patient_dashboard'].clear()
+        User.objects.create_user(username='poller', password='testpass123')
+        self.client.login(username='poller', password='testpass123')
+        self.patient = Patient.objects.create(
+            first_name="Test", last_name="Patient", date_of_birth=datetime.date(1990, 1, 1),
+            gender="M", patient_number="TP001"
+        )
+        self.url = reverse('get_latest_vitals', args=[self.patient.id])
+
+    def add_vitals(self, blood_pressure):
+        with self.captureOnCommitCallbacks(execute=True):
+            Vitals.objects.create(patient=self.patient, date=datetime.date.today(), blood_pressure=blood_pressure,
+                                  temperature=36.8, spo2=98, pulse=72, respirations=16, pain=0, source='Test')
+
+    def test_repeated_poll_is_served_from_cache(self):
+        """Test an unchanged patient's endpoint is answered without reading the records"""
+        self.add_vitals('120/80')
+        self.assertEqual(self.client.get(self.url).json()['systolic'], 120)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['systolic'], 120)
+        self.assertFalse(any(Vitals._meta.db_table in q['sql'] for q in context.captured_queries))
+
+    def test_new_record_retires_cached_response(self):
+        """Test saving a record makes the next poll return fresh data"""
+        self.add_vitals('120/80')
+        self.client.get(self.url)
+        self.add_vitals('150/95')
+        self.assertEqual(len(self.client.get(self.url).json()['history']), 2)
+
+    def test_version_moves_on_event_appends(self):
+        """Test appending an event moves the patient to the next version"""
+        version = int(patient_cache_version(self.patient.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            EventStoreService().append_event(str(self.patient.id), 'patient', 'patient_updated', {})
+        self.assertEqual(patient_cache_version(self.patient.id), str(version + 1))
+
+    def test_evicted_version_is_never_reused(self):
+        """Test a version reseeded after eviction is above every version handed out before"""
+        version = int(patient_cache_version(self.patient.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            retire_patient_cache(self.patient.id)
+        caches['patient_dashboard'].clear()
+        self.assertGreater(int(patient_cache_version(self.patient.id)), version + 1)
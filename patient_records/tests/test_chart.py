@@ -0,0 +1,58 @@
+from django.test import TestCase
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Patient, Diagnosis, Medications, NoteTag, PatientNote, NoteAttachment
+from ..chart import OVERVIEW_LIMIT, QUERY_BUDGET, load_patient_chart
+import datetime
+
+
+class PatientChartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_login(self.user)
+        self.patient = Patient.objects.create(
+            first_name="Test", last_name="Patient", date_of_birth=datetime.date(1990, 1, 1),
+            gender="M", patient_number="TP001"
+        )
+
+    def test_query_count(self):
+        """Test the patient chart loads within its query budget"""
+        tag = NoteTag.objects.create(name='Follow-up')
+        for i in range(3):
+            note = PatientNote.objects.create(patient=self.patient, title=f'Note {i}', content='Content',
+                                              created_by=self.user)
+            note.tags.add(tag)
+            NoteAttachment.objects.create(note=note, file=f'note_attachments/{i}.pdf', file_type='pdf')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('patient_detail', args=[self.patient.id]))
+            self.assertEqual(response.status_code, 200, "Page should load successfully")
+
+        # Session and user lookups belong to the request, not the chart
+        chart_queries = [q for q in context.captured_queries
+                         if q['sql'].startswith('SELECT')
+                         and 'FROM "django_session"' not in q['sql'] and 'FROM "auth_user"' not in q['sql']]
+        self.assertLessEqual(len(chart_queries), QUERY_BUDGET, "Too many SELECT queries")
+
+        with self.assertNumQueries(QUERY_BUDGET):
+            chart = load_patient_chart(self.patient.id)
+            for note in chart.notes:
+                list(note.tags.all())
+                list(note.attachments.all())
+                note.created_by
+
+    def test_overview_is_limited_to_most_recent(self):
+        """Test only the most recent diagnoses and current medications are loaded"""
+        start = datetime.date(2024, 1, 1)
+        for day in range(OVERVIEW_LIMIT + 2):
+            date = start + datetime.timedelta(days=day)
+            Diagnosis.objects.create(patient=self.patient, icd_code='I10', diagnosis=f'Diagnosis {day}', date=date)
+            Medications.objects.create(patient=self.patient, date_prescribed=date, drug=f'Drug {day}',
+                                       dose='1', frequency='daily', route='PO')
+
+        chart = load_patient_chart(self.patient.id)
+        self.assertEqual(len(chart.active_diagnoses), OVERVIEW_LIMIT)
+        self.assertEqual(chart.active_diagnoses[0].diagnosis, f'Diagnosis {OVERVIEW_LIMIT + 1}')
+        self.assertEqual([med.drug for med in chart.current_medications][-1], 'Drug 2')
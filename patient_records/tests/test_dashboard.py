@@ -0,0 +1,58 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from ..models import Patient, Vitals, Medications, RecordRequestLog
+from ..dashboard import dashboard_metrics, vitals_series, vitals_alerts
+import datetime
+
+
+class DashboardDataTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            first_name="Test", last_name="Patient", date_of_birth=datetime.date(1990, 1, 1),
+            gender="M", patient_number="TP001"
+        )
+        self.start, self.end = datetime.date(2024, 3, 1), datetime.date(2024, 3, 31)
+        for day, blood_pressure, temperature in ((1, '120/80', 36.8), (2, '190/95', 36.8),
+                                                 (3, 'refused', 39.0), (4, '130/115', 37.0)):
+            Vitals.objects.create(patient=self.patient, date=datetime.date(2024, 3, day),
+                                  blood_pressure=blood_pressure, temperature=temperature, spo2=98,
+                                  pulse=70 + day, respirations=16, pain=0, source='Test')
+
+    def test_metrics_are_one_query(self):
+        """Test all dashboard counts come from a single query"""
+        Medications.objects.create(patient=self.patient, date_prescribed=self.start, drug='Drug',
+                                   dose='1', frequency='daily', route='PO')
+        RecordRequestLog.objects.create(patient=self.patient, date=self.start)
+        with self.assertNumQueries(1):
+            metrics = dashboard_metrics(self.start, self.end)
+        self.assertEqual(metrics, {'total_visits': 0, 'active_medications': 1, 'recent_labs': 0,
+                                   'pending_tasks': 1})
+
+    def test_series_parses_blood_pressure(self):
+        """Test the chart series is oldest first and leaves unreadable pressures empty"""
+        series = vitals_series(self.start, self.end)
+        self.assertEqual(series['dates'][0], '2024-03-01')
+        self.assertEqual(series['systolic'], [120, 190, None, 130])
+        self.assertEqual(series['diastolic'], [80, 95, None, 115])
+        self.assertEqual(series['heartRate'], [71, 72, 73, 74])
+
+    def test_alerts_only_fetch_abnormal_readings(self):
+        """Test alerts are raised for pressures and temperatures past the limits"""
+        with self.assertNumQueries(1):
+            alerts = list(vitals_alerts(self.start, self.end))
+        self.assertEqual([alert['message'] for alert in alerts], [
+            'High blood pressure reading: 130/115 on 2024-03-04',
+            'High temperature: 39.0°C on 2024-03-03',
+            'High blood pressure reading: 190/95 on 2024-03-02',
+        ])
+
+    def test_endpoint_returns_dashboard(self):
+        """Test the endpoint combines metrics, series and alerts"""
+        User.objects.create_user(username='viewer', password='testpass123')
+        self.client.login(username='viewer', password='testpass123')
+        response = self.client.get(reverse('dashboard_data'), {'start_date': '2024-03-01', 'end_date': '2024-03-31'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['vitals']['dates']), 4)
+        self.assertEqual(len(data['alerts']), 3)
@@ -0,0 +1,286 @@
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from ..models import Patient, EventStore, ClinicalReadModel, PatientReadModel, AggregateCheckpoint, IdempotencyKey
+from ..event_sourcing.constants import *
+from ..event_sourcing.services import EventStoreService
+from ..event_sourcing.archive import EventArchive
+from ..event_sourcing.event_store import EventStoreService as ReplayEventStoreService
+from ..event_sourcing.idempotency import prune_idempotency_keys
+from ..event_sourcing.exceptions import ConcurrencyError, WrongExpectedVersionError
+from unittest.mock import patch
+from io import StringIO
+import datetime
+import tempfile
+
+
+class EventStoreServiceTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            first_name="Test",
+            last_name="Patient",
+            date_of_birth=datetime.date(1990, 1, 1),
+            gender="M",
+            patient_number="TP001"
+        )
+        self.aggregate_id = str(self.patient.id)
+        self.service = EventStoreService()
+
+    def _vitals_event(self, pulse):
+        return {
+            'aggregate_type': CLINICAL_AGGREGATE,
+            'event_type': VITALS_RECORDED,
+            'event_data': {'patient_id': self.aggregate_id, 'pulse': pulse}
+        }
+
+    def test_append_events_assigns_contiguous_versions(self):
+        """Test a batch continues the aggregate's version sequence"""
+        start = EventStore.objects.filter(aggregate_id=self.patient.id).count()
+        events = self.service.append_events(
+            self.aggregate_id,
+            [self._vitals_event(70), self._vitals_event(72), self._vitals_event(74)]
+        )
+
+        self.assertEqual([e.version for e in events], [start + 1, start + 2, start + 3])
+        self.assertEqual(
+            ClinicalReadModel.objects.filter(patient_id=self.patient.id).count(), 3
+        )
+
+    def test_append_events_uses_single_insert(self):
+        """Test the batch is written with one INSERT into the event store"""
+        with CaptureQueriesContext(connection) as context:
+            self.service.append_events(
+                self.aggregate_id,
+                [{'aggregate_type': 'patient', 'event_type': 'patient_updated',
+                  'event_data': {'n': n}} for n in range(10)]
+            )
+
+        event_table = EventStore._meta.db_table
+        inserts = [q for q in context.captured_queries
+                   if q['sql'].startswith('INSERT') and event_table in q['sql']]
+        self.assertEqual(len(inserts), 1)
+
+    def test_append_events_empty_batch(self):
+        """Test an empty batch is a no-op"""
+        self.assertEqual(self.service.append_events(self.aggregate_id, []), [])
+
+    def test_append_event_with_expected_version(self):
+        """Test expected_version guards the append"""
+        current = self.service.get_current_version(self.aggregate_id)
+        event = self.service.append_event(
+            self.aggregate_id, 'patient', 'patient_updated', {}, expected_version=current
+        )
+        self.assertEqual(event.version, current + 1)
+
+        with self.assertRaises(WrongExpectedVersionError) as ctx:
+            self.service.append_event(
+                self.aggregate_id, 'patient', 'patient_updated', {}, expected_version=current
+            )
+        self.assertEqual(ctx.exception.actual_version, current + 1)
+
+    def test_append_event_retries_version_collision(self):
+        """Test a stale version read is retried instead of failing"""
+        current = self.service.get_current_version(self.aggregate_id)
+        stale_reads = [current - 1]
+        original = EventStoreService.get_current_version
+
+        def flaky_version(service, aggregate_id):
+            if stale_reads:
+                return stale_reads.pop()
+            return original(service, aggregate_id)
+
+        with patch.object(EventStoreService, 'get_current_version', flaky_version):
+            event = self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {})
+        self.assertEqual(event.version, current + 1)
+        self.assertEqual(stale_reads, [])
+
+    def test_append_event_gives_up_after_max_attempts(self):
+        """Test persistent collisions raise a ConcurrencyError"""
+        with patch.object(EventStoreService, 'get_current_version', return_value=0):
+            with self.assertRaises(ConcurrencyError):
+                self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {})
+
+    def test_append_event_with_idempotency_key_writes_once(self):
+        """Test a retried append returns the original event"""
+        first = self.service.append_event(self.aggregate_id, CLINICAL_AGGREGATE, VITALS_RECORDED,
+                                          {'patient_id': self.aggregate_id, 'pulse': 70}, idempotency_key='retry-1')
+        retried = self.service.append_event(self.aggregate_id, CLINICAL_AGGREGATE, VITALS_RECORDED,
+                                            {'patient_id': self.aggregate_id, 'pulse': 70}, idempotency_key='retry-1')
+
+        self.assertEqual(retried.id, first.id)
+        self.assertEqual(EventStore.objects.filter(event_type=VITALS_RECORDED).count(), 1)
+        self.assertEqual(ClinicalReadModel.objects.filter(patient_id=self.patient.id).count(), 1)
+
+    def test_expired_idempotency_key_is_not_replayed(self):
+        """Test a key past the retention window allows a new append"""
+        self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {}, idempotency_key='old')
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(days=2))
+
+        self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {}, idempotency_key='old')
+        self.assertEqual(self.service.get_current_version(self.aggregate_id), 3)
+        self.assertEqual(prune_idempotency_keys(), 0)
+
+    def _append_updates(self, count):
+        self.service.append_events(
+            self.aggregate_id,
+            [{'aggregate_type': 'patient', 'event_type': 'patient_updated',
+              'event_data': {'counter': n}} for n in range(count)]
+        )
+
+    def test_snapshot_taken_at_interval(self):
+        """Test crossing SNAPSHOT_INTERVAL stores the folded state"""
+        with patch.object(EventStoreService, 'SNAPSHOT_INTERVAL', 5):
+            self._append_updates(6)
+
+        read_model = PatientReadModel.objects.get(id=self.patient.id)
+        self.assertEqual(read_model.snapshot_version, 7)
+        self.assertEqual(read_model.snapshot_data['counter'], 5)
+
+    def test_get_snapshot_replays_only_events_after_snapshot(self):
+        """Test rehydration starts from the stored snapshot"""
+        self._append_updates(3)
+        self.assertEqual(self.service.take_snapshot(self.aggregate_id), 4)
+        self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {'counter': 99})
+
+        service = ReplayEventStoreService()
+        with CaptureQueriesContext(connection) as context:
+            state = service.get_snapshot(self.aggregate_id)
+
+        self.assertEqual(state['counter'], 99)
+        self.assertIn('patient_data', state)
+        self.assertEqual(len(context.captured_queries), 2)
+
+    def test_state_at_version_starts_from_checkpoint(self):
+        """Test a past version is rebuilt from the nearest earlier checkpoint"""
+        with patch.object(EventStoreService, 'SNAPSHOT_INTERVAL', 5):
+            for version in range(2, 14):
+                self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {'counter': version})
+        self.assertEqual(
+            list(AggregateCheckpoint.objects.filter(aggregate_id=self.patient.id)
+                 .order_by('version').values_list('version', flat=True)),
+            [5, 10]
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            state, version = self.service.state_at(self.aggregate_id, 8)
+
+        self.assertEqual((state['counter'], version), (8, 8))
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertEqual(self.service.state_at(self.aggregate_id, 1)[0], self.service.load_state(self.aggregate_id, 1)[0])
+
+    def test_state_at_timestamp(self):
+        """Test the state reflects only events recorded up to the given time"""
+        with patch.object(EventStoreService, 'SNAPSHOT_INTERVAL', 2):
+            for version in range(2, 6):
+                self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {'counter': version})
+        # Version n was recorded on 2024-01-n
+        for model in (EventStore, AggregateCheckpoint):
+            for row in model.objects.filter(aggregate_id=self.patient.id):
+                model.objects.filter(pk=row.pk).update(
+                    timestamp=timezone.make_aware(datetime.datetime(2024, 1, row.version))
+                )
+
+        state, version = self.service.state_at(self.aggregate_id, datetime.date(2024, 1, 3))
+        self.assertEqual((state['counter'], version), (3, 3))
+        self.assertEqual(self.service.state_at(self.aggregate_id, datetime.datetime(2023, 12, 31)), ({}, 0))
+
+        with self.assertRaises(TypeError):
+            self.service.state_at(self.aggregate_id, '2024-01-03')
+
+    def test_iter_replay_pages_through_aggregate(self):
+        """Test streamed replay returns every event in version order"""
+        self._append_updates(5)
+        service = ReplayEventStoreService()
+
+        with CaptureQueriesContext(connection) as context:
+            versions = [e['version'] for e in service.iter_replay(self.aggregate_id, chunk_size=2)]
+
+        self.assertEqual(versions, list(range(1, 7)))
+        self.assertEqual(len(context.captured_queries), 4)
+        self.assertEqual(service.replay_events(self.aggregate_id, up_to_version=3)[-1]['version'], 3)
+
+    def test_iter_replay_all_walks_every_aggregate(self):
+        """Test the global stream visits each aggregate in order"""
+        other = Patient.objects.create(
+            first_name="Other",
+            last_name="Patient",
+            date_of_birth=datetime.date(1985, 5, 5),
+            gender="F",
+            patient_number="TP002"
+        )
+        self._append_updates(2)
+        service = ReplayEventStoreService()
+
+        positions = [(e['aggregate_id'], e['version']) for e in service.iter_replay_all(chunk_size=2)]
+
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(len(positions), EventStore.objects.count())
+        self.assertIn((str(other.id), 1), positions)
+
+    def _first_position(self):
+        # Positions come from a sequence that test rollbacks do not reset
+        return EventStore.objects.order_by('position').values_list('position', flat=True).first()
+
+    def test_read_all_follows_global_position(self):
+        """Test events from every aggregate are read in position order"""
+        self._append_updates(3)
+        first = self._first_position()
+        events = self.service.read_all(first - 1, batch_size=2)
+        self.assertEqual([e.position for e in events], [first, first + 1])
+
+        remaining = self.service.read_all(events[-1].position)
+        self.assertEqual([e.position for e in remaining], [first + 2, first + 3])
+
+    def test_read_all_waits_on_recent_gap(self):
+        """Test a fresh position gap is not skipped"""
+        self._append_updates(2)
+        first = self._first_position()
+        EventStore.objects.filter(position=first + 1).delete()
+
+        # The test's own transaction is still running, so the gap may be filled
+        self.assertEqual([e.position for e in self.service.read_all(first - 1)], [first])
+        with patch('patient_records.event_sourcing.services.oldest_running_transaction', return_value=2 ** 62), \
+                patch.object(EventStoreService, 'POSITION_GAP_TIMEOUT', -1):
+            self.assertEqual([e.position for e in self.service.read_all(first - 1)], [first, first + 2])
+
+    def test_subscribe_persists_checkpoint(self):
+        """Test a subscriber resumes after its saved checkpoint"""
+        self._append_updates(2)
+        first = self._first_position()
+        EventStoreService.save_checkpoint('audit_export', first - 1)
+        seen = [e.position for batch in self.service.subscribe('audit_export', batch_size=2) for e in batch]
+        self.assertEqual(seen, [first, first + 1, first + 2])
+        self.assertEqual(EventStoreService.get_checkpoint('audit_export'), first + 2)
+
+        self.service.append_event(self.aggregate_id, 'patient', 'patient_updated', {})
+        batches = list(self.service.subscribe('audit_export'))
+        self.assertEqual([e.position for e in batches[0]], [first + 3])
+
+    def test_replay_reads_archived_segments(self):
+        """Test replay and rehydration see events moved to the archive"""
+        self._append_updates(4)
+        EventStore.objects.filter(aggregate_id=self.patient.id).update(
+            timestamp=timezone.make_aware(datetime.datetime(2020, 1, 15))
+        )
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(EVENT_ARCHIVE_DIR=directory):
+            call_command('archive_events', before='2020-02', stdout=StringIO())
+
+            # The latest event stays in the table so versioning keeps working
+            remaining = EventStore.objects.filter(aggregate_id=self.patient.id)
+            self.assertEqual(list(remaining.values_list('version', flat=True)), [5])
+
+            service = ReplayEventStoreService()
+            self.assertEqual([e['version'] for e in service.replay_events(self.aggregate_id)], [1, 2, 3, 4, 5])
+            self.assertEqual(service.get_snapshot(self.aggregate_id)['counter'], 3)
+
+            event = service.append_event(self.aggregate_id, 'patient', 'patient_updated', {'counter': 4})
+            self.assertEqual(event.version, 6)
+
+            # Segment indexes are parsed once per directory, not per service
+            with patch.object(EventArchive, '_read_indexes') as read_indexes:
+                archived = list(EventStoreService().archive.read_events(self.aggregate_id))
+            read_indexes.assert_not_called()
+            self.assertEqual([e.version for e in archived], [1, 2, 3, 4])
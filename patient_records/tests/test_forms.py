@@ -102,6 +102,25 @@ class FormSubmissionTests(TestCase):
         )
         self.assertEqual(validation_errors, [])
 
+    def test_diagnosis_resubmission_is_idempotent(self):
+        """Test a resubmitted diagnosis form with the same key saves once"""
+        url = reverse('add_diagnosis', args=[self.patient.id])
+        data = {
+            'icd_code': 'J45.901',
+            'diagnosis': 'Asthma',
+            'date': '2024-03-20',
+            'notes': 'Test diagnosis notes',
+            'source': 'Test Source',
+            'idempotency_key': 'diagnosis-retry-1'
+        }
+
+        for _ in range(2):
+            response = self.client.post(url, data)
+            self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(Diagnosis.objects.filter(patient=self.patient).count(), 1)
+        self.assertEqual(EventStore.objects.filter(event_type=DIAGNOSIS_ADDED).count(), 1)
+
     @patch('patient_records.event_sourcing.event_store.EventStoreService')
     def test_symptoms_form_submission(self, mock_event_store):
         """Test successful symptoms form submission"""
@@ -0,0 +1,107 @@
+from django.test import SimpleTestCase
+from unittest import mock
+from .. import icd_index
+from ..icd_index import (
+    DescriptionIndex, ICDCodeIndex, MappedDescriptionIndex, MappedICDCodeIndex, build_index_file, get_icd_index
+)
+import os
+import tempfile
+
+HEADER = 'code,short,category,chapter,description\n'
+ROWS = [
+    ('E11.9', 'Type 2 diabetes mellitus without complications'),
+    ('E10.9', 'Type 1 diabetes mellitus without complications'),
+    ('E11.65', 'Type 2 diabetes mellitus with hyperglycemia'),
+    ('J45.901', 'Unspecified asthma with (acute) exacerbation'),
+    ('I10', 'Essential (primary) hypertension'),
+]
+
+
+class ICDCodeIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'codes.csv')
+        self.write_codes(ROWS)
+        self.index = ICDCodeIndex(self.path)
+
+    def write_codes(self, rows):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(HEADER)
+            for code, description in rows:
+                file.write(f'{code},,,,"{description}"\n')
+
+    def test_prefix_search_returns_matches_in_code_order(self):
+        """Test a prefix returns only matching codes, sorted and limited"""
+        self.assertEqual([code for code, _ in self.index.search_prefix('E1')], ['E10.9', 'E11.65', 'E11.9'])
+        self.assertEqual(len(self.index.search_prefix('E1', limit=2)), 2)
+        self.assertEqual(self.index.search_prefix('I10'), [('I10', 'Essential (primary) hypertension')])
+        self.assertEqual(self.index.search_prefix('Z'), [])
+
+    def test_search_ranks_code_prefix_then_words(self):
+        """Test code prefix hits come first, then descriptions matching the most words"""
+        self.assertEqual(self.index.search('e11')[:2], self.index.search_prefix('E11'))
+        codes = [code for code, _ in self.index.search('type 2 diabetes')]
+        self.assertEqual(codes[:2], ['E11.65', 'E11.9'])
+        self.assertEqual(codes[2], 'E10.9')
+
+    def test_search_matches_partial_and_misspelled_words(self):
+        """Test the last word matches as a prefix and misspelled words still match"""
+        self.assertEqual(self.index.search('hyperten')[0][0], 'I10')
+        self.assertEqual(self.index.search('asthmaa')[0][0], 'J45.901')
+        self.assertEqual({code for code, _ in self.index.search('diabtes')}, {'E10.9', 'E11.65', 'E11.9'})
+        self.assertEqual(self.index.search('xyzzy'), [])
+
+    def test_common_words_only_rank_rare_word_matches(self):
+        """Test rows are found by their rare words, ranked with the common ones, then filled in"""
+        descriptions = [f'Other disorder {n} with complication' for n in range(80)] + [
+            'Asthma without complication', 'Other asthma with exacerbation', 'Other asthma']
+        index = DescriptionIndex(descriptions)
+        self.assertEqual(index.search('other asthma with', 3), [81, 80, 82])
+        self.assertEqual(index.search('other asthma with', 5), [81, 80, 82, 0, 1])
+
+    def test_reloads_when_file_changes(self):
+        """Test the table is re-read only after the CSV's mtime changes"""
+        self.assertFalse(self.index.reload_if_changed())
+        self.write_codes(ROWS + [('Z00.00', 'General adult medical examination')])
+        os.utime(self.path, (self.index.mtime + 10, self.index.mtime + 10))
+
+        self.assertTrue(self.index.reload_if_changed())
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.search_prefix('Z')[0][0], 'Z00.00')
+        self.assertEqual(self.index.search('medical examination')[0][0], 'Z00.00')
+
+    def test_mapped_index_matches_csv_index(self):
+        """Test the compiled, memory-mapped index answers like the CSV index"""
+        index_path = self.path.replace('.csv', '.idx')
+        self.assertEqual(build_index_file(self.path, index_path), len(ROWS))
+        mapped = MappedICDCodeIndex(index_path)
+
+        self.assertEqual(len(mapped), len(self.index))
+        for prefix in ('E', 'E11', 'I10', 'J45.9', 'Z'):
+            self.assertEqual(mapped.search_prefix(prefix), self.index.search_prefix(prefix))
+        self.assertEqual(mapped.search('diabetes mellitus'), self.index.search('diabetes mellitus'))
+
+    def test_mapped_index_maps_description_postings(self):
+        """Test ranked searches on a mapped index read the compiled postings, not a rebuilt index"""
+        index_path = self.path.replace('.csv', '.idx')
+        build_index_file(self.path, index_path)
+        mapped = MappedICDCodeIndex(index_path)
+
+        self.assertIsInstance(mapped.descriptions_index, MappedDescriptionIndex)
+        for query in ('type 2 diabetes', 'hyperten', 'asthmaa', 'diabtes', 'xyzzy'):
+            self.assertEqual(mapped.search(query), self.index.search(query))
+
+    def test_switches_to_index_file_once_built(self):
+        """Test a process serving the CSV maps the index file as soon as it is built"""
+        index_path = self.path.replace('.csv', '.idx')
+        with mock.patch.multiple(icd_index, CODES_CSV=self.path, CODES_INDEX=icd_index.Path(index_path),
+                                 _index=None, _index_file_mtime=None):
+            csv_index = get_icd_index()
+            self.assertNotIsInstance(csv_index, MappedICDCodeIndex)
+            self.assertIs(get_icd_index(), csv_index)
+
+            build_index_file(self.path, index_path)
+            mapped = get_icd_index()
+            self.assertIsInstance(mapped, MappedICDCodeIndex)
+            self.assertEqual(mapped.search('diabetes mellitus'), csv_index.search('diabetes mellitus'))
@@ -0,0 +1,90 @@
+from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ..models import Patient, EventStore, PatientReadModel, AuditTrail, Vitals, parse_blood_pressure
+from ..vitals import backfill_blood_pressure
+import datetime
+
+
+class PatientSaveTests(TestCase):
+    def _create_patient(self):
+        return Patient.objects.create(
+            first_name="Test",
+            last_name="Patient",
+            date_of_birth=datetime.date(1990, 1, 1),
+            gender="M",
+            patient_number="TP001"
+        )
+
+    def test_create_writes_row_event_read_model_and_audit(self):
+        """Test registering a patient costs one statement per table"""
+        with CaptureQueriesContext(connection) as context:
+            patient = self._create_patient()
+
+        statements = [q['sql'] for q in context.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # Patient, position allocation, event, read-model upsert, audit. On
+        # PostgreSQL the allocation is three statements: the transaction id,
+        # the positions and the horizon
+        allocation = 3 if connection.vendor == 'postgresql' else 1
+        self.assertEqual(len(statements), 4 + allocation, statements)
+
+        read_model = PatientReadModel.objects.get(id=patient.id)
+        self.assertEqual(read_model.version, 1)
+        self.assertIsNotNone(read_model.current_data['created_at'])
+        self.assertEqual(AuditTrail.objects.filter(patient=patient).count(), 1)
+
+    def test_update_bumps_read_model_version(self):
+        """Test saving again upserts the read model and appends the next event"""
+        patient = self._create_patient()
+        patient.first_name = "Changed"
+        patient.save()
+
+        read_model = PatientReadModel.objects.get(id=patient.id)
+        self.assertEqual(read_model.version, 2)
+        self.assertEqual(read_model.current_data['first_name'], "Changed")
+        self.assertEqual(
+            list(EventStore.objects.filter(aggregate_id=patient.id).values_list('event_type', flat=True)
+                 .order_by('version')),
+            ['patient_created', 'patient_updated']
+        )
+
+
+class VitalsBloodPressureTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            first_name="Test", last_name="Patient", date_of_birth=datetime.date(1990, 1, 1),
+            gender="M", patient_number="TP001"
+        )
+
+    def _create_vitals(self, blood_pressure):
+        return Vitals.objects.create(patient=self.patient, date=datetime.date(2024, 3, 20),
+                                     blood_pressure=blood_pressure, temperature=36.8, spo2=98,
+                                     pulse=72, respirations=16, pain=0, source='Test')
+
+    def test_parse_blood_pressure(self):
+        """Test readings are split into integers and unreadable ones give None"""
+        self.assertEqual(parse_blood_pressure('120/80'), (120, 80))
+        self.assertEqual(parse_blood_pressure(' 120 / 80 '), (120, 80))
+        self.assertEqual(parse_blood_pressure('refused'), (None, None))
+        self.assertEqual(parse_blood_pressure('120/80/60'), (None, None))
+        self.assertEqual(parse_blood_pressure('-120/80'), (None, None))
+
+    def test_save_fills_columns(self):
+        """Test saving parses blood_pressure, also with update_fields"""
+        vitals = self._create_vitals('190/100')
+        self.assertEqual((vitals.systolic, vitals.diastolic), (190, 100))
+
+        vitals.blood_pressure = '118/76'
+        vitals.save(update_fields=['blood_pressure'])
+        self.assertEqual(Vitals.objects.filter(systolic=118, diastolic=76).count(), 1)
+
+    def test_backfill_fills_unparsed_rows(self):
+        """Test the backfill parses rows saved without the columns, in chunks"""
+        for blood_pressure in ('120/80', '130/85', '140/90', 'refused'):
+            self._create_vitals(blood_pressure)
+        Vitals.objects.update(systolic=None, diastolic=None)
+
+        self.assertEqual(backfill_blood_pressure(chunk_size=2), 3)
+        self.assertEqual(sorted(Vitals.objects.filter(systolic__gt=125).values_list('systolic', flat=True)),
+                         [130, 140])
+        self.assertEqual(Vitals.objects.filter(systolic__isnull=True).count(), 1)
@@ -0,0 +1,86 @@
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Patient
+from ..pagination import CursorPaginator, EstimatedCountPaginator, estimate_count
+import datetime
+import unittest
+
+
+class PatientListCountTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='clerk', password='testpass123')
+        self.client.login(username='clerk', password='testpass123')
+        for i in range(12):
+            Patient.objects.create(first_name=f'Pat{i}', last_name='Smith', patient_number=f'P{i:03d}',
+                                   date_of_birth=datetime.date(1980, 1, 1), gender='F')
+
+    def test_filtered_list_counts_once(self):
+        """Test a filtered patient list page runs a single COUNT query"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('patient_list'), {'search': 'smith', 'gender': 'F'})
+
+        self.assertEqual(response.status_code, 200)
+        counts = [q['sql'] for q in context.captured_queries if 'COUNT(' in q['sql'].upper()]
+        self.assertEqual(len(counts), 1, counts)
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertFalse(response.context['paginator'].count_is_estimate)
+
+    def test_empty_list_is_not_counted(self):
+        """Test the count is only run when the page shows it"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('patient_list'), {'search': 'nobody'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('COUNT(' in q['sql'].upper() for q in context.captured_queries))
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Row estimates need PostgreSQL')
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=0)
+    def test_estimate_replaces_count_above_threshold(self):
+        """Test the planner estimate is used without a COUNT once above the threshold"""
+        paginator = EstimatedCountPaginator(Patient.objects.filter(last_name='Smith'), 10)
+        with CaptureQueriesContext(connection) as context:
+            count = paginator.count
+
+        self.assertTrue(paginator.count_is_estimate)
+        self.assertEqual(count, estimate_count(Patient.objects.filter(last_name='Smith')))
+        self.assertFalse(any('COUNT(' in q['sql'].upper() for q in context.captured_queries))
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        # Two last names only, so most rows tie on the sort column
+        for i in range(7):
+            Patient.objects.create(first_name=f'Pat{i}', last_name='Smith' if i % 2 else 'Jones',
+                                   patient_number=f'C{i:03d}', date_of_birth=datetime.date(1980, 1, 1),
+                                   gender='F')
+        self.paginator = CursorPaginator(Patient.objects.order_by('last_name'), 3)
+        self.expected = list(Patient.objects.order_by('last_name', 'pk').values_list('pk', flat=True))
+
+    def test_pages_forward_and_back_over_ties(self):
+        """Test next and previous cursors walk every row once, in order"""
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+
+        self.assertEqual([p.pk for page in pages for p in page], self.expected)
+        self.assertEqual([page.start_index() for page in pages], [1, 4, 7])
+        self.assertFalse(pages[0].has_previous())
+
+        previous = self.paginator.page(pages[-1].previous_cursor)
+        self.assertEqual([p.pk for p in previous], [p.pk for p in pages[1]])
+        self.assertEqual(previous.number, 2)
+        self.assertTrue(previous.has_next())
+
+    def test_pages_without_offset(self):
+        """Test a later page is selected by keyset, not by OFFSET"""
+        cursor = self.paginator.page().next_cursor
+        with CaptureQueriesContext(connection) as context:
+            list(self.paginator.page(cursor))
+        self.assertFalse(any('OFFSET' in q['sql'].upper() for q in context.captured_queries))
+
+    def test_invalid_cursor_gives_first_page(self):
+        """Test get_page falls back to the first page for a bad token"""
+        self.assertEqual([p.pk for p in self.paginator.get_page('bogus')], self.expected[:3])
@@ -0,0 +1,184 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ..models import (
+    Patient, PatientReadModel, ClinicalReadModel, LabResultsReadModel, ProjectionOutbox, ProjectionCheckpoint
+)
+from ..event_sourcing.constants import *
+from ..event_sourcing.services import EventStoreService
+from ..event_sourcing.projections import ProjectionRunner
+from ..event_sourcing.rebuild import ProjectionRebuilder
+from io import StringIO
+from unittest.mock import patch
+import datetime
+
+
+@override_settings(EVENT_PROJECTION_MODE='async')
+class ProjectionRunnerTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            first_name="Test",
+            last_name="Patient",
+            date_of_birth=datetime.date(1990, 1, 1),
+            gender="M",
+            patient_number="TP001"
+        )
+        self.service = EventStoreService()
+        self.runner = ProjectionRunner(batch_size=2, gap_timeout=0)
+        # Outbox ids from earlier tests leave a gap below ours, settled as
+        # soon as every other transaction has finished
+        patcher = patch('patient_records.event_sourcing.projections.oldest_running_transaction',
+                        return_value=2 ** 62)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _record_vitals(self, count):
+        self.service.append_events(str(self.patient.id), [{
+            'aggregate_type': CLINICAL_AGGREGATE,
+            'event_type': VITALS_RECORDED,
+            'event_data': {'patient_id': str(self.patient.id), 'pulse': 70 + n}
+        } for n in range(count)])
+
+    def test_append_writes_outbox_instead_of_projecting(self):
+        """Test async mode defers read-model writes to the outbox"""
+        self._record_vitals(2)
+        self.assertEqual(ProjectionOutbox.objects.count(), 2)
+        self.assertFalse(ClinicalReadModel.objects.exists())
+
+    def test_runner_applies_batches_and_checkpoints(self):
+        """Test the runner applies bounded batches and advances checkpoints"""
+        self._record_vitals(3)
+
+        self.runner.run_once()
+        self.assertEqual(ClinicalReadModel.objects.count(), 2)
+
+        self.runner.run_once()
+        self.assertEqual(ClinicalReadModel.objects.count(), 3)
+
+        checkpoint = ProjectionCheckpoint.objects.get(name=CLINICAL_AGGREGATE)
+        self.assertGreater(checkpoint.position, 0)
+        # Pruned once every projection caught up
+        self.assertFalse(ProjectionOutbox.objects.exists())
+        self.assertEqual(self.runner.run_once(), 0)
+        self.assertEqual(ClinicalReadModel.objects.count(), 3)
+
+
+    def test_failing_event_is_skipped_after_max_attempts(self):
+        """Test an event that keeps failing is retried, then skipped without stalling the projection"""
+        self._record_vitals(3)
+        self.runner.max_attempts = 3
+        handler = self.runner.projections[CLINICAL_AGGREGATE]
+        original = handler.handlers[VITALS_RECORDED]
+
+        def fail_on_second(event_data, metadata=None):
+            if event_data['pulse'] == 71:
+                raise ValueError('Bad event')
+            return original(event_data, metadata)
+        handler.handlers[VITALS_RECORDED] = fail_on_second
+
+        # The first event is committed, the checkpoint stops short of the second
+        self.assertEqual(self.runner.process_batch(CLINICAL_AGGREGATE), 1)
+        self.assertEqual(self.runner.process_batch(CLINICAL_AGGREGATE), 0)
+        checkpoint = ProjectionCheckpoint.objects.get(name=CLINICAL_AGGREGATE)
+        self.assertEqual(checkpoint.attempts, 2)
+
+        with self.assertLogs('patient_records.event_sourcing.projections', level='ERROR') as logs:
+            self.assertEqual(self.runner.process_batch(CLINICAL_AGGREGATE), 2)
+        failed = ProjectionOutbox.objects.get(event__event_data__pulse=71).event
+        self.assertIn(str(failed.id), logs.output[0])
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.attempts, 0)
+        self.assertEqual(sorted(row.data['pulse'] for row in ClinicalReadModel.objects.all()), [70, 72])
+
+class RebuildProjectionsTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            first_name="Test",
+            last_name="Patient",
+            date_of_birth=datetime.date(1990, 1, 1),
+            gender="M",
+            patient_number="TP001"
+        )
+        EventStoreService().append_events(str(self.patient.id), [{
+            'aggregate_type': CLINICAL_AGGREGATE,
+            'event_type': VITALS_RECORDED,
+            'event_data': {'patient_id': str(self.patient.id), 'pulse': 70 + n}
+        } for n in range(3)])
+
+    def test_rebuild_replaces_read_models(self):
+        """Test the command rebuilds read models from the event store"""
+        ClinicalReadModel.objects.all().delete()
+        PatientReadModel.objects.filter(id=self.patient.id).update(current_data={})
+
+        out = StringIO()
+        call_command('rebuild_projections', workers=1, stdout=out)
+
+        self.assertEqual(ClinicalReadModel.objects.filter(patient_id=self.patient.id).count(), 3)
+        read_model = PatientReadModel.objects.get(id=self.patient.id)
+        self.assertEqual(read_model.current_data['patient_number'], 'TP001')
+        self.assertIn('Rebuilt 1 aggregates from 4 events', out.getvalue())
+
+    def test_rebuild_is_idempotent(self):
+        """Test rebuilding twice does not duplicate rows"""
+        call_command('rebuild_projections', workers=1, stdout=StringIO())
+        call_command('rebuild_projections', workers=1, stdout=StringIO())
+        self.assertEqual(ClinicalReadModel.objects.filter(patient_id=self.patient.id).count(), 3)
+
+    def test_rebuild_writes_each_read_model_in_bulk(self):
+        """Test a chunk is replayed in memory and written with one INSERT per read model"""
+        with CaptureQueriesContext(connection) as context:
+            ProjectionRebuilder().rebuild([str(self.patient.id)])
+
+        inserts = [q['sql'] for q in context.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len([sql for sql in inserts if ClinicalReadModel._meta.db_table in sql]), 1)
+        self.assertEqual(len([sql for sql in inserts if PatientReadModel._meta.db_table in sql]), 1)
+        self.assertFalse(any('FOR UPDATE' in q['sql'] for q in context.captured_queries))
+        self.assertEqual(ClinicalReadModel.objects.filter(patient_id=self.patient.id).count(), 3)
+
+    def test_rebuild_keeps_lab_result_ids(self):
+        """Test rebuilt lab results keep the ids the live projection gave them"""
+        service = EventStoreService()
+        service.append_event(str(self.patient.id), LAB_AGGREGATE, LAB_RESULT_RECORDED, {
+            'patient_id': str(self.patient.id), 'lab_type': 'CBC', 'results': {'wbc': 6.1}
+        })
+        result = LabResultsReadModel.objects.get(patient_id=self.patient.id)
+        service.append_event(str(self.patient.id), LAB_AGGREGATE, LAB_RESULT_UPDATED, {
+            'id': str(result.id), 'updates': {'wbc': 6.4}
+        })
+
+        call_command('rebuild_projections', workers=1, stdout=StringIO())
+
+        rebuilt = LabResultsReadModel.objects.get(patient_id=self.patient.id)
+        self.assertEqual(rebuilt.id, result.id)
+        self.assertEqual(rebuilt.results, {'wbc': 6.4})
+
+
+@override_settings(EVENT_PROJECTION_MODE='async')
+class ProjectionGapTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            first_name="Test", last_name="Patient", date_of_birth=datetime.date(1990, 1, 1),
+            gender="M", patient_number="TP001"
+        )
+        EventStoreService().append_events(str(self.patient.id), [{
+            'aggregate_type': CLINICAL_AGGREGATE,
+            'event_type': VITALS_RECORDED,
+            'event_data': {'patient_id': str(self.patient.id), 'pulse': 70 + n}
+        } for n in range(3)])
+        self.rows = list(ProjectionOutbox.objects.order_by('id'))
+        self.runner = ProjectionRunner(gap_timeout=0)
+
+    def test_gap_held_until_writers_finish(self):
+        """Test a gap is only passed once no transaction below the horizon is running"""
+        horizon = self.rows[-1].horizon
+        if horizon is None:
+            self.skipTest('Horizons are only recorded on PostgreSQL')
+        ids = [row.id for row in self.rows]
+        ProjectionOutbox.objects.filter(id=ids[-2]).delete()
+        rows = list(ProjectionOutbox.objects.order_by('id'))
+        start = ids[-3] - 1  # Checkpoint just before the first vitals event
+
+        self.assertEqual([row.id for row in self.runner._contiguous(rows[-2:], start, horizon - 1)], [ids[-3]])
+        self.assertEqual([row.id for row in self.runner._contiguous(rows[-2:], start, horizon)],
+                         [ids[-3], ids[-1]])
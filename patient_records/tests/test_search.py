@@ -0,0 +1,47 @@
+from django.test import TestCase
+from ..models import Patient
+from ..pagination import CursorPaginator
+from ..search import search_patients
+import datetime
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        for number, first, last in (('P001', 'Anna', 'Smith'), ('P002', 'Annabel', 'Jones'),
+                                    ('P003', 'John', 'Smithers'), ('P004', 'Mary', 'Brown')):
+            Patient.objects.create(first_name=first, last_name=last, patient_number=number,
+                                   date_of_birth=datetime.date(1980, 1, 1), gender='F')
+
+    def search(self, text):
+        return list(search_patients(Patient.objects.order_by('patient_number'), text)
+                    .values_list('patient_number', flat=True))
+
+    def test_matches_any_term_in_any_field(self):
+        """Test each term is matched as a substring of names and patient number"""
+        self.assertEqual(set(self.search('smith')), {'P001', 'P003'})
+        self.assertEqual(set(self.search('brown P002')), {'P002', 'P004'})
+        self.assertEqual(self.search('nobody'), [])
+
+    def test_closest_match_ranks_first(self):
+        """Test patients matching more terms, more exactly, come first"""
+        self.assertEqual(self.search('anna smith')[0], 'P001')
+        self.assertEqual(self.search('smith')[0], 'P001')
+
+    def test_blank_search_keeps_queryset(self):
+        """Test a search without terms neither filters nor reorders"""
+        self.assertEqual(self.search('  '), ['P001', 'P002', 'P003', 'P004'])
+
+    def test_cursor_pages_through_ranked_results(self):
+        """Test a ranked search pages forwards with every match once, ties included"""
+        for number in range(5, 11):
+            Patient.objects.create(first_name='Tied', last_name='Smith', patient_number=f'P{number:03d}',
+                                   date_of_birth=datetime.date(1980, 1, 1), gender='F')
+        results = search_patients(Patient.objects.order_by('patient_number'), 'smith')
+        paginator = CursorPaginator(results, 3)
+
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+
+        self.assertEqual([p.pk for page in pages for p in page], list(results.values_list('pk', flat=True)))
+        self.assertEqual(sum(len(page) for page in pages), 8)
@@ -37,6 +37,7 @@ urlpatterns = [
     path('api/patients/<uuid:patient_id>/latest-labs/', views.get_latest_labs, name='get_latest_labs'),
     path('api/patients/<uuid:patient_id>/latest-measurements/', views.get_latest_measurements, name='get_latest_measurements'),
     path('api/patients/<uuid:patient_id>/dashboard-metrics/', views.get_dashboard_metrics, name='get_dashboard_metrics'),
+    path('api/patients/<uuid:patient_id>/audit-history/', views.patient_audit_history, name='patient_audit_history'),
     
     # Tab data
     path('patient/<uuid:patient_id>/tab/<str:tab_name>/', views.patient_tab_data, name='patient_tab_data'),
@@ -10,7 +10,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView
 from django.contrib.auth import logout
 from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 import csv
 from pathlib import Path
 from django.views.decorators.http import require_GET
@@ -29,6 +29,7 @@ from django.core.serializers.json import DjangoJSONEncoder
 import json
 from django.db import transaction
 import decimal
+import uuid
 from django.db.models import Model, Q
 from typing import Optional, Dict, Any
 from django.views.decorators.http import require_http_methods
@@ -36,6 +37,17 @@ from .forms import VisitsForm, AdlsForm, ImagingForm, RecordRequestLogForm
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from .event_sourcing.event_store import EventStoreService
+from .event_sourcing.idempotency import claim_idempotency_key
+from .icd_index import get_icd_index
+from .search import search_patients
+from .pagination import CursorPaginator
+from .chart import load_patient_chart
+from .dashboard import dashboard_metrics, vitals_series, vitals_alerts
+from .cache import cache_patient_response
+from .audit import (
+    record_audit, iter_audit_history, encode_history_cursor, decode_history_cursor,
+    HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE
+)
 from .models import ClinicalReadModel
 
 # Initialize the logger for this module
@@ -52,6 +64,10 @@ class CustomLoginView(LoginView):
             return redirect('/home/')  # Use absolute URL
         return super().get(request, *args, **kwargs)
 
+def get_idempotency_key(request) -> Optional[str]:
+    """Client-supplied idempotency key from the Idempotency-Key header or form field"""
+    return request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key') or None
+
 def serialize_model_data(record_dict: Dict) -> Dict:
     """Helper function to serialize model data for JSON storage"""
     serialized = {}
@@ -72,51 +88,29 @@ def create_audit_trail(
     user: User,
     previous_values: Optional[Dict[str, Any]] = None,
     new_values: Optional[Dict[str, Any]] = None
-) -> AuditTrail:
+) -> Optional[AuditTrail]:
     """
-    Create an audit trail entry with enhanced logging
-    
+    Create an audit trail entry for changes the save signals don't cover
+
     # VICTORY_TAG_20231118: This function successfully handles:
     # - All data types including dates and decimals
     # - Patient vs non-patient records
     # - Full audit trail creation
     # - Proper error logging
     # DO NOT REMOVE - Critical implementation notes
+
+    Goes through the same pipeline as the signals: inside a request the
+    entry is coalesced with any other audit of the same record and written
+    with the rest of the request's entries.
     """
     try:
-        model_name = record.__class__.__name__.upper()
-        logger.info(f"Creating audit trail - Action: {action}, Model: {model_name}, Record ID: {record.id}")
-        
-        # Determine identifier
-        if hasattr(record, 'patient'):
-            identifier = f"{record.patient.patient_number} - {record.patient.first_name} {record.patient.last_name}"
-        elif isinstance(record, Patient):
-            identifier = f"{record.patient_number} - {record.first_name} {record.last_name}"
-        elif isinstance(record, Provider):
-            identifier = f"Provider: {record.provider}"
-        else:
-            identifier = "N/A"
-            
-        logger.debug(f"Audit identifier: {identifier}")
-
-        # Serialize the values before storage
-        previous_values = serialize_model_data(previous_values) if previous_values else {}
-        new_values = serialize_model_data(new_values) if new_values else {}
-
-        # Create audit trail
-        audit = AuditTrail.objects.create(
-            patient=None if isinstance(record, Patient) else getattr(record, 'patient', None),
-            patient_identifier=identifier,
+        return record_audit(
+            record,
             action=action,
-            record_type=model_name,
             user=user,
-            previous_values=previous_values,
-            new_values=new_values
+            previous_values=serialize_model_data(previous_values) if previous_values else None,
+            new_values=serialize_model_data(new_values) if new_values else None
         )
-        
-        logger.info(f"Successfully created audit trail entry: {audit.id}")
-        return audit
-        
     except Exception as e:
         logger.error(f"Error creating audit trail: {str(e)}", exc_info=True)
         raise
@@ -138,14 +132,10 @@ def add_patient(request):
         if form.is_valid():
             patient = form.save(commit=False)  # Don't save to DB yet
             patient.date = datetime.date.today()  # Set the date field
+            # Recorded by the log_patient_save audit signal inside Patient.save
+            patient.modified_by = request.user
             patient.save()  # Now save to DB
             
-            AuditTrail.objects.create(
-                patient=patient, 
-                action='CREATE', 
-                user=request.user
-            )
-            
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
                     'success': True,
@@ -179,113 +169,63 @@ def add_patient(request):
 @login_required
 def patient_list(request):
     """View list of all patients with advanced search capabilities"""
-    print("\n=== PATIENT LIST DEBUG ===")
-    print(f"Request GET params: {request.GET}")
-    
     search_form = PatientSearchForm(request.GET or None)
     patients = Patient.objects.all().order_by('-updated_at')  # Default sort
     
     if search_form.is_valid():
-        print(f"Form is valid")
         active_filters = search_form.get_active_filters()
-        print(f"Active filters: {active_filters}")
         
         # Basic search
         if 'search' in active_filters:
-            search = active_filters['search']
-            print(f"Applying search filter: {search}")
-            search_terms = search.split()
-            query = Q()
-            for term in search_terms:
-                term_query = (
-                    Q(first_name__icontains=term) |
-                    Q(middle_name__icontains=term) |
-                    Q(last_name__icontains=term) |
-                    Q(patient_number__icontains=term)
-                )
-                query |= term_query
-            patients = patients.filter(query)
-            print(f"After search filter - count: {patients.count()}")
+            patients = search_patients(patients, active_filters['search'])
 
         # Patient ID search
         if 'patient_id' in active_filters:
-            patient_id = active_filters['patient_id']
-            print(f"Applying patient ID filter: {patient_id}")
-            patients = patients.filter(patient_number__icontains=patient_id)
-            print(f"After patient ID filter - count: {patients.count()}")
+            patients = patients.filter(patient_number__icontains=active_filters['patient_id'])
 
         # Gender filter
         if 'gender' in active_filters:
-            gender = active_filters['gender']
-            print(f"Applying gender filter: {gender}")
-            patients = patients.filter(gender=gender)
-            print(f"After gender filter - count: {patients.count()}")
+            patients = patients.filter(gender=active_filters['gender'])
 
         # Date range filter
         if 'date_added_from' in active_filters:
             from_date = active_filters['date_added_from']
-            print(f"Applying date_added_from filter: {from_date}")
             from_datetime = timezone.make_aware(datetime.datetime.combine(from_date, datetime.time.min))
             patients = patients.filter(created_at__gte=from_datetime)
-            print(f"After date_added_from filter - count: {patients.count()}")
             
         if 'date_added_to' in active_filters:
             to_date = active_filters['date_added_to']
-            print(f"Applying date_added_to filter: {to_date}")
             to_datetime = timezone.make_aware(datetime.datetime.combine(to_date, datetime.time.max))
             patients = patients.filter(created_at__lte=to_datetime)
-            print(f"After date_added_to filter - count: {patients.count()}")
 
         # Age range filter
         today = timezone.now().date()
         
         if 'age_min' in active_filters:
-            age_min = active_filters['age_min']
-            print(f"Applying age_min filter: {age_min}")
-            max_birth_date = today - timezone.timedelta(days=age_min * 365)
+            max_birth_date = today - timezone.timedelta(days=active_filters['age_min'] * 365)
             patients = patients.filter(date_of_birth__lte=max_birth_date)
-            print(f"After age_min filter - count: {patients.count()}")
             
         if 'age_max' in active_filters:
-            age_max = active_filters['age_max']
-            print(f"Applying age_max filter: {age_max}")
-            min_birth_date = today - timezone.timedelta(days=age_max * 365)
+            min_birth_date = today - timezone.timedelta(days=active_filters['age_max'] * 365)
             patients = patients.filter(date_of_birth__gte=min_birth_date)
-            print(f"After age_max filter - count: {patients.count()}")
 
         # Sort handling
         if 'sort_by' in active_filters:
-            sort_by = active_filters['sort_by']
-            print(f"Applying sort: {sort_by}")
-            patients = patients.order_by(sort_by)
+            patients = patients.order_by(active_filters['sort_by'])
     else:
-        print(f"Form validation errors: {search_form.errors}")
+        logger.debug(f"Patient search form errors: {search_form.errors}")
 
-    print(f"Final query: {patients.query}")
-    print(f"Final count: {patients.count()}")
-
-    # Pagination
-    paginator = Paginator(patients, 10)  # Show 10 patients per page
-    page = request.GET.get('page', 1)
-    
-    try:
-        page_obj = paginator.page(page)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            page_obj = paginator.page(paginator.num_pages)
-        else:
-            page_obj = paginator.page(1)
+    # Keyset pagination: one data query, plus one count (or planner estimate)
+    # only if the template shows paginator.count
+    paginator = CursorPaginator(patients, 10)  # Show 10 patients per page
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     context = {
         'search_form': search_form,
         'patients': page_obj,
-        'total_patients': paginator.count,
         'page_obj': page_obj,
         'paginator': paginator,
         'breadcrumbs': [{'label': 'Patients', 'url': None}],
-        'is_paginated': paginator.num_pages > 1
     }
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -297,91 +237,17 @@ def patient_list(request):
 @login_required
 def patient_detail(request, patient_id):
     try:
-        # Get patient with all fields
-        patient = Patient.objects.get(id=patient_id)
-        print("\n=== PATIENT DATA ===")
-        print(f"Patient ID: {patient.id}")
-        print(f"Name: {patient.first_name} {patient.last_name}")
-        print(f"DOB: {patient.date_of_birth}")
-        print(f"Gender: {patient.gender}")
-        print(f"Patient Number: {patient.patient_number}")
-        
-        # Get latest vitals
-        latest_vitals = Vitals.objects.filter(
-            patient=patient
-        ).order_by('-date').first()
-        print("\n=== LATEST VITALS ===")
-        if latest_vitals:
-            print(f"Vitals ID: {latest_vitals.id}")
-            print(f"Date: {latest_vitals.date}")
-            print(f"BP: {latest_vitals.blood_pressure}")
-            print(f"Pulse: {latest_vitals.pulse}")
-            print(f"Temp: {latest_vitals.temperature}")
-            print(f"SPO2: {latest_vitals.spo2}")
-        else:
-            print("No vitals found")
-
-        # Get diagnoses
-        active_diagnoses = Diagnosis.objects.filter(
-            patient=patient
-        ).order_by('-date')
-        print("\n=== ACTIVE DIAGNOSES ===")
-        print(f"Count: {active_diagnoses.count()}")
-        if active_diagnoses.exists():
-            first_dx = active_diagnoses.first()
-            print(f"First Diagnosis: {first_dx.diagnosis}")
-            print(f"ICD Code: {first_dx.icd_code}")
-            print(f"Date: {first_dx.date}")
-
-        # Get current medications
-        current_medications = Medications.objects.filter(
-            patient=patient
-        ).filter(
-            Q(dc_date__isnull=True) | Q(dc_date__gt=datetime.date.today())
-        ).order_by('-date_prescribed')
-        print("\n=== CURRENT MEDICATIONS ===")
-        print(f"Count: {current_medications.count()}")
-        if current_medications.exists():
-            first_med = current_medications.first()
-            print(f"First Med: {first_med.drug}")
-            print(f"Dose: {first_med.dose}")
-            print(f"Route: {first_med.route}")
-            print(f"Frequency: {first_med.frequency}")
-
-        # Get recent activities
-        recent_activities = AuditTrail.objects.filter(
-            patient=patient
-        ).order_by('-timestamp')[:5]
-        print("\n=== RECENT ACTIVITIES ===")
-        print(f"Count: {len(list(recent_activities))}")
-        if recent_activities.exists():
-            first_activity = recent_activities.first()
-            print(f"First Activity: {first_activity.action} {first_activity.record_type}")
-            print(f"Timestamp: {first_activity.timestamp}")
-        
-        # Create context with all required data
+        chart = load_patient_chart(patient_id)
+        patient = chart.patient
         context = {
-            'patient': patient,
-            'latest_vitals': latest_vitals,
-            'active_diagnoses': active_diagnoses,
-            'current_medications': current_medications,
-            'recent_activities': recent_activities,
+            **chart.as_context(),
             'breadcrumbs': [
                 {'label': 'Patients', 'url': reverse('patient_list')},
                 {'label': f"{patient.first_name} {patient.last_name}", 'url': None}
             ],
             'note_categories': PatientNote.NOTE_CATEGORIES,
-            'notes': PatientNote.objects.filter(patient=patient).order_by('-is_pinned', '-created_at')
         }
 
-        # Print final context data
-        print("\n=== CONTEXT VERIFICATION ===")
-        print(f"Patient in context: {bool(context['patient'])}")
-        print(f"Latest vitals in context: {bool(context['latest_vitals'])}")
-        print(f"Active diagnoses in context: {bool(context['active_diagnoses'])}")
-        print(f"Current medications in context: {bool(context['current_medications'])}")
-        print(f"Recent activities in context: {bool(context['recent_activities'])}")
-
         # Handle AJAX tab loading
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             tab = request.GET.get('tab', 'overview')
@@ -394,7 +260,7 @@ def patient_detail(request, patient_id):
         messages.error(request, 'Patient not found')
         return redirect('patient_list')
     except Exception as e:
-        print(f"Error in patient_detail view: {str(e)}")
+        logger.error(f"Error in patient_detail view: {str(e)}", exc_info=True)
         messages.error(request, 'An error occurred while loading patient details')
         return redirect('patient_list')
 
@@ -408,28 +274,36 @@ def add_diagnosis(request, patient_id):
         form = DiagnosisForm(request.POST)
         if form.is_valid():
             logger.debug(f'Diagnosis form is valid. Data: {form.cleaned_data}')
-            diagnosis = form.save(commit=False)
-            diagnosis.patient = patient
-            diagnosis.save()
-            
-            # Create event store entry
-            event_store = EventStoreService()
-            event_data = {
-                'patient_id': patient_id,
-                'diagnosis_id': str(diagnosis.id),
-                'date': diagnosis.date.isoformat(),
-                'icd_code': diagnosis.icd_code,
-                'diagnosis': diagnosis.diagnosis,
-                'notes': diagnosis.notes,
-                'source': diagnosis.source
-            }
-            event_store.append_event(
-                aggregate_id=str(patient_id),
-                aggregate_type=CLINICAL_AGGREGATE,
-                event_type=DIAGNOSIS_ADDED,
-                event_data=event_data
-            )
-            
+            with transaction.atomic():
+                # A resubmitted form returns the original result without saving again
+                claim, created = claim_idempotency_key(
+                    f'add_diagnosis:{request.user.pk}', get_idempotency_key(request)
+                )
+                if created:
+                    diagnosis = form.save(commit=False)
+                    diagnosis.patient = patient
+                    diagnosis.save()
+
+                    # Create event store entry
+                    event_store = EventStoreService()
+                    event_data = {
+                        'patient_id': str(patient_id),
+                        'diagnosis_id': str(diagnosis.id),
+                        'date': diagnosis.date.isoformat(),
+                        'icd_code': diagnosis.icd_code,
+                        'diagnosis': diagnosis.diagnosis,
+                        'notes': diagnosis.notes,
+                        'source': diagnosis.source
+                    }
+                    event_store.append_event(
+                        aggregate_id=str(patient_id),
+                        aggregate_type=CLINICAL_AGGREGATE,
+                        event_type=DIAGNOSIS_ADDED,
+                        event_data=event_data
+                    )
+                    if claim is not None:
+                        claim.complete({'diagnosis_id': str(diagnosis.id)})
+
             messages.success(request, 'Diagnosis added successfully!')
             return redirect('patient_detail', patient_id=patient_id)
         else:
@@ -441,6 +315,7 @@ def add_diagnosis(request, patient_id):
     context = {
         'form': form,
         'patient': patient,
+        'idempotency_key': get_idempotency_key(request) or uuid.uuid4(),
         'breadcrumbs': [
             {'label': 'Patients', 'url': reverse('patient_list')},
             {'label': f'Patient {patient.id}', 'url': reverse('patient_detail', args=[patient.id])},
@@ -463,32 +338,40 @@ def vital_signs_form(request, patient_id):
         form = VitalsForm(request.POST)
         if form.is_valid():
             logger.debug(f'Vitals form is valid. Data: {form.cleaned_data}')
-            vitals = form.save(commit=False)
-            vitals.patient = patient
-            vitals.save()
-            
-            # Create event store entry
-            event_store = EventStoreService()
-            event_data = {
-                'patient_id': patient_id,
-                'vitals_id': str(vitals.id),
-                'date': vitals.date.isoformat(),
-                'blood_pressure': vitals.blood_pressure,
-                'temperature': vitals.temperature,
-                'spo2': vitals.spo2,
-                'pulse': vitals.pulse,
-                'respirations': vitals.respirations,
-                'supp_o2': vitals.supp_o2,
-                'pain': vitals.pain,
-                'source': vitals.source
-            }
-            event_store.append_event(
-                aggregate_id=str(patient.id),
-                aggregate_type=CLINICAL_AGGREGATE,
-                event_type=VITALS_RECORDED,
-                event_data=event_data
-            )
-            
+            with transaction.atomic():
+                # A resubmitted form returns the original result without saving again
+                claim, created = claim_idempotency_key(
+                    f'vital_signs_form:{request.user.pk}', get_idempotency_key(request)
+                )
+                if created:
+                    vitals = form.save(commit=False)
+                    vitals.patient = patient
+                    vitals.save()
+
+                    # Create event store entry
+                    event_store = EventStoreService()
+                    event_data = {
+                        'patient_id': str(patient_id),
+                        'vitals_id': str(vitals.id),
+                        'date': vitals.date.isoformat(),
+                        'blood_pressure': vitals.blood_pressure,
+                        'temperature': vitals.temperature,
+                        'spo2': vitals.spo2,
+                        'pulse': vitals.pulse,
+                        'respirations': vitals.respirations,
+                        'supp_o2': vitals.supp_o2,
+                        'pain': vitals.pain,
+                        'source': vitals.source
+                    }
+                    event_store.append_event(
+                        aggregate_id=str(patient.id),
+                        aggregate_type=CLINICAL_AGGREGATE,
+                        event_type=VITALS_RECORDED,
+                        event_data=event_data
+                    )
+                    if claim is not None:
+                        claim.complete({'vitals_id': str(vitals.id)})
+
             messages.success(request, 'Vital signs recorded successfully!')
             return redirect('patient_detail', patient_id=patient_id)
         else:
@@ -500,6 +383,7 @@ def vital_signs_form(request, patient_id):
     context = {
         'form': form,
         'patient': patient,
+        'idempotency_key': get_idempotency_key(request) or uuid.uuid4(),
         'form_title': 'Record Vital Signs',
         'submit_label': 'Save Vital Signs',
         'cancel_url': reverse('patient_detail', args=[patient_id])
@@ -517,14 +401,7 @@ def add_cmp_labs(request, patient_id):
         if form.is_valid():
             lab = form.save(commit=False)
             lab.patient = patient
-            lab.save()
-            
-            create_audit_trail(
-                record=lab,
-                action='CREATE',
-                user=request.user,
-                new_values=model_to_dict(lab)
-            )
+            lab.save()  # Audited by the post_save signal
             
             messages.success(request, 'CMP Lab results added successfully!')
             return redirect('patient_detail', patient_id=patient.id)
@@ -553,14 +430,7 @@ def add_cbc_labs(request, patient_id):
         if form.is_valid():
             lab = form.save(commit=False)
             lab.patient = patient
-            lab.save()
-            
-            create_audit_trail(
-                record=lab,
-                action='CREATE',
-                user=request.user,
-                new_values=model_to_dict(lab)
-            )
+            lab.save()  # Audited by the post_save signal
             
             messages.success(request, 'CBC Lab results added successfully!')
             return redirect('patient_detail', patient_id=patient.id)
@@ -902,31 +772,19 @@ def your_form_view(request):
 
 @require_GET
 def icd_code_lookup(request):
-    query = request.GET.get('q', '').strip().upper()
+    query = request.GET.get('q', '').strip()
     if not query:
         return JsonResponse({'results': []})
     
     try:
-        # Get the path to the codes.csv file
-        csv_path = Path(__file__).parent / 'data' / 'codes.csv'
-        
-        results = []
-        with open(csv_path, 'r', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header row if present
-            
-            for row in csv_reader:
-                code = row[0]
-                diagnosis = row[4]  # Using the 5th column (index 4) for diagnosis
-                if code.startswith(query):
-                    results.append({
-                        'code': code,
-                        'description': diagnosis,  # Changed from row[1] to diagnosis
-                        'value': f'{code} - {diagnosis}'  # Updated to use diagnosis
-                    })
+        results = [{
+            'code': code,
+            'description': diagnosis,
+            'value': f'{code} - {diagnosis}'
+        } for code, diagnosis in get_icd_index().search(query, limit=5)]
         
         return JsonResponse({
-            'results': results[:5]  # Still limit to 5 results for performance
+            'results': results
         })
     except Exception as e:
         logger.error(f"Error in ICD lookup: {str(e)}")
@@ -941,7 +799,7 @@ def is_admin(user):
 def patient_tab_data(request, patient_id, tab_name):
     try:
         patient = get_object_or_404(Patient, id=patient_id)
-        page = request.GET.get('page', 1)
+        cursor = request.GET.get('cursor')
         items_per_page = 10
         today = datetime.date.today()
         
@@ -1001,22 +859,18 @@ def patient_tab_data(request, patient_id, tab_name):
             context.update(tab_info['context'])
         
         if tab_info['queryset'] is not None:
-            paginator = Paginator(tab_info['queryset'], items_per_page)
-            try:
-                page_obj = paginator.get_page(page)
-                context_name = tab_info.get('context_name', 'records')
-                context[context_name] = page_obj
-                context['has_records'] = page_obj.paginator.count > 0
-            except (PageNotAnInteger, EmptyPage) as e:
-                logger.error(f"Pagination error: {str(e)}")
-                return JsonResponse({'error': str(e)}, status=400)
+            paginator = CursorPaginator(tab_info['queryset'], items_per_page)
+            page_obj = paginator.get_page(cursor)
+            context_name = tab_info.get('context_name', 'records')
+            context[context_name] = page_obj
+            context['has_records'] = bool(page_obj)
                 
         # Add default values for empty fields
         context['default_provider'] = {'name': 'Not Specified', 'practice': 'Not Available'}
         context['default_symptom'] = {'description': 'No symptoms recorded', 'severity': 'N/A'}
         
         html = render_to_string(tab_info['template'], context, request=request)
-        return JsonResponse({'html': html})
+        return JsonResponse({'html': html, 'success': True})
 
     except Exception as e:
         logger.error(f"Error loading tab data: {str(e)}")
@@ -1046,14 +900,53 @@ def medications_api(request, patient_id):
 
 def patient_history(request, patient_id):
     patient = get_object_or_404(Patient, id=patient_id)
-    # Get all audit trails for this patient, ordered by most recent
-    audit_trails = AuditTrail.objects.filter(patient=patient).order_by('-timestamp')
+    # First page only, later pages come from patient_audit_history
+    audit_trails = list(iter_audit_history(patient.id))
+    next_cursor = encode_history_cursor(audit_trails[-1]) if len(audit_trails) == HISTORY_PAGE_SIZE else None
     
     return render(request, 'patient_records/patient_history.html', {
         'patient': patient,
-        'audit_trails': audit_trails
+        'audit_trails': audit_trails,
+        'next_cursor': next_cursor
     })
 
+@login_required
+def patient_audit_history(request, patient_id):
+    """
+    API endpoint for a patient's audit history, newest first
+
+    Pass the returned next_cursor back as ?cursor= for the following page,
+    it is null on the last page. Rows are written out as they are read.
+    """
+    patient = get_object_or_404(Patient, id=patient_id)
+    try:
+        limit = min(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), MAX_HISTORY_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        cursor = request.GET.get('cursor')
+        after = decode_history_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    def stream():
+        yield '{"success": true, "results": ['
+        last, count = None, 0
+        for entry in iter_audit_history(patient.id, after, limit):
+            yield (',' if count else '') + json.dumps({
+                'id': entry.id,
+                'timestamp': entry.timestamp.isoformat(),
+                'action': entry.action,
+                'record_type': entry.record_type,
+                'user': entry.user.username if entry.user else None,
+                'previous_values': entry.previous_values,
+                'new_values': entry.new_values
+            }, cls=DjangoJSONEncoder)
+            last, count = entry, count + 1
+        next_cursor = encode_history_cursor(last) if count == limit else None
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
 @require_http_methods(["GET", "POST"])
 def add_visit(request, patient_id):
     patient = get_object_or_404(Patient, id=patient_id)
@@ -1195,31 +1088,43 @@ def create_note(request):
             form = PatientNoteForm(post_data, request.FILES)
             
             if form.is_valid():
-                note = form.save(commit=False)
-                note.patient = patient
-                note.created_by = request.user
-                note.save()
-                
-                # Save tags
-                if 'tags' in form.cleaned_data:
-                    tags = form.cleaned_data['tags']
-                    if isinstance(tags, str):
-                        # Split by comma and strip whitespace
-                        tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
-                    for tag_name in tags:
-                        tag, _ = NoteTag.objects.get_or_create(name=tag_name)
-                        note.tags.add(tag)
-                
-                # Handle file attachments
-                files = request.FILES.getlist('attachments')
-                for file in files:
-                    NoteAttachment.objects.create(note=note, file=file)
-
-                return JsonResponse({
-                    'success': True,
-                    'noteId': note.id,
-                    'message': 'Note created successfully'
-                })
+                with transaction.atomic():
+                    # A retried request returns the original response without creating another note
+                    claim, created = claim_idempotency_key(
+                        f'create_note:{request.user.pk}', get_idempotency_key(request)
+                    )
+                    if not created:
+                        return JsonResponse(claim.result)
+
+                    note = form.save(commit=False)
+                    note.patient = patient
+                    note.created_by = request.user
+                    note.save()
+
+                    # Save tags
+                    if 'tags' in form.cleaned_data:
+                        tags = form.cleaned_data['tags']
+                        if isinstance(tags, str):
+                            # Split by comma and strip whitespace
+                            tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+                        for tag_name in tags:
+                            tag, _ = NoteTag.objects.get_or_create(name=tag_name)
+                            note.tags.add(tag)
+
+                    # Handle file attachments
+                    files = request.FILES.getlist('attachments')
+                    for file in files:
+                        NoteAttachment.objects.create(note=note, file=file)
+
+                    result = {
+                        'success': True,
+                        'noteId': note.id,
+                        'message': 'Note created successfully'
+                    }
+                    if claim is not None:
+                        claim.complete(result)
+
+                return JsonResponse(result)
             else:
                 print("Form validation errors:", form.errors)  # Debug print
                 return JsonResponse({
@@ -1399,64 +1304,24 @@ def dashboard_data(request):
         start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d').date()
         end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        # Get metrics
-        metrics = {
-            'total_visits': Visits.objects.filter(date__range=[start_date, end_date]).count(),
-            'active_medications': Medications.objects.filter(
-                Q(dc_date__isnull=True) | Q(dc_date__gt=timezone.now())
-            ).count(),
-            'recent_labs': CmpLabs.objects.filter(date__range=[start_date, end_date]).count(),
-            'pending_tasks': RecordRequestLog.objects.filter(
-                status='pending',
-                date__range=[start_date, end_date]
-            ).count()
-        }
-        
-        # Get vitals data
-        vitals = Vitals.objects.filter(date__range=[start_date, end_date]).order_by('date')
-        vitals_data = {
-            'dates': [v.date.isoformat() for v in vitals],
-            'systolic': [v.systolic for v in vitals],
-            'diastolic': [v.diastolic for v in vitals],
-            'heartRate': [v.pulse for v in vitals]
-        }
+        metrics = dashboard_metrics(start_date, end_date)
+        vitals_data = vitals_series(start_date, end_date)
         
         # Get recent activities
         activities = AuditTrail.objects.filter(
             timestamp__date__range=[start_date, end_date]
-        ).order_by('-timestamp')[:10]
+        ).order_by('-timestamp', '-id')[:10]
         activities_data = [{
             'timestamp': activity.timestamp.isoformat(),
             'action': activity.action,
             'description': f"{activity.record_type} - {activity.patient_identifier}"
         } for activity in activities]
         
-        # Generate alerts
-        alerts = []
-        
-        # Check for abnormal vitals
-        recent_vitals = Vitals.objects.filter(date__range=[start_date, end_date])
-        for vital in recent_vitals:
-            if vital.systolic > 180 or vital.diastolic > 110:
-                alerts.append({
-                    'severity': 'high',
-                    'message': f'High blood pressure reading: {vital.blood_pressure} on {vital.date}'
-                })
-            elif vital.temperature > 38.3:  # >101°F
-                alerts.append({
-                    'severity': 'high',
-                    'message': f'High temperature: {vital.temperature}°C on {vital.date}'
-                })
-        
-        # Check for pending record requests
-        pending_requests = RecordRequestLog.objects.filter(
-            status='pending',
-            date__range=[start_date, end_date]
-        )
-        if pending_requests.exists():
+        alerts = list(vitals_alerts(start_date, end_date))
+        if metrics['pending_tasks']:
             alerts.append({
                 'severity': 'medium',
-                'message': f'{pending_requests.count()} pending record requests'
+                'message': f"{metrics['pending_tasks']} pending record requests"
             })
         
         return JsonResponse({
@@ -1472,6 +1337,7 @@ def dashboard_data(request):
         }, status=400)
 
 @login_required
+@cache_patient_response('latest_vitals')
 def get_latest_vitals(request, patient_id):
     """API endpoint for latest vitals data"""
     try:
@@ -1513,6 +1379,7 @@ def get_latest_vitals(request, patient_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
+@cache_patient_response('latest_labs')
 def get_latest_labs(request, patient_id):
     """API endpoint for latest labs data"""
     try:
@@ -1534,6 +1401,7 @@ def get_latest_labs(request, patient_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
+@cache_patient_response('latest_measurements')
 def get_latest_measurements(request, patient_id):
     """API endpoint for latest measurements data"""
     try:
@@ -1563,6 +1431,7 @@ def get_latest_measurements(request, patient_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
+@cache_patient_response('dashboard_metrics')
 def get_dashboard_metrics(request, patient_id):
     """API endpoint for dashboard metrics"""
     try:
@@ -1633,24 +1502,19 @@ def get_dashboard_metrics(request, patient_id):
                 latest_values['bmi'] = round(weight_kg / (height_m * height_m), 1)
         
         # Get vitals data for chart
-        vitals_data = []
-        for vital in vitals_query.order_by('date'):
-            try:
-                systolic, diastolic = map(int, vital.blood_pressure.split('/'))
-                vitals_data.append({
-                    'date': vital.date.isoformat(),
-                    'systolic': systolic,
-                    'diastolic': diastolic,
-                    'heart_rate': vital.pulse
-                })
-            except (ValueError, AttributeError) as e:
-                logger.error(f"Error parsing vital signs: {str(e)}")
-                continue
+        vitals_data = [{
+            'date': date.isoformat(),
+            'systolic': systolic,
+            'diastolic': diastolic,
+            'heart_rate': pulse
+        } for date, systolic, diastolic, pulse in vitals_query.filter(
+            systolic__isnull=False
+        ).order_by('date').values_list('date', 'systolic', 'diastolic', 'pulse')]
         
         # Get recent activities
         activities = AuditTrail.objects.filter(
             patient=patient
-        ).order_by('-timestamp')[:10]
+        ).order_by('-timestamp', '-id')[:10]
         
         activities_data = [{
             'timestamp': activity.timestamp.isoformat(),
@@ -1664,9 +1528,11 @@ def get_dashboard_metrics(request, patient_id):
         # Check for abnormal vitals
         if latest_vitals:
             try:
-                systolic, diastolic = map(int, latest_vitals.blood_pressure.split('/'))
+                systolic, diastolic = latest_vitals.systolic, latest_vitals.diastolic
                 
-                if systolic > 180 or diastolic > 110:
+                if systolic is None:
+                    logger.warning(f"Unreadable blood pressure on vitals {latest_vitals.id}")
+                elif systolic > 180 or diastolic > 110:
                     alerts.append({
                         'severity': 'high',
                         'message': f'High blood pressure: {latest_vitals.blood_pressure}'
@@ -0,0 +1,34 @@
+from .models import Vitals, parse_blood_pressure
+import logging
+
+logger = logging.getLogger('patient_records')
+
+
+def backfill_blood_pressure(chunk_size: int = 1000) -> int:
+    """
+    Fill systolic and diastolic on Vitals rows saved before they existed
+
+    Rows are walked in primary key order, chunk_size at a time, and each
+    chunk is written with one bulk_update in its own transaction. Readings
+    that cannot be parsed stay NULL. Returns the number of rows updated.
+    """
+    updated = 0
+    last_pk = None
+    while True:
+        pending = Vitals.objects.filter(systolic__isnull=True)
+        if last_pk is not None:
+            pending = pending.filter(pk__gt=last_pk)
+        rows = list(pending.order_by('pk').values_list('pk', 'blood_pressure')[:chunk_size])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+
+        parsed = []
+        for pk, blood_pressure in rows:
+            systolic, diastolic = parse_blood_pressure(blood_pressure)
+            if systolic is not None:
+                parsed.append(Vitals(pk=pk, systolic=systolic, diastolic=diastolic))
+        Vitals.objects.bulk_update(parsed, ['systolic', 'diastolic'])
+        updated += len(parsed)
+        logger.info(f"Backfilled blood pressure on {updated} vitals")
+    return updated